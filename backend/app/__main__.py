@@ -0,0 +1,73 @@
+"""
+Production server, uvicorn workers with uvloop and httptools behind app.core.supervisor:
+    
+    python -m app [--workers 4] [--host 0.0.0.0] [--port 8000]
+    python -m app --profile-startup
+    python -m app --rebuild-stats <tenant> [--rebuild-stats <tenant> ...]
+
+kill -HUP <pid> reloads the code without dropping requests, kill -TERM <pid> drains and stops.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from app.core import config
+from app.core.supervisor import Supervisor, worker_config
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m app", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS, help="0 for one per CPU core")
+    parser.add_argument("--graceful-timeout", type=int, default=config.SERVER_GRACEFUL_TIMEOUT,
+                        help="seconds a stopping worker gets to finish its requests")
+    parser.add_argument("--access-log", action="store_true", default=config.SERVER_ACCESS_LOG)
+    parser.add_argument("--log-level", default="info", choices=["critical", "error", "warning", "info", "debug"])
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print where startup time goes, from imports to the first MongoDB ping, and exit")
+    parser.add_argument("--rebuild-stats", metavar="TENANT", action="append",
+                        help="recount the task stats of a tenant and exit, pause writes to its tasks meanwhile")
+    args = parser.parse_args()
+    
+    if args.profile_startup:
+        from app.core.profiling import profile_startup
+        print(profile_startup())
+        return 0
+    if args.rebuild_stats:
+        # recounting reads every task of the tenant, which is why requests cannot trigger it
+        from app.db.tasks import rebuild_task_stats
+        for tenant, total in asyncio.run(rebuild_task_stats(args.rebuild_stats)).items():
+            print(f"{tenant}: {total} tasks")
+        return 0
+    
+    uvicorn_config = worker_config(
+        host=args.host,
+        port=args.port,
+        graceful_timeout=args.graceful_timeout,
+        access_log=args.access_log,
+        log_level=args.log_level,
+    )
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and config.TASK_CACHE_BACKEND == "local":
+        # a write only invalidates the cache of the worker serving it, the others would keep serving the old task
+        logger.warning(
+            "TASK_CACHE_BACKEND=local is not shared between %s workers, they run without a task cache", workers,
+        )
+        # workers are spawned and read their settings anew, the environment comes before .env
+        os.environ["TASK_CACHE_BACKEND"] = "none"
+    supervisor = Supervisor(
+        uvicorn_config,
+        workers=workers,
+        graceful_timeout=args.graceful_timeout,
+    )
+    return supervisor.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
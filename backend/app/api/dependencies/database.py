@@ -1,18 +1,21 @@
 from typing import Callable, Type
-from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from fastapi import Depends
 from starlette.requests import Request
 
+from app.api.dependencies.tenants import get_tenant
 from app.db.repositories.base import BaseRepository
+from app.db.storage import Database
 
 
-def get_database(request: Request) -> AsyncIOMotorDatabase:
+def get_database(request: Request) -> Database:
     return request.app.database
 
 
 def get_repository(Repo_type: Type[BaseRepository]) -> Callable:
-    def get_repo(db: AsyncIOMotorDatabase = Depends(get_database)) -> Type[BaseRepository]:
-        return Repo_type(db)
+    def get_repo(
+            request: Request, db: Database = Depends(get_database), tenant: str = Depends(get_tenant)
+    ) -> Type[BaseRepository]:
+        return Repo_type(db, app=request.app, tenant=tenant)
     
     return get_repo
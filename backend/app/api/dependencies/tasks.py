@@ -1,16 +1,25 @@
-from fastapi import Path, Depends, HTTPException, Body
-from starlette.status import HTTP_404_NOT_FOUND, HTTP_403_FORBIDDEN
+from typing import FrozenSet, Optional
+
+from fastapi import Path, Depends, HTTPException, Body, Query
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_403_FORBIDDEN, HTTP_422_UNPROCESSABLE_ENTITY
 
 from app.api.dependencies.database import get_repository
 from app.db.repositories.tasks import TaskRepository
-from app.models.task import TaskPublic, TaskUpdate
+from app.models.task import PartialTask, TaskPublic, TaskUpdate
+
+# task fields by name and by the key they are rendered with, so both id and _id select the id
+TASK_FIELD_NAMES = {
+    **{name: name for name in PartialTask.model_fields},
+    **{field.alias: name for name, field in PartialTask.model_fields.items() if field.alias},
+}
 
 
 async def get_task_by_id_from_path(
         task_id: str = Path(...),
+        include_archived: bool = Query(False, description="Also look for the task in the archive"),
         task_repo: TaskRepository = Depends(get_repository(TaskRepository)),
 ) -> TaskPublic:
-    task = await task_repo.get_task_by_id(id=task_id)
+    task = await task_repo.get_task_by_id(id=task_id, include_archived=include_archived)
     
     if not task:
         raise HTTPException(
@@ -18,3 +27,22 @@ async def get_task_by_id_from_path(
         )
     
     return task
+
+
+def get_task_fields(
+        fields: Optional[str] = Query(
+            None, description="Comma-separated task fields to return, e.g. id,status,updated, all fields if not given",
+        ),
+) -> Optional[FrozenSet[str]]:
+    if fields is None:
+        return None
+    
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    if unknown := [name for name in names if name not in TASK_FIELD_NAMES]:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Unknown task fields: {', '.join(unknown)}",
+        )
+    if not names:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail="No task fields given")
+    
+    return frozenset(TASK_FIELD_NAMES[name] for name in names)
@@ -0,0 +1,28 @@
+from typing import Optional
+
+from fastapi import Header, HTTPException
+from starlette.status import HTTP_401_UNAUTHORIZED
+
+from app.core.config import DEFAULT_TENANT
+from app.core.security import verify_tenant_token
+
+
+def get_tenant(
+        authorization: Optional[str] = Header(None, description="Bearer token of the tenant whose tasks to use"),
+) -> str:
+    if authorization is None:
+        if not DEFAULT_TENANT:
+            raise HTTPException(
+                status_code=HTTP_401_UNAUTHORIZED,
+                detail="Missing bearer token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return DEFAULT_TENANT
+    
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or (tenant := verify_tenant_token(token.strip())) is None:
+        raise HTTPException(
+            status_code=HTTP_401_UNAUTHORIZED, detail="Invalid bearer token", headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return tenant
@@ -0,0 +1,58 @@
+import hashlib
+from datetime import datetime
+from typing import List, Optional
+
+from app.models.task import TaskPage, TaskPublic
+
+UPDATED_FORMAT = "%Y%m%dT%H%M%S%f"
+
+
+def task_etag(task: TaskPublic) -> str:
+    """
+    Strong validator of a single task, a task changes version whenever its updated timestamp does
+    """
+    return f'"{task.id}.{task.updated.strftime(UPDATED_FORMAT)}"'
+
+
+def page_etag(page: TaskPage) -> str:
+    """
+    Strong validator of a page of tasks, built from the version of every task on it
+    """
+    digest = hashlib.sha1()
+    for task in page.tasks:
+        digest.update(task_etag(task).encode())
+    digest.update((page.next_cursor or "").encode())
+    
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_etags(header: str) -> List[str]:
+    return [etag.strip() for etag in header.split(",") if etag.strip()]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    If-None-Match uses weak comparison, so W/ prefixes are ignored
+    """
+    if if_none_match is None:
+        return False
+    
+    etags = parse_etags(if_none_match)
+    return "*" in etags or etag in [e.removeprefix("W/") for e in etags]
+
+
+def updated_from_etags(if_match: str, task_id: str) -> List[datetime]:
+    """
+    Versions of task_id that an If-Match header accepts, weak validators never match
+    """
+    versions = []
+    for etag in parse_etags(if_match):
+        id, _, updated = etag.strip('"').rpartition(".")
+        if etag.startswith("W/") or id != task_id:
+            continue
+        try:
+            versions.append(datetime.strptime(updated, UPDATED_FORMAT))
+        except ValueError:
+            continue
+    
+    return versions
@@ -0,0 +1,116 @@
+import logging
+import math
+from typing import Collection, Optional
+
+from starlette.responses import JSONResponse
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS, HTTP_503_SERVICE_UNAVAILABLE
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.metrics import MetricsRegistry
+from app.db.ratelimit import RateLimitStore
+
+logger = logging.getLogger(__name__)
+
+# seconds an overloaded server asks clients to wait, requests finish in well under that
+OVERLOAD_RETRY_AFTER = 1
+
+
+def retry_after(wait: float) -> str:
+    """
+    Retry-After header value, whole seconds rounded up
+    """
+    return str(max(1, math.ceil(wait)))
+
+
+def client_key(scope: Scope, key_header: str = "") -> str:
+    """
+    Client a request counts against, the first address of key_header if set and present, else the peer address
+    """
+    if key_header:
+        name = key_header.lower().encode("latin-1")
+        for header, value in scope["headers"]:
+            if header == name:
+                return value.decode("latin-1").split(",")[0].strip()
+    
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class AdmissionMiddleware:
+    """
+    Rejects requests before they reach a route: 429 once a client used up its token bucket,
+    503 while max_in_flight requests are being served, so the MongoDB wait queue stays short.
+    
+    Requests to unbounded_paths, e.g. event streams that stay open, are rate limited but not capped.
+    """
+    
+    def __init__(
+            self,
+            app: ASGIApp,
+            registry: MetricsRegistry,
+            rate_limits: Optional[RateLimitStore] = None,
+            max_in_flight: int = 0,
+            key_header: str = "",
+            unbounded_paths: Collection[str] = (),
+    ) -> None:
+        self.app = app
+        self.rate_limits = rate_limits
+        self.max_in_flight = max_in_flight
+        self.key_header = key_header
+        self.unbounded_paths = set(unbounded_paths)
+        self.in_flight = 0
+        
+        self.admitted = registry.counter("http_requests_admitted_total", "HTTP requests let through admission")
+        self.rejected = registry.counter(
+            "http_requests_rejected_total", "HTTP requests rejected by admission", ("reason",),
+        )
+        self.rate_limit_errors = registry.counter(
+            "http_rate_limit_errors_total", "Rate limit checks that failed and let the request through",
+        )
+        self.in_flight_gauge = registry.gauge(
+            "http_requests_capped_in_flight", "HTTP requests being served that count against the in-flight cap",
+        )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        if self.rate_limits is not None:
+            try:
+                wait = await self.rate_limits.take(client_key(scope, self.key_header))
+            except Exception as e:
+                # an unavailable rate limit store must not take the API down with it
+                logger.warning("Rate limit check failed, letting the request through: %s", e)
+                self.rate_limit_errors.inc()
+                wait = 0.0
+            if wait > 0:
+                self.rejected.labels("rate_limited").inc()
+                await self.reject(scope, receive, send, HTTP_429_TOO_MANY_REQUESTS, "Too many requests", wait)
+                return
+        
+        if scope["path"] in self.unbounded_paths or not self.max_in_flight:
+            self.admitted.inc()
+            await self.app(scope, receive, send)
+            return
+        
+        if self.in_flight >= self.max_in_flight:
+            self.rejected.labels("overloaded").inc()
+            await self.reject(
+                scope, receive, send, HTTP_503_SERVICE_UNAVAILABLE, "Server is overloaded", OVERLOAD_RETRY_AFTER,
+            )
+            return
+        
+        self.admitted.inc()
+        self.in_flight += 1
+        self.in_flight_gauge.set(self.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+            self.in_flight_gauge.set(self.in_flight)
+    
+    @staticmethod
+    async def reject(scope: Scope, receive: Receive, send: Send, status_code: int, detail: str, wait: float) -> None:
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers={"Retry-After": retry_after(wait)})
+        await response(scope, receive, send)
@@ -0,0 +1,251 @@
+import logging
+import zlib
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.status import HTTP_304_NOT_MODIFIED
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.etag import parse_etags
+from app.core.metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# levels that trade a little size for much less CPU than the maximum, the API compresses every large response
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+ZSTD_LEVEL = 3
+
+# event streams are left alone, a compressor may hold back an event until more data arrives
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv"}
+# Each encoding gets its own strong ETag, the route's ETag suffixed with the encoding as in "abc-gzip": a strong
+# validator promises the same bytes, which the gzip and identity responses of one version are not. A weak W/ ETag
+# would do for caches too, but If-Match compares strongly and would turn down the ETag of every compressed GET. The
+# suffixes are stripped from these headers before a request reaches the routes, which only know the plain ETags.
+CONDITIONAL_HEADERS = {b"if-match", b"if-none-match"}
+
+
+class Encoder(ABC):
+    @abstractmethod
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """
+        Compressed data, everything passed in so far is flushed out so a streamed chunk is not held back
+        """
+
+
+class GzipEncoder(Encoder):
+    def __init__(self) -> None:
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BrotliEncoder(Encoder):
+    def __init__(self) -> None:
+        import brotli
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.process(data) + (self.compressor.finish() if final else self.compressor.flush())
+
+
+class ZstdEncoder(Encoder):
+    def __init__(self) -> None:
+        import zstandard
+        self.flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self.flush_finish = zstandard.COMPRESSOBJ_FLUSH_FINISH
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(self.flush_finish if final else self.flush_block)
+
+
+# brotli and zstd need the brotli and zstandard packages, encodings whose package is missing are not offered
+ENCODERS: Dict[str, Callable[[], Encoder]] = {"zstd": ZstdEncoder, "br": BrotliEncoder, "gzip": GzipEncoder}
+ENCODER_MODULES = {"zstd": "zstandard", "br": "brotli"}
+
+
+def available_encodings(names: Sequence[str]) -> List[str]:
+    """
+    The known encodings among names whose package is installed, in the order given
+    """
+    encodings = []
+    for name in names:
+        if name not in ENCODERS:
+            raise ValueError(f"Unknown compression encoding: {name}")
+        if (module := ENCODER_MODULES.get(name)) is not None:
+            try:
+                __import__(module)
+            except ImportError:
+                logger.info("Not offering %s compression, the %s package is not installed", name, module)
+                continue
+        encodings.append(name)
+    return encodings
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """
+    ETag of a response compressed with encoding, a weak ETag already allows other bytes and stays as it is
+    """
+    if etag.startswith("W/") or not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decoded_etags(header: str) -> str:
+    """
+    The ETags of an If-Match or If-None-Match header without their encoding suffixes
+    """
+    etags = []
+    for etag in parse_etags(header):
+        for encoding in ENCODERS:
+            if etag.endswith(suffix := f'-{encoding}"'):
+                etag = f'{etag.removesuffix(suffix)}"'
+                break
+        etags.append(etag)
+    return ", ".join(etags)
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """
+    The encoding of encodings the client prefers by Accept-Encoding q-values, ties go to the earlier one
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if name := name.strip().lower():
+            weights[name] = weight
+    
+    default = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        if (weight := weights.get(encoding, default)) > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses JSON and NDJSON responses of at least minimum_size bytes with the encoding the client prefers.
+    
+    Streamed responses are compressed chunk by chunk, so an export still arrives as it is produced.
+    A compressed response's ETag names its encoding, see CONDITIONAL_HEADERS.
+    """
+    
+    def __init__(
+            self,
+            app: ASGIApp,
+            registry: MetricsRegistry,
+            encodings: Sequence[str] = ("gzip",),
+            minimum_size: int = 1024,
+    ) -> None:
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.minimum_size = minimum_size
+        self.input_bytes = registry.counter(
+            "http_compression_input_bytes_total", "Response bytes before compression", ("encoding",),
+        )
+        self.output_bytes = registry.counter(
+            "http_compression_output_bytes_total", "Response bytes after compression", ("encoding",),
+        )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        headers = Headers(scope=scope)
+        encoding = negotiate(headers.get("accept-encoding", ""), self.encodings)
+        responder = CompressionResponder(self, send, encoding, parse_etags(headers.get("if-none-match", "")))
+        scope = {**scope, "headers": [
+            (name, decoded_etags(value.decode("latin-1")).encode("latin-1") if name in CONDITIONAL_HEADERS else value)
+            for name, value in scope["headers"]
+        ]}
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    def __init__(
+            self, middleware: CompressionMiddleware, send: Send, encoding: Optional[str], if_none_match: List[str]
+    ) -> None:
+        self.middleware = middleware
+        self.downstream = send
+        self.encoding = encoding
+        self.if_none_match = if_none_match
+        self.start: Optional[Message] = None
+        self.encoder: Optional[Encoder] = None
+    
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # held back until the first body chunk shows whether the response is worth compressing
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.downstream(message)
+            return
+        
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if (encoder := self.choose_encoder(start, body, more_body)) is None:
+                await self.downstream(start)
+                await self.downstream(message)
+                return
+            
+            self.encoder = encoder
+            compressed = self.compress(body, more_body)
+            if not more_body:
+                # the whole body was compressed before anything was sent, so its length is known
+                MutableHeaders(raw=start["headers"])["Content-Length"] = str(len(compressed))
+            await self.downstream(start)
+        elif self.encoder is None:
+            await self.downstream(message)
+            return
+        else:
+            compressed = self.compress(body, more_body)
+        
+        await self.downstream({"type": "http.response.body", "body": compressed, "more_body": more_body})
+    
+    def choose_encoder(self, start: Message, body: bytes, more_body: bool) -> Optional[Encoder]:
+        headers = MutableHeaders(raw=start["headers"])
+        if start["status"] == HTTP_304_NOT_MODIFIED:
+            # the ETag the client holds, the compressed one if that is what it cached
+            if (
+                    self.encoding is not None
+                    and (etag := headers.get("etag")) is not None
+                    and encoded_etag(etag, self.encoding) in self.if_none_match
+            ):
+                headers["ETag"] = encoded_etag(etag, self.encoding)
+            return None
+        
+        media_type = headers.get("content-type", "").partition(";")[0].strip()
+        if media_type not in COMPRESSIBLE_TYPES or "content-encoding" in headers:
+            return None
+        
+        headers.add_vary_header("Accept-Encoding")
+        if self.encoding is None or (not more_body and len(body) < self.middleware.minimum_size):
+            return None
+        
+        headers["Content-Encoding"] = self.encoding
+        if "etag" in headers:
+            headers["ETag"] = encoded_etag(headers["etag"], self.encoding)
+        if "content-length" in headers:
+            del headers["Content-Length"]
+        return ENCODERS[self.encoding]()
+    
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        compressed = self.encoder.compress(body, final=not more_body)
+        self.middleware.input_bytes.labels(self.encoding).inc(len(body))
+        self.middleware.output_bytes.labels(self.encoding).inc(len(compressed))
+        return compressed
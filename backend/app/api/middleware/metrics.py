@@ -0,0 +1,68 @@
+import time
+
+from starlette.routing import Match
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.metrics import MetricsRegistry
+from app.core.tracing import Tracer
+
+# requests that match no route share a label, so probes of random paths cannot grow the series count
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_path(scope: Scope) -> str:
+    """
+    Path template of the route serving the request, e.g. /api/tasks/{task_id}/
+    """
+    partial = UNMATCHED_ROUTE
+    for route in getattr(scope.get("app"), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial == UNMATCHED_ROUTE:
+            partial = route.path
+    return partial
+
+
+class MetricsMiddleware:
+    """
+    Latency histogram and in-flight gauge per route template, plus sampled tracing of whole requests
+    """
+    
+    def __init__(self, app: ASGIApp, registry: MetricsRegistry, tracer: Tracer) -> None:
+        self.app = app
+        self.tracer = tracer
+        self.durations = registry.histogram(
+            "http_request_duration_seconds", "Time to serve HTTP requests", ("method", "route", "status"),
+        )
+        self.in_flight = registry.gauge(
+            "http_requests_in_flight", "HTTP requests being served", ("method", "route"),
+        )
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        method = scope["method"]
+        route = route_path(scope)
+        status = 500
+        
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        trace = self.tracer.start(f"{method} {route}", path=scope["path"])
+        in_flight = self.in_flight.labels(method, route)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            self.durations.labels(method, route, status).observe(time.perf_counter() - start)
+            if trace is not None:
+                trace.attributes["status"] = str(status)
+                self.tracer.finish(trace)
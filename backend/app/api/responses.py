@@ -0,0 +1,27 @@
+from typing import Any, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.core.tracing import span
+
+
+class ModelResponse(JSONResponse):
+    """
+    Render pydantic models straight to JSON with pydantic-core.
+    
+    Returning a response from a route also skips FastAPI's second validation of the response_model.
+    include limits the fields rendered, in the form model_dump_json takes.
+    """
+    
+    def __init__(self, content: Any, *args: Any, include: Optional[Any] = None, **kwargs: Any) -> None:
+        # set first, the parent constructor renders the content
+        self.include = include
+        super().__init__(content, *args, **kwargs)
+    
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            with span("render", model=type(content).__name__):
+                return content.model_dump_json(by_alias=True, include=self.include).encode()
+        
+        return super().render(content)
@@ -0,0 +1,72 @@
+from typing import List
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.metrics import CONTENT_TYPE, Counter, Gauge, Metric, render
+
+router = APIRouter()
+
+
+def cache_metrics(app: FastAPI) -> List[Metric]:
+    task_cache = getattr(app, "task_cache", None)
+    if task_cache is None:
+        return []
+    
+    metrics = []
+    for name in ("hits", "misses", "evictions", "expirations"):
+        counter = Counter(f"task_cache_{name}_total", f"Task cache {name}")
+        counter.inc(getattr(task_cache.stats, name))
+        metrics.append(counter)
+    return metrics
+
+
+def read_metrics(app: FastAPI) -> List[Metric]:
+    task_reads = getattr(app, "task_reads", None)
+    if task_reads is None:
+        return []
+    
+    reads = Counter("task_reads_total", "Task reads that could be coalesced, by kind", ("kind",))
+    coalesced = Counter("task_reads_coalesced_total", "Task reads answered by an identical query in flight", ("kind",))
+    for kind, stats in task_reads.stats.items():
+        reads.labels(kind).inc(stats.calls)
+        coalesced.labels(kind).inc(stats.coalesced)
+    return [reads, coalesced]
+
+
+def pool_metrics(app: FastAPI) -> List[Metric]:
+    pool = getattr(app, "pool_metrics", None)
+    if pool is None:
+        return []
+    
+    with pool.lock:
+        values = {
+            Gauge("mongodb_pool_connections_open", "Open connections in the MongoDB pool"): pool.connections_open,
+            Gauge("mongodb_pool_connections_checked_out", "Connections in use"): pool.connections_checked_out,
+            Gauge("mongodb_pool_wait_queue_size", "Operations waiting for a connection"): pool.wait_queue_size,
+            Counter("mongodb_pool_checkouts_total", "Connection checkouts"): pool.checkouts,
+            Counter("mongodb_pool_checkout_wait_seconds_total", "Time spent waiting for a connection"):
+                pool.checkout_wait_seconds,
+            Counter("mongodb_pool_clears_total", "Times the pool was cleared"): pool.pool_clears,
+        }
+        failures = dict(pool.checkout_failures)
+    
+    for metric, value in values.items():
+        metric.inc(value)
+    
+    checkout_failures = Counter("mongodb_pool_checkout_failures_total", "Failed connection checkouts", ("reason",))
+    for reason, count in failures.items():
+        checkout_failures.labels(reason).inc(count)
+    return [*values, checkout_failures]
+
+
+@router.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    name="metrics:get-metrics",
+    include_in_schema=False,
+)
+async def get_metrics(request: Request) -> PlainTextResponse:
+    app = request.app
+    metrics = [*app.metrics.metrics.values(), *cache_metrics(app), *read_metrics(app), *pool_metrics(app)]
+    return PlainTextResponse(render(metrics), media_type=CONTENT_TYPE)
@@ -1,29 +1,253 @@
-from typing import List
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional
 
-from fastapi import APIRouter, Body, Depends
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
 
-from starlette.status import HTTP_201_CREATED, HTTP_204_NO_CONTENT
+from starlette.status import (
+    HTTP_201_CREATED,
+    HTTP_204_NO_CONTENT,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
+    WS_1013_TRY_AGAIN_LATER,
+)
 
-from app.api.dependencies.tasks import get_task_by_id_from_path
+from app.api.dependencies.tasks import get_task_by_id_from_path, get_task_fields
+from app.api.dependencies.tenants import get_tenant
+from app.api.etag import etag_matches, page_etag, parse_etags, task_etag, updated_from_etags
+from app.api.responses import ModelResponse
 from app.api.dependencies.database import get_repository
 
+from app.core.config import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_STATS_DAYS,
+    EXPORT_BATCH_SIZE,
+    MAX_BATCH_SIZE,
+    MAX_EXPORT_BATCH_SIZE,
+    MAX_IDEMPOTENCY_KEY_LENGTH,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_QUERY_LENGTH,
+    MAX_STATS_DAYS,
+    MAX_TASK_GRAPH_DEPTH,
+    TASK_EVENTS_HEARTBEAT_SECONDS,
+)
+from app.db.events import Subscription
+from app.db.repositories.stats import TaskStatsRepository
 from app.db.repositories.tasks import TaskRepository
 
-from app.models.task import TaskCreate, TaskInDB, TaskPublic, TaskUpdate
+from app.models.core import ExportFormat, LocalDatetime, SortOrder
+from app.models.task import (
+    TaskBatchResult,
+    TaskBatchUpdate,
+    TaskCreate,
+    TaskEvent,
+    TaskGraph,
+    TaskInDB,
+    TaskPage,
+    TaskPublic,
+    TaskRelation,
+    TaskStats,
+    TaskStatus,
+    TaskUpdate,
+)
 
 router = APIRouter()
 
+SSE_RETRY_MILLISECONDS = 1000
+
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.json: "application/json",
+}
+
+
+def page_include(fields: Optional[FrozenSet[str]]) -> Optional[Dict[str, Any]]:
+    """
+    What to render of a page read with fields, which also holds the fields every page is read with
+    """
+    if fields is None:
+        return None
+    return {"tasks": {"__all__": set(fields)}, "next_cursor": True}
+
+
+async def encode_ndjson(
+        batches: AsyncIterator[List[TaskPublic]], fields: Optional[FrozenSet[str]] = None
+) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield "".join(f"{task.model_dump_json(by_alias=True, include=fields)}\n" for task in batch).encode()
+
+
+async def encode_json_array(
+        batches: AsyncIterator[List[TaskPublic]], fields: Optional[FrozenSet[str]] = None
+) -> AsyncIterator[bytes]:
+    separator = "["
+    async for batch in batches:
+        yield (separator + ",".join(task.model_dump_json(by_alias=True, include=fields) for task in batch)).encode()
+        separator = ","
+    
+    yield b"[]" if separator == "[" else b"]"
+
+
+async def iter_events(subscription: Subscription) -> AsyncIterator[Optional[TaskEvent]]:
+    """
+    Events until the subscription ends, None whenever there was nothing to send for a heartbeat interval
+    """
+    while True:
+        try:
+            event = await asyncio.wait_for(subscription.get(), TASK_EVENTS_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield None
+            continue
+        if event is None:
+            return
+        yield event
+
+
+async def encode_sse(request: Request, subscription: Subscription) -> AsyncIterator[bytes]:
+    try:
+        # sent right away so the client sees the stream open, and waits a moment before reconnecting
+        yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n".encode()
+        async for event in iter_events(subscription):
+            if event is None:
+                # a comment line keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+                continue
+            
+            id_line = f"id: {event.id}\n" if event.id is not None else ""
+            yield f"{id_line}event: {event.type.value}\ndata: {event.model_dump_json(by_alias=True)}\n\n".encode()
+    finally:
+        request.app.task_events.unsubscribe(subscription)
+
 
 @router.get(
     "/",
-    response_model=List[TaskPublic],
-    response_description="List all tasks",
+    response_model=TaskPage,
+    response_description="List tasks one page at a time",
     name="task:get-all-tasks"
 )
 async def list_all_tasks(
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        status: Optional[TaskStatus] = Query(None),
+        order: SortOrder = Query(SortOrder.desc, description="Order by last update"),
+        include_archived: bool = Query(False, description="Also list archived and soft-deleted tasks"),
+        fields: Optional[FrozenSet[str]] = Depends(get_task_fields),
+        if_none_match: Optional[str] = Header(None),
         task_repo: TaskRepository = Depends(get_repository(TaskRepository))
-):
-    return await task_repo.list_all_tasks()
+) -> TaskPage:
+    page = await task_repo.list_all_tasks(
+        limit=limit, cursor=cursor, status=status, order=order, include_archived=include_archived, fields=fields,
+    )
+    
+    etag = page_etag(page)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    return ModelResponse(page, headers={"ETag": etag}, include=page_include(fields))
+
+
+@router.get(
+    "/search",
+    response_model=TaskPage,
+    response_description="Tasks matching a full-text search of name and description, most relevant first",
+    name="task:search-tasks",
+)
+async def search_tasks(
+        q: str = Query(..., min_length=1, max_length=MAX_SEARCH_QUERY_LENGTH, description="Words to search for"),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+        status: Optional[TaskStatus] = Query(None),
+        fields: Optional[FrozenSet[str]] = Depends(get_task_fields),
+        if_none_match: Optional[str] = Header(None),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> TaskPage:
+    page = await task_repo.search_tasks(q=q, limit=limit, cursor=cursor, status=status, fields=fields)
+    
+    etag = page_etag(page)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    return ModelResponse(page, headers={"ETag": etag}, include=page_include(fields))
+
+
+@router.get(
+    "/stats",
+    response_model=TaskStats,
+    response_description="Number of tasks per status, overall and per day of last update",
+    name="task:get-task-stats",
+)
+async def get_task_stats(
+        days: int = Query(DEFAULT_STATS_DAYS, ge=1, le=MAX_STATS_DAYS, description="Days back from today to include"),
+        stats_repo: TaskStatsRepository = Depends(get_repository(TaskStatsRepository))
+) -> TaskStats:
+    stats = await stats_repo.get_stats(days=days)
+    return ModelResponse(stats)
+
+
+@router.get(
+    "/stream",
+    response_class=StreamingResponse,
+    response_description="Server-sent events for every created, updated and deleted task",
+    name="task:stream-task-events",
+)
+async def stream_task_events(
+        request: Request,
+        resume_after: Optional[str] = Query(None, description="id of the last event received"),
+        last_event_id: Optional[str] = Header(None, description="Sent by EventSource when it reconnects"),
+        tenant: str = Depends(get_tenant),
+) -> StreamingResponse:
+    subscription = request.app.task_events.subscribe(resume_after=resume_after or last_event_id, tenant=tenant)
+    
+    return StreamingResponse(
+        encode_sse(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/stream", name="task:stream-task-events-ws")
+async def stream_task_events_ws(
+        websocket: WebSocket,
+        resume_after: Optional[str] = Query(None, description="id of the last event received"),
+        tenant: str = Depends(get_tenant),
+) -> None:
+    await websocket.accept()
+    subscription = websocket.app.task_events.subscribe(resume_after=resume_after, tenant=tenant)
+    try:
+        async for event in iter_events(subscription):
+            if event is None:
+                await websocket.send_json({"type": "heartbeat"})
+            else:
+                await websocket.send_text(event.model_dump_json(by_alias=True))
+        # the client fell behind, it should reconnect with the id of the last event it handled
+        await websocket.close(code=WS_1013_TRY_AGAIN_LATER)
+    finally:
+        websocket.app.task_events.unsubscribe(subscription)
+
+
+@router.get(
+    "/export",
+    response_class=StreamingResponse,
+    response_description="Stream every matching task as NDJSON or a JSON array",
+    name="task:export-tasks",
+)
+async def export_tasks(
+        format: ExportFormat = Query(ExportFormat.ndjson),
+        status: Optional[TaskStatus] = Query(None),
+        updated_after: Optional[LocalDatetime] = Query(None, description="Inclusive lower bound of last update"),
+        updated_before: Optional[LocalDatetime] = Query(None, description="Exclusive upper bound of last update"),
+        batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=MAX_EXPORT_BATCH_SIZE),
+        fields: Optional[FrozenSet[str]] = Depends(get_task_fields),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> StreamingResponse:
+    batches = task_repo.iter_tasks(
+        status=status, updated_after=updated_after, updated_before=updated_before, batch_size=batch_size, fields=fields,
+    )
+    encode = encode_ndjson if format == ExportFormat.ndjson else encode_json_array
+    
+    return StreamingResponse(encode(batches, fields), media_type=EXPORT_MEDIA_TYPES[format])
 
 
 @router.get(
@@ -33,9 +257,34 @@ async def list_all_tasks(
     name="task:get-task-by-id",
 )
 async def get_cleaning_by_id(
+        if_none_match: Optional[str] = Header(None),
+        fields: Optional[FrozenSet[str]] = Depends(get_task_fields),
         task: TaskInDB = Depends(get_task_by_id_from_path)
 ) -> TaskPublic:
-    return task
+    etag = task_etag(task)
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    # read whole, single tasks come from the task cache, so fields only trim the response
+    return ModelResponse(task, headers={"ETag": etag}, include=fields)
+
+
+@router.get(
+    "/{task_id}/graph",
+    response_model=TaskGraph,
+    response_description="A task with its subtasks or dependencies, theirs and so on, nearest first",
+    name="task:get-task-graph",
+)
+async def get_task_graph(
+        task_id: str,
+        relation: TaskRelation = Query(TaskRelation.subtasks),
+        max_depth: int = Query(MAX_TASK_GRAPH_DEPTH, ge=1, le=MAX_TASK_GRAPH_DEPTH, description="Levels to follow"),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> TaskGraph:
+    graph = await task_repo.get_task_graph(task_id=task_id, relation=relation, max_depth=max_depth)
+    if graph is None:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail="No task found with that id.")
+    return ModelResponse(graph)
 
 
 @router.post(
@@ -46,10 +295,27 @@ async def get_cleaning_by_id(
     status_code=HTTP_201_CREATED,
 )
 async def create_new_task(
+        request: Request,
         task: TaskCreate = Body(...),
+        idempotency_key: Optional[str] = Header(
+            None,
+            min_length=1,
+            max_length=MAX_IDEMPOTENCY_KEY_LENGTH,
+            description="Retries with the same key and body get the first response again instead of another task",
+        ),
         task_repo: TaskRepository = Depends(get_repository(TaskRepository))
 ) -> TaskPublic:
-    return await task_repo.create_task(task=task)
+    async def create() -> Response:
+        created_task = await task_repo.create_task(task=task)
+        
+        return ModelResponse(created_task, status_code=HTTP_201_CREATED, headers={"ETag": task_etag(created_task)})
+    
+    if idempotency_key is None:
+        return await create()
+    
+    fingerprint = hashlib.sha256(task.model_dump_json().encode()).hexdigest()
+    # tenants pick their keys independently, one must never be answered with the response stored for another
+    return await request.app.idempotency.run(f"{task_repo.tenant}/{idempotency_key}", fingerprint, create)
 
 
 @router.put(
@@ -60,11 +326,22 @@ async def create_new_task(
 )
 async def update_task_by_id(
         task_id: str,
-        task: TaskPublic = Depends(get_task_by_id_from_path),
         task_update: TaskUpdate = Body(...),
+        if_match: Optional[str] = Header(None, description="ETag of the version this update is based on"),
         task_repo: TaskRepository = Depends(get_repository(TaskRepository)),
 ) -> TaskPublic:
-    return await task_repo.update_task_by_id(task_id=task_id, task=task, task_update=task_update)
+    expected_updated = None
+    if if_match is not None and "*" not in parse_etags(if_match):
+        if not (expected_updated := updated_from_etags(if_match, task_id)):
+            raise HTTPException(
+                status_code=HTTP_412_PRECONDITION_FAILED, detail=f"Task {task_id} does not match If-Match",
+            )
+    
+    updated_task = await task_repo.update_task_by_id(
+        task_id=task_id, task_update=task_update, expected_updated=expected_updated,
+    )
+    
+    return ModelResponse(updated_task, headers={"ETag": task_etag(updated_task)})
 
 
 @router.delete(
@@ -75,6 +352,46 @@ async def update_task_by_id(
 )
 async def delete_task(
         task_id: str,
+        soft: bool = Query(False, description="Move the task to the archive instead of deleting it"),
         task_repo: TaskRepository = Depends(get_repository(TaskRepository))
 ):
-    return await task_repo.delete_task_by_id(task_id=task_id)
+    return await task_repo.delete_task_by_id(task_id=task_id, soft=soft)
+
+
+@router.post(
+    "/batch",
+    response_model=TaskBatchResult,
+    response_description="Add many tasks at once, with a result per task",
+    name="task:create-tasks-batch",
+)
+async def create_tasks_batch(
+        tasks: List[TaskCreate] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> TaskBatchResult:
+    return ModelResponse(TaskBatchResult(results=await task_repo.bulk_create(tasks=tasks)))
+
+
+@router.patch(
+    "/batch",
+    response_model=TaskBatchResult,
+    response_description="Update many tasks at once, with a result per task",
+    name="task:update-tasks-batch",
+)
+async def update_tasks_batch(
+        task_updates: List[TaskBatchUpdate] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> TaskBatchResult:
+    return ModelResponse(TaskBatchResult(results=await task_repo.bulk_update(task_updates=task_updates)))
+
+
+@router.delete(
+    "/batch",
+    response_model=TaskBatchResult,
+    response_description="Delete many tasks by id, with a result per task",
+    name="task:delete-tasks-batch",
+)
+async def delete_tasks_batch(
+        task_ids: List[str] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+        task_repo: TaskRepository = Depends(get_repository(TaskRepository))
+) -> TaskBatchResult:
+    return ModelResponse(TaskBatchResult(results=await task_repo.bulk_delete(task_ids=task_ids)))
@@ -2,13 +2,53 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core import config, tasks
+from app.core.metrics import MetricsRegistry
+from app.core.profiling import startup_profile
+from app.core.tracing import Tracer
+from app.db.ratelimit import create_rate_limit_store
 
+from app.api.middleware.admission import AdmissionMiddleware
+from app.api.middleware.compression import CompressionMiddleware
+from app.api.middleware.metrics import MetricsMiddleware
 from app.api.routes import router as api_router
+from app.api.routes.metrics import router as metrics_router
 
 
 def get_application():
-    app = FastAPI(title=config.PROJECT_NAME, version=config.VERSION)
+    with startup_profile.phase("build app"):
+        return build_application()
+
+
+def build_application():
+    docs = {} if config.DOCS_ENABLED else {"docs_url": None, "redoc_url": None, "openapi_url": None}
+    app = FastAPI(title=config.PROJECT_NAME, version=config.VERSION, **docs)
+    app.metrics = MetricsRegistry()
+    app.tracer = Tracer(config.TRACE_SAMPLE_RATE)
+    app.rate_limits = create_rate_limit_store()
+    
+    # including a router copies each of its routes, with their request and response models
+    with startup_profile.phase("router: api"):
+        app.include_router(api_router, prefix=config.API_PREFIX)
+    if config.METRICS_ENABLED:
+        with startup_profile.phase("router: metrics"):
+            app.include_router(metrics_router)
     
+    # added first so it runs innermost, rejected requests still get CORS headers and are measured
+    app.add_middleware(
+        AdmissionMiddleware,
+        registry=app.metrics,
+        rate_limits=app.rate_limits,
+        max_in_flight=config.MAX_IN_FLIGHT_REQUESTS,
+        key_header=config.RATE_LIMIT_KEY_HEADER,
+        unbounded_paths={app.url_path_for("task:stream-task-events")},
+    )
+    if config.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            registry=app.metrics,
+            encodings=list(config.COMPRESSION_ENCODINGS),
+            minimum_size=config.COMPRESSION_MIN_SIZE,
+        )
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -16,13 +56,19 @@ def get_application():
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    if config.METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware, registry=app.metrics, tracer=app.tracer)
     
     app.add_event_handler("startup", tasks.create_start_app_handler(app))
     app.add_event_handler("shutdown", tasks.create_stop_app_handler(app))
     
-    app.include_router(api_router, prefix=config.API_PREFIX)
-    
     return app
 
 
-app = get_application()
+def __getattr__(name: str):
+    # the app uvicorn serves is built on first access, importing get_application, e.g. in tests, builds nothing
+    if name == "app":
+        global app
+        app = get_application()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,5 @@
 from starlette.config import Config
-from starlette.datastructures import Secret
+from starlette.datastructures import CommaSeparatedStrings, Secret
 
 config = Config(".env")
 
@@ -15,3 +15,122 @@ DATABASE_URL = config(
 DATABASE_NAME = config(
     "DATABASE_NAME",
 )
+# "mongo" connects to DATABASE_URL, "memory" keeps the data in process, e.g. to run the tests without MongoDB
+DATABASE_BACKEND = config("DATABASE_BACKEND", default="mongo")
+
+# tenant of requests without a bearer token, and of tasks stored before tasks had tenants, empty to require a token
+DEFAULT_TENANT = config("DEFAULT_TENANT", default="default")
+# shard tasks by a hash of their tenant at startup, needs a sharded cluster
+TASK_SHARDING = config("TASK_SHARDING", cast=bool, default=False)
+
+# Motor connection pool, see https://pymongo.readthedocs.io/en/stable/api/pymongo/mongo_client.html
+MONGO_MAX_POOL_SIZE = config("MONGO_MAX_POOL_SIZE", cast=int, default=100)
+MONGO_MIN_POOL_SIZE = config("MONGO_MIN_POOL_SIZE", cast=int, default=10)
+MONGO_MAX_IDLE_TIME_MS = config("MONGO_MAX_IDLE_TIME_MS", cast=int, default=60000)
+MONGO_WAIT_QUEUE_TIMEOUT_MS = config("MONGO_WAIT_QUEUE_TIMEOUT_MS", cast=int, default=5000)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = config("MONGO_SERVER_SELECTION_TIMEOUT_MS", cast=int, default=5000)
+MONGO_COMPRESSORS = config("MONGO_COMPRESSORS", cast=CommaSeparatedStrings, default="")
+
+# python -m app, SERVER_WORKERS=0 starts one worker process per CPU core. More than one worker needs
+# TASK_CACHE_BACKEND=redis to keep a task cache, the local one is turned off for them.
+SERVER_HOST = config("SERVER_HOST", default="127.0.0.1")
+SERVER_PORT = config("SERVER_PORT", cast=int, default=8000)
+SERVER_WORKERS = config("SERVER_WORKERS", cast=int, default=0)
+# seconds a stopping worker gets to finish its requests before it is killed
+SERVER_GRACEFUL_TIMEOUT = config("SERVER_GRACEFUL_TIMEOUT", cast=int, default=30)
+SERVER_ACCESS_LOG = config("SERVER_ACCESS_LOG", cast=bool, default=False)
+
+DEFAULT_PAGE_SIZE = config("DEFAULT_PAGE_SIZE", cast=int, default=50)
+MAX_PAGE_SIZE = config("MAX_PAGE_SIZE", cast=int, default=500)
+
+EXPORT_BATCH_SIZE = config("EXPORT_BATCH_SIZE", cast=int, default=1000)
+MAX_EXPORT_BATCH_SIZE = config("MAX_EXPORT_BATCH_SIZE", cast=int, default=10000)
+
+MAX_BATCH_SIZE = config("MAX_BATCH_SIZE", cast=int, default=1000)
+
+MAX_SEARCH_QUERY_LENGTH = config("MAX_SEARCH_QUERY_LENGTH", cast=int, default=256)
+
+DEFAULT_STATS_DAYS = config("DEFAULT_STATS_DAYS", cast=int, default=30)
+MAX_STATS_DAYS = config("MAX_STATS_DAYS", cast=int, default=366)
+# levels of subtasks or dependencies a graph request follows, and the longest chain of parents or dependencies a
+# task can be added to, which bounds the walks that look for cycles
+MAX_TASK_GRAPH_DEPTH = config("MAX_TASK_GRAPH_DEPTH", cast=int, default=20)
+
+# "local" keeps tasks in process, "redis" adds a level shared by all processes at TASK_CACHE_URL, "none" disables
+TASK_CACHE_BACKEND = config("TASK_CACHE_BACKEND", default="local")
+TASK_CACHE_MAX_SIZE = config("TASK_CACHE_MAX_SIZE", cast=int, default=10000)
+TASK_CACHE_TTL = config("TASK_CACHE_TTL", cast=float, default=30.0)
+TASK_CACHE_URL = config("TASK_CACHE_URL", default="redis://localhost:6379/0")
+# concurrent identical reads of a task or a task page share one MongoDB query, with or without the cache
+TASK_READ_COALESCING = config("TASK_READ_COALESCING", cast=bool, default=True)
+
+# completed and cancelled tasks not updated for ARCHIVE_AFTER_DAYS move to tasks_archive in the background
+ARCHIVE_ENABLED = config("ARCHIVE_ENABLED", cast=bool, default=True)
+ARCHIVE_AFTER_DAYS = config("ARCHIVE_AFTER_DAYS", cast=float, default=30.0)
+ARCHIVE_BATCH_SIZE = config("ARCHIVE_BATCH_SIZE", cast=int, default=500)
+ARCHIVE_INTERVAL_SECONDS = config("ARCHIVE_INTERVAL_SECONDS", cast=float, default=600.0)
+# archived tasks are purged by a TTL index this many days after they were archived
+ARCHIVE_TTL_DAYS = config("ARCHIVE_TTL_DAYS", cast=float, default=365.0)
+
+# task documents of older schema versions are upgraded when read, and rewritten in batches in the background by one
+# process at a time, which checkpoints its progress so another process can resume it
+MIGRATION_ENABLED = config("MIGRATION_ENABLED", cast=bool, default=True)
+MIGRATION_BATCH_SIZE = config("MIGRATION_BATCH_SIZE", cast=int, default=500)
+# pause after each batch, so the migration leaves MongoDB to the requests
+MIGRATION_BATCH_INTERVAL_SECONDS = config("MIGRATION_BATCH_INTERVAL_SECONDS", cast=float, default=0.5)
+# a migration whose process stopped checkpointing for this long, e.g. because it died, is taken over by another
+MIGRATION_LEASE_SECONDS = config("MIGRATION_LEASE_SECONDS", cast=float, default=60.0)
+
+# reminder and due events of pending tasks, claimed in batches by the scheduler of every process
+SCHEDULER_ENABLED = config("SCHEDULER_ENABLED", cast=bool, default=True)
+SCHEDULER_BATCH_SIZE = config("SCHEDULER_BATCH_SIZE", cast=int, default=100)
+# how often to look for due jobs when the last batch was not full
+SCHEDULER_POLL_SECONDS = config("SCHEDULER_POLL_SECONDS", cast=float, default=1.0)
+# a claimed job whose handlers have not finished after this long, e.g. because its process died, is claimed again
+SCHEDULER_LEASE_SECONDS = config("SCHEDULER_LEASE_SECONDS", cast=float, default=60.0)
+# job handlers running at once per process
+SCHEDULER_MAX_CONCURRENCY = config("SCHEDULER_MAX_CONCURRENCY", cast=int, default=20)
+
+# first responses to POST /api/tasks/ with an Idempotency-Key, "mongo" shares them between processes, "local" does not
+IDEMPOTENCY_BACKEND = config("IDEMPOTENCY_BACKEND", default="mongo")
+# how long a key is answered with the stored response
+IDEMPOTENCY_TTL_SECONDS = config("IDEMPOTENCY_TTL_SECONDS", cast=float, default=86400.0)
+# a key whose first request has not finished after this long, e.g. because its process died, can be used again
+IDEMPOTENCY_LOCK_SECONDS = config("IDEMPOTENCY_LOCK_SECONDS", cast=float, default=60.0)
+MAX_IDEMPOTENCY_KEY_LENGTH = config("MAX_IDEMPOTENCY_KEY_LENGTH", cast=int, default=255)
+
+# token bucket per client, RATE_LIMIT_PER_SECOND=0 turns rate limiting off
+RATE_LIMIT_PER_SECOND = config("RATE_LIMIT_PER_SECOND", cast=float, default=0.0)
+RATE_LIMIT_BURST = config("RATE_LIMIT_BURST", cast=int, default=50)
+# header naming the client, e.g. X-Forwarded-For behind a proxy, otherwise the client address is used
+RATE_LIMIT_KEY_HEADER = config("RATE_LIMIT_KEY_HEADER", default="")
+# "local" keeps buckets per process, "redis" shares them between processes at RATE_LIMIT_URL
+RATE_LIMIT_BACKEND = config("RATE_LIMIT_BACKEND", default="local")
+RATE_LIMIT_URL = config("RATE_LIMIT_URL", default="redis://localhost:6379/0")
+RATE_LIMIT_MAX_CLIENTS = config("RATE_LIMIT_MAX_CLIENTS", cast=int, default=100000)
+# requests served at once per process before new ones are shed with 503, 0 for no cap.
+# Past a few times the MongoDB pool size more requests only wait longer for a connection.
+MAX_IN_FLIGHT_REQUESTS = config("MAX_IN_FLIGHT_REQUESTS", cast=int, default=4 * MONGO_MAX_POOL_SIZE)
+
+# JSON responses of at least COMPRESSION_MIN_SIZE bytes go out in the first of COMPRESSION_ENCODINGS the client
+# accepts, "br" and "zstd" are only offered when the brotli and zstandard packages are installed
+COMPRESSION_ENABLED = config("COMPRESSION_ENABLED", cast=bool, default=True)
+COMPRESSION_ENCODINGS = config("COMPRESSION_ENCODINGS", cast=CommaSeparatedStrings, default="zstd,br,gzip")
+COMPRESSION_MIN_SIZE = config("COMPRESSION_MIN_SIZE", cast=int, default=1024)
+
+METRICS_ENABLED = config("METRICS_ENABLED", cast=bool, default=True)
+# share of requests traced span by span, traces go to the hooks of app.tracer
+TRACE_SAMPLE_RATE = config("TRACE_SAMPLE_RATE", cast=float, default=0.01)
+
+# /docs, /redoc and /openapi.json, the schema is only built when one of them is first requested
+DOCS_ENABLED = config("DOCS_ENABLED", cast=bool, default=True)
+# log how long each phase of a process's startup took, python -m app --profile-startup reports imports too
+STARTUP_PROFILE = config("STARTUP_PROFILE", cast=bool, default=False)
+
+# "auto" follows MongoDB change streams on replica sets and falls back to this process's own writes
+TASK_EVENTS_SOURCE = config("TASK_EVENTS_SOURCE", default="auto")
+# recent events kept for clients that reconnect with a resume token
+TASK_EVENTS_BUFFER_SIZE = config("TASK_EVENTS_BUFFER_SIZE", cast=int, default=10000)
+# events queued per subscriber before a slow subscriber is dropped
+TASK_EVENTS_QUEUE_SIZE = config("TASK_EVENTS_QUEUE_SIZE", cast=int, default=1000)
+TASK_EVENTS_HEARTBEAT_SECONDS = config("TASK_EVENTS_HEARTBEAT_SECONDS", cast=float, default=15.0)
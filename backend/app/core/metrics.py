@@ -0,0 +1,187 @@
+"""
+Counters, gauges and histograms rendered in the Prometheus text format.
+
+Observations take a lock per metric, since the database driver reports commands from its worker threads.
+"""
+import math
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# starlette appends the charset to text media types
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# seconds, spans a cached read up to a slow aggregation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    type = ""
+    
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+        self.children: Dict[Tuple[str, ...], object] = {}
+    
+    def new_child(self):
+        raise NotImplementedError
+    
+    def labels(self, *values: str):
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+    
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class ValueChild:
+    def __init__(self, lock: threading.Lock) -> None:
+        self.lock = lock
+        self.value = 0.0
+    
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+    
+    def dec(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value -= amount
+    
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+    
+    def new_child(self) -> ValueChild:
+        return ValueChild(self.lock)
+    
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+    
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for values, child in list(self.children.items()):
+            yield self.name, format_labels(self.label_names, values), child.value
+
+
+class Gauge(Counter):
+    type = "gauge"
+    
+    def dec(self, amount: float = 1) -> None:
+        self.labels().dec(amount)
+    
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class HistogramChild:
+    def __init__(self, lock: threading.Lock, buckets: Tuple[float, ...]) -> None:
+        self.lock = lock
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+    
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    type = "histogram"
+    
+    def __init__(
+            self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+    
+    def new_child(self) -> HistogramChild:
+        return HistogramChild(self.lock, self.buckets)
+    
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+    
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        for values, child in list(self.children.items()):
+            with self.lock:
+                counts, total = list(child.counts), child.sum
+            
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                labels = format_labels((*self.label_names, "le"), (*values, format_value(bound)))
+                yield f"{self.name}_bucket", labels, cumulative
+            
+            labels = format_labels(self.label_names, values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+    
+    def register(self, metric: Metric) -> Metric:
+        """
+        Add a metric, or return the one registered under its name so a listener created on every startup keeps one series
+        """
+        registered = self.metrics.get(metric.name)
+        if registered is None:
+            self.metrics[metric.name] = metric
+            return metric
+        
+        if type(registered) is not type(metric) or registered.label_names != metric.label_names:
+            raise ValueError(f"Metric {metric.name} is already registered as a different {registered.type}")
+        return registered
+    
+    def counter(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, label_names))
+    
+    def gauge(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, label_names))
+    
+    def histogram(
+            self, name: str, documentation: str, label_names: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, label_names, buckets))
+    
+    def get(self, name: str) -> Optional[Metric]:
+        return self.metrics.get(name)
+
+
+def render(metrics: Iterable[Metric]) -> str:
+    return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
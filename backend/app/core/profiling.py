@@ -0,0 +1,144 @@
+"""
+Where the cold start of a process goes: module imports, building the app and its routers, the OpenAPI schema
+and connecting to MongoDB.
+
+STARTUP_PROFILE=true logs the startup phases of every worker, python -m app --profile-startup prints them
+together with the import time of every module.
+"""
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, List
+
+from app.core.config import STARTUP_PROFILE
+
+# uvicorn only configures its own loggers, messages logged elsewhere would not show up
+logger = logging.getLogger("uvicorn.error")
+
+# the module uvicorn workers import the app from
+APP_MODULE = "app.api.server"
+# modules listed in the import report, the slowest first
+TOP_IMPORTS = 25
+
+
+@dataclass
+class Phase:
+    name: str
+    depth: int
+    # seconds from the start of the profile to the end of the phase, and the phase's own duration
+    done_at: float = 0.0
+    seconds: float = 0.0
+
+
+@dataclass
+class ModuleImport:
+    name: str
+    self_seconds: float
+    cumulative_seconds: float
+
+
+class StartupProfile:
+    """
+    Durations of the named phases of startup, nothing is recorded unless enabled
+    """
+    
+    def __init__(self, enabled: bool = STARTUP_PROFILE) -> None:
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.phases: List[Phase] = []
+        self.depth = 0
+    
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        
+        # added before it runs, so phases are listed in the order they started, nested ones below their parent
+        phase = Phase(name, self.depth)
+        self.phases.append(phase)
+        self.depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.depth -= 1
+            phase.seconds = end - start
+            phase.done_at = end - self.started
+    
+    def report(self) -> str:
+        lines = [f"{'seconds':>9} {'done at':>9}  phase"]
+        for phase in self.phases:
+            lines.append(f"{phase.seconds:>9.3f} {phase.done_at:>9.3f}  {'  ' * phase.depth}{phase.name}")
+        return "\n".join(lines)
+    
+    def log(self) -> None:
+        if self.enabled and self.phases:
+            logger.info("Startup profile:\n%s", self.report())
+
+
+# one per process, startup runs once
+startup_profile = StartupProfile()
+
+
+def parse_import_times(output: str) -> List[ModuleImport]:
+    """
+    Modules in the output of python -X importtime, which gives microseconds
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        # skips the header line
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        imports.append(ModuleImport(fields[2].strip(), int(fields[0]) / 1e6, int(fields[1]) / 1e6))
+    return imports
+
+
+def measure_imports(module: str) -> List[ModuleImport]:
+    """
+    Import time of module and of everything it imports, in a fresh interpreter as a new worker would
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_import_times(result.stderr)
+
+
+def import_report(imports: List[ModuleImport], top: int = TOP_IMPORTS) -> str:
+    total = max((module.cumulative_seconds for module in imports), default=0.0)
+    lines = [f"{'self':>9} {'total':>9}  module, {len(imports)} modules in {total:.3f}s"]
+    for module in sorted(imports, key=lambda module: module.self_seconds, reverse=True)[:top]:
+        lines.append(f"{module.self_seconds:>9.3f} {module.cumulative_seconds:>9.3f}  {module.name}")
+    return "\n".join(lines)
+
+
+def profile_startup() -> str:
+    """
+    Imports measured in a fresh interpreter, then the app built, its schema generated and started in this process
+    """
+    imports = measure_imports(APP_MODULE)
+    
+    # measured from here, the import measurement above is no part of this process's startup
+    startup_profile.enabled, startup_profile.started = True, time.perf_counter()
+    with startup_profile.phase(f"import {APP_MODULE}"):
+        from app.api.server import get_application
+    app = get_application()
+    with startup_profile.phase("openapi schema"):
+        app.openapi()
+    
+    async def start_and_stop() -> None:
+        await app.router.startup()
+        await app.router.shutdown()
+    
+    asyncio.run(start_and_stop())
+    return f"{startup_profile.report()}\n\n{import_report(imports)}"
@@ -0,0 +1,55 @@
+"""
+Tenant tokens, signed with SECRET_KEY so a client cannot name another tenant and read its tasks.
+
+A token is the tenant and an HMAC-SHA256 of it, each base64url encoded, joined by a dot:
+    
+    python -c "from app.core.security import create_tenant_token; print(create_tenant_token('alice'))"
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+from typing import Optional
+
+from app.core.config import SECRET_KEY
+
+# keeps tenant signatures apart from anything else that may be signed with SECRET_KEY one day
+TENANT_TOKEN_PURPOSE = b"tenant:"
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def tenant_signature(tenant: bytes) -> bytes:
+    return hmac.new(str(SECRET_KEY).encode(), TENANT_TOKEN_PURPOSE + tenant, hashlib.sha256).digest()
+
+
+def create_tenant_token(tenant: str) -> str:
+    if not tenant:
+        raise ValueError("Tenant must not be empty")
+    
+    encoded = tenant.encode()
+    return f"{b64encode(encoded)}.{b64encode(tenant_signature(encoded))}"
+
+
+def verify_tenant_token(token: str) -> Optional[str]:
+    """
+    Tenant the token was created for, None if it was not created with this SECRET_KEY
+    """
+    payload, _, signature = token.partition(".")
+    try:
+        tenant, signature = b64decode(payload), b64decode(signature)
+    except (binascii.Error, ValueError):
+        return None
+    
+    if not tenant or not hmac.compare_digest(signature, tenant_signature(tenant)):
+        return None
+    try:
+        return tenant.decode()
+    except UnicodeDecodeError:
+        return None
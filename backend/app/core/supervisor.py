@@ -0,0 +1,201 @@
+"""
+Process manager behind python -m app.
+
+The supervisor binds the listening socket once and keeps a number of uvicorn worker processes accepting on it.
+Workers are spawned, not forked, so each one imports the app and opens its own Motor client at startup,
+nothing with threads or sockets to MongoDB is ever shared between processes.
+    
+    SIGHUP           start a new set of workers with freshly imported code, then drain the old set
+    SIGTERM, SIGINT  drain every worker and exit
+
+A draining worker stops accepting connections and finishes the requests it has, for up to the graceful timeout.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing.synchronize import Event
+from typing import List, Optional
+
+import uvicorn
+
+# uvicorn only configures its own loggers, messages logged elsewhere would not show up
+logger = logging.getLogger("uvicorn.error")
+
+ASGI_APP = "app.api.server:app"
+
+# seconds between checks for dead workers when no signal arrives
+SUPERVISE_INTERVAL = 0.5
+# seconds a new worker gets to finish startup, e.g. to connect to MongoDB
+STARTUP_TIMEOUT = 60.0
+
+spawn = multiprocessing.get_context("spawn")
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    uvicorn server that reports once its lifespan startup is done and it accepts connections
+    """
+    
+    def __init__(self, config: uvicorn.Config, ready: Event) -> None:
+        super().__init__(config)
+        self.ready = ready
+    
+    async def startup(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            self.ready.set()
+
+
+def run_worker(config: uvicorn.Config, sockets: List[socket.socket], ready: Event) -> None:
+    config.configure_logging()
+    WorkerServer(config, ready).run(sockets=sockets)
+
+
+class Worker:
+    def __init__(self, config: uvicorn.Config, sockets: List[socket.socket]) -> None:
+        self.ready = spawn.Event()
+        self.process = spawn.Process(target=run_worker, args=(config, sockets, self.ready), daemon=False)
+    
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid
+    
+    def start(self) -> None:
+        self.process.start()
+    
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+    
+    def drain(self) -> None:
+        if self.process.is_alive():
+            # uvicorn treats SIGTERM as a graceful shutdown
+            self.process.terminate()
+
+
+def worker_config(
+        *,
+        host: str,
+        port: int,
+        graceful_timeout: int,
+        access_log: bool = False,
+        log_level: str = "info",
+        app: str = ASGI_APP,
+) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        lifespan="on",
+        access_log=access_log,
+        log_level=log_level,
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, *, workers: int, graceful_timeout: float) -> None:
+        self.config = config
+        self.worker_count = workers
+        self.graceful_timeout = graceful_timeout
+        self.sockets: List[socket.socket] = []
+        self.workers: List[Worker] = []
+        self.signals: List[int] = []
+        self.wakeup = threading.Event()
+    
+    def handle_signal(self, sig: int, frame) -> None:
+        self.signals.append(sig)
+        self.wakeup.set()
+    
+    def install_signal_handlers(self) -> None:
+        for sig in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, self.handle_signal)
+    
+    def start_workers(self, count: int) -> Optional[List[Worker]]:
+        """
+        Start workers and wait until all of them accept connections, None if any of them failed to start
+        """
+        workers = [Worker(self.config, self.sockets) for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while not all(worker.ready.is_set() for worker in workers):
+            if time.monotonic() > deadline or any(
+                    not worker.is_alive() and not worker.ready.is_set() for worker in workers
+            ):
+                self.stop_workers(workers)
+                return None
+            time.sleep(0.05)
+        return workers
+    
+    def stop_workers(self, workers: List[Worker]) -> None:
+        for worker in workers:
+            worker.drain()
+        
+        # uvicorn gives up on open connections after the graceful timeout, the grace period covers the rest
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        for worker in workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                logger.warning("Worker %s did not stop in time, killing it", worker.pid)
+                worker.process.kill()
+                worker.process.join()
+    
+    def reload(self) -> None:
+        logger.info("Reloading %s workers", self.worker_count)
+        new_workers = self.start_workers(self.worker_count)
+        if new_workers is None:
+            # e.g. the new code does not import, the old workers keep serving
+            logger.error("New workers failed to start, keeping the running ones")
+            return
+        
+        old_workers, self.workers = self.workers, new_workers
+        self.stop_workers(old_workers)
+        logger.info("Reloaded, serving with workers %s", [worker.pid for worker in self.workers])
+    
+    def replace_dead_workers(self) -> None:
+        for index, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            
+            logger.warning("Worker %s exited with code %s, starting a new one", worker.pid, worker.process.exitcode)
+            new_workers = self.start_workers(1)
+            if new_workers is not None:
+                self.workers[index] = new_workers[0]
+    
+    def run(self) -> int:
+        self.config.configure_logging()
+        self.sockets = [self.config.bind_socket()]
+        logger.info("Supervisor %s starting %s workers", os.getpid(), self.worker_count)
+        
+        self.install_signal_handlers()
+        workers = self.start_workers(self.worker_count)
+        if workers is None:
+            logger.error("Workers failed to start")
+            return 1
+        self.workers = workers
+        
+        try:
+            while True:
+                self.wakeup.wait(SUPERVISE_INTERVAL)
+                self.wakeup.clear()
+                
+                while self.signals:
+                    sig = self.signals.pop(0)
+                    if sig == signal.SIGHUP:
+                        self.reload()
+                    else:
+                        logger.info("Draining %s workers", len(self.workers))
+                        self.stop_workers(self.workers)
+                        return 0
+                
+                self.replace_dead_workers()
+        finally:
+            for sock in self.sockets:
+                sock.close()
@@ -1,18 +1,50 @@
 from typing import Callable
 from fastapi import FastAPI
 
+from app.core.profiling import startup_profile
+from app.db.archiver import start_task_archiver
+from app.db.cache import create_task_cache
+from app.db.events import start_task_events
+from app.db.idempotency import create_idempotent_requests
+from app.db.migrator import start_task_migrator
+from app.db.scheduler import start_task_scheduler
+from app.db.singleflight import create_task_reads
 from app.db.tasks import connect_to_db, close_db_connection
 
 
 def create_start_app_handler(app: FastAPI) -> Callable:
     async def start_app() -> None:
-        await connect_to_db(app)
+        with startup_profile.phase("startup"):
+            await connect_to_db(app)
+            # set before the first request, repositories look up task ids by what the migration left to do
+            app.task_migrator = start_task_migrator(app)
+            app.task_cache = create_task_cache()
+            app.task_reads = create_task_reads()
+            with startup_profile.phase("task events"):
+                app.task_events = await start_task_events(app.database)
+            with startup_profile.phase("idempotency keys"):
+                app.idempotency = await create_idempotent_requests(app.database, app.metrics)
+            app.task_archiver = start_task_archiver(app)
+            app.task_scheduler = start_task_scheduler(app)
+        startup_profile.log()
     
     return start_app
 
 
 def create_stop_app_handler(app: FastAPI) -> Callable:
     async def stop_app() -> None:
+        if app.task_scheduler is not None:
+            await app.task_scheduler.close()
+        if app.task_archiver is not None:
+            await app.task_archiver.close()
+        if app.task_migrator is not None:
+            await app.task_migrator.close()
+        await app.task_events.close()
+        await app.idempotency.store.close()
+        if app.task_cache is not None:
+            await app.task_cache.close()
+        if app.rate_limits is not None:
+            await app.rate_limits.close()
         await close_db_connection(app)
     
     return stop_app
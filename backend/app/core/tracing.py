@@ -0,0 +1,91 @@
+"""
+Sampled request traces, a request that is not sampled costs one random draw and a context variable lookup per span.
+"""
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: float
+    attributes: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    name: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    start: float = field(default_factory=time.perf_counter)
+    duration: float = 0.0
+    attributes: Dict[str, str] = field(default_factory=dict)
+    spans: List[Span] = field(default_factory=list)
+    
+    def add_span(self, name: str, start: float, duration: float, **attributes: str) -> None:
+        # list.append is atomic, driver threads may add spans while the request is running
+        self.spans.append(Span(name, start - self.start, duration, attributes))
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: str) -> Iterator[None]:
+    """
+    Time a block as part of the current trace, does nothing when the request is not sampled
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, start, time.perf_counter() - start, **attributes)
+
+
+def log_trace(trace: Trace) -> None:
+    spans = ", ".join(f"{s.name}={1000 * s.duration:.2f}ms" for s in trace.spans)
+    logger.debug("trace %s %s %.2fms [%s]", trace.trace_id, trace.name, 1000 * trace.duration, spans)
+
+
+class Tracer:
+    """
+    Samples a share of requests and hands their finished traces to hooks, e.g. an exporter
+    """
+    
+    def __init__(self, sample_rate: float, hooks: Optional[List[Callable[[Trace], None]]] = None) -> None:
+        self.sample_rate = sample_rate
+        self.hooks = [log_trace] if hooks is None else hooks
+        self.random = random.random
+    
+    def add_hook(self, hook: Callable[[Trace], None]) -> None:
+        self.hooks.append(hook)
+    
+    def start(self, name: str, **attributes: str) -> Optional[Trace]:
+        if self.sample_rate <= 0 or self.random() >= self.sample_rate:
+            return None
+        
+        trace = Trace(name, attributes=attributes)
+        current_trace.set(trace)
+        return trace
+    
+    def finish(self, trace: Trace) -> None:
+        trace.duration = time.perf_counter() - trace.start
+        current_trace.set(None)
+        for hook in self.hooks:
+            try:
+                hook(trace)
+            except Exception:
+                logger.exception("Trace hook %r failed", hook)
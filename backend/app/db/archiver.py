@@ -0,0 +1,74 @@
+"""
+Background task that keeps the tasks collection small by archiving old completed and cancelled tasks.
+
+Every worker process runs one. Archiving the same tasks twice only repeats work, so workers need no coordination.
+"""
+import asyncio
+import logging
+import random
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import FastAPI
+from pymongo.errors import PyMongoError
+
+from app.core.config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_ENABLED, ARCHIVE_INTERVAL_SECONDS
+from app.db.repositories.tasks import TaskRepository
+from app.models.core import datetime_now
+
+logger = logging.getLogger(__name__)
+
+
+class TaskArchiver:
+    def __init__(self, app: FastAPI, *, archive_after: timedelta, interval: float, batch_size: int) -> None:
+        self.app = app
+        self.archive_after = archive_after
+        self.interval = interval
+        self.batch_size = batch_size
+        self.archived = app.metrics.counter("tasks_archived_total", "Tasks moved to the archive by the archiver")
+        self.runner: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        self.runner = asyncio.create_task(self.run())
+    
+    async def run(self) -> None:
+        # workers started together should not all archive at the same moment
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            try:
+                await self.archive_once()
+            except PyMongoError as e:
+                logger.warning("Archiving tasks failed, retrying in %ss: %s", self.interval, e)
+            await asyncio.sleep(self.interval)
+    
+    async def archive_once(self) -> int:
+        task_repo = TaskRepository(self.app.database, app=self.app)
+        count = await task_repo.archive_tasks(
+            updated_before=datetime_now() - self.archive_after, batch_size=self.batch_size,
+        )
+        self.archived.inc(count)
+        if count:
+            logger.info("Archived %s tasks", count)
+        return count
+    
+    async def close(self) -> None:
+        if self.runner is not None:
+            self.runner.cancel()
+            try:
+                await self.runner
+            except asyncio.CancelledError:
+                pass
+
+
+def start_task_archiver(app: FastAPI) -> Optional[TaskArchiver]:
+    if not ARCHIVE_ENABLED:
+        return None
+    
+    archiver = TaskArchiver(
+        app,
+        archive_after=timedelta(days=ARCHIVE_AFTER_DAYS),
+        interval=ARCHIVE_INTERVAL_SECONDS,
+        batch_size=ARCHIVE_BATCH_SIZE,
+    )
+    archiver.start()
+    return archiver
@@ -0,0 +1,247 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.config import TASK_CACHE_BACKEND, TASK_CACHE_MAX_SIZE, TASK_CACHE_TTL, TASK_CACHE_URL
+from app.models.task import TaskPublic
+
+
+# writes remembered to turn away fills by reads that started before them, only reads still in flight need them
+WRITES_REMEMBERED = 10000
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class TaskCache(ABC):
+    """
+    Read-through cache of tasks keyed by id, kept up to date by TaskRepository writes.
+    
+    A read can get a task from MongoDB, then a write through this process updates or deletes it, and only then the
+    read fills the cache. fill turns such a read away, set and delete count as writes. Writes by other processes
+    reach a shared level by delete, a read of this process filling it in between is not caught.
+    """
+    
+    def __init__(self) -> None:
+        self.stats = CacheStats()
+        # position of the last write in the sequence of writes by task id, oldest first
+        self.sequence = 0
+        self.written: OrderedDict[str, int] = OrderedDict()
+        # position of the last write no longer in written, which could have been to any task
+        self.forgotten = 0
+    
+    def start_read(self) -> int:
+        """
+        Position in the sequence of writes before a read of MongoDB, to pass to fill
+        """
+        return self.sequence
+    
+    def record_write(self, task_id: str) -> None:
+        self.sequence += 1
+        self.written[task_id] = self.sequence
+        self.written.move_to_end(task_id)
+        if len(self.written) > WRITES_REMEMBERED:
+            _, self.forgotten = self.written.popitem(last=False)
+    
+    async def fill(self, task: TaskPublic, read_started: int) -> bool:
+        """
+        Cache a task read from MongoDB, unless it was written since the read started, which may have missed the write
+        """
+        if self.written.get(str(task.id), self.forgotten) > read_started:
+            return False
+        await self.set(task)
+        return True
+    
+    @abstractmethod
+    async def get(self, task_id: str) -> Optional[TaskPublic]:
+        ...
+    
+    @abstractmethod
+    async def set(self, task: TaskPublic) -> None:
+        ...
+    
+    @abstractmethod
+    async def delete(self, task_id: str) -> None:
+        ...
+    
+    async def close(self) -> None:
+        pass
+
+
+class LRUTaskCache(TaskCache):
+    """
+    Bounded in-process cache, drops the least recently used task when full and any task older than ttl seconds
+    """
+    
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries: OrderedDict[str, Tuple[float, TaskPublic]] = OrderedDict()
+    
+    async def get(self, task_id: str) -> Optional[TaskPublic]:
+        if (entry := self.entries.get(task_id)) is None:
+            self.stats.misses += 1
+            return None
+        
+        expires_at, task = entry
+        if expires_at <= self.clock():
+            del self.entries[task_id]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        
+        self.entries.move_to_end(task_id)
+        self.stats.hits += 1
+        return task
+    
+    async def set(self, task: TaskPublic) -> None:
+        task_id = str(task.id)
+        self.record_write(task_id)
+        self.entries[task_id] = (self.clock() + self.ttl, task)
+        self.entries.move_to_end(task_id)
+        
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.stats.evictions += 1
+    
+    async def delete(self, task_id: str) -> None:
+        self.record_write(task_id)
+        self.entries.pop(task_id, None)
+
+
+class SharedCacheBackend(ABC):
+    """
+    Key-value store shared between app processes, values are serialized tasks
+    """
+    
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+    
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+    
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+    
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryCacheBackend(SharedCacheBackend):
+    """
+    Stand-in for a shared store when there is only one process, e.g. in tests
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.values: Dict[str, Tuple[float, bytes]] = {}
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        if (entry := self.values.get(key)) is None:
+            return None
+        
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self.values[key]
+            return None
+        
+        return value
+    
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.values[key] = (self.clock() + ttl, value)
+    
+    async def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+
+class RedisCacheBackend(SharedCacheBackend):
+    def __init__(self, url: str) -> None:
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("TASK_CACHE_BACKEND=redis requires the redis package") from e
+        
+        self.redis = redis.from_url(url)
+    
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(key)
+    
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.redis.set(key, value, px=int(ttl * 1000))
+    
+    async def delete(self, key: str) -> None:
+        await self.redis.delete(key)
+    
+    async def close(self) -> None:
+        await self.redis.close()
+
+
+class SharedTaskCache(TaskCache):
+    """
+    Two level cache: a small in-process LRU in front of a backend shared by every app process.
+    
+    Writes from other processes only reach the shared level, so the local level keeps a short ttl.
+    """
+    
+    key_prefix = "task:"
+    
+    def __init__(self, backend: SharedCacheBackend, local: LRUTaskCache, ttl: float) -> None:
+        super().__init__()
+        self.backend = backend
+        self.local = local
+        self.ttl = ttl
+        self.stats = local.stats
+    
+    async def get(self, task_id: str) -> Optional[TaskPublic]:
+        if (task := await self.local.get(task_id)) is not None:
+            return task
+        
+        if (value := await self.backend.get(self.key_prefix + task_id)) is None:
+            return None
+        
+        # the local level already counted a miss, turn it into a hit
+        self.stats.misses -= 1
+        self.stats.hits += 1
+        task = TaskPublic.model_validate_json(value)
+        await self.local.set(task)
+        return task
+    
+    async def set(self, task: TaskPublic) -> None:
+        self.record_write(str(task.id))
+        await self.local.set(task)
+        await self.backend.set(self.key_prefix + str(task.id), task.model_dump_json(by_alias=True).encode(), self.ttl)
+    
+    async def delete(self, task_id: str) -> None:
+        self.record_write(task_id)
+        await self.local.delete(task_id)
+        await self.backend.delete(self.key_prefix + task_id)
+    
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def create_task_cache() -> Optional[TaskCache]:
+    if TASK_CACHE_BACKEND == "none":
+        return None
+    
+    local = LRUTaskCache(max_size=TASK_CACHE_MAX_SIZE, ttl=TASK_CACHE_TTL)
+    if TASK_CACHE_BACKEND == "local":
+        return local
+    if TASK_CACHE_BACKEND == "redis":
+        # keep the local level brief, it is not invalidated by writes from other processes
+        local.ttl = min(TASK_CACHE_TTL, 1.0)
+        return SharedTaskCache(RedisCacheBackend(TASK_CACHE_URL), local=local, ttl=TASK_CACHE_TTL)
+    
+    raise ValueError(f"Unknown TASK_CACHE_BACKEND: {TASK_CACHE_BACKEND}")
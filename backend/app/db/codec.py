@@ -0,0 +1,103 @@
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Collection, Dict, List, Optional
+
+from app.models.core import to_local_datetime
+from app.models.task import TASK_SCHEMA_VERSION, PartialTask, TaskInDB, TaskPublic
+
+# document key of every stored task field, the id is stored as the document's _id
+TASK_FIELD_KEYS = {name: field.alias or name for name, field in TaskInDB.model_fields.items()}
+# document key of every field a projection can select, including those only archived tasks have
+PARTIAL_TASK_FIELD_KEYS = {name: field.alias or name for name, field in PartialTask.model_fields.items()}
+# document keys the scheduler keeps on tasks with reminders or due dates, they are not task fields
+SCHEDULE_KEYS = {"next_fire_at", "lease", "fired", "last_fired"}
+
+
+def parse_task_id(task_id: Any) -> Optional[uuid.UUID]:
+    """
+    Task ids arrive as strings from the API, anything that is not a UUID cannot match a task
+    """
+    if isinstance(task_id, uuid.UUID):
+        return task_id
+    try:
+        return uuid.UUID(str(task_id))
+    except ValueError:
+        return None
+
+
+def task_id_condition(*ids: uuid.UUID) -> Dict[str, List[Any]]:
+    """
+    _id condition matching the given tasks, also those of version 1 documents, which may hold their id as a string
+    """
+    return {"$in": [*ids, *(str(id) for id in ids)]}
+
+
+def upgrade_v1(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ids and timestamps that jsonable_encoder stored as strings become native UUID and datetime values
+    """
+    if isinstance(id := document.get("_id"), str):
+        document["_id"] = uuid.UUID(id)
+    for key in ("updated", "due_at", "remind_at"):
+        if isinstance(value := document.get(key), str):
+            document[key] = to_local_datetime(datetime.fromisoformat(value))
+    return document
+
+
+# turns a document of each schema version into one of the next version, documents without schema_version are 1
+TASK_UPGRADERS: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {1: upgrade_v1}
+
+
+def upgrade_task(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The document as the current schema version stores it, a document already of that version is returned as is.
+    
+    So is one of a newer version, written by a newer release during a rolling deploy.
+    """
+    version = document.get("schema_version", 1)
+    if version >= TASK_SCHEMA_VERSION:
+        return document
+    
+    document = dict(document)
+    while version < TASK_SCHEMA_VERSION:
+        document = TASK_UPGRADERS[version](document)
+        version += 1
+    document["schema_version"] = version
+    return document
+
+
+def encode_value(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def encode_task(task: TaskInDB) -> Dict[str, Any]:
+    """
+    BSON document of a task, ids and timestamps are stored as native UUID and datetime values
+    """
+    return {key: encode_value(getattr(task, name)) for name, key in TASK_FIELD_KEYS.items()}
+
+
+def encode_task_update(update_data: Dict[str, Any]) -> Dict[str, Any]:
+    return {TASK_FIELD_KEYS[name]: encode_value(value) for name, value in update_data.items()}
+
+
+def decode_task(document: Dict[str, Any]) -> TaskPublic:
+    """
+    Build a task from a document, native BSON types validate in pydantic-core without conversions in Python.
+    
+    This is measurably cheaper than model_construct, which copies fields one by one in Python.
+    """
+    return TaskPublic.model_validate(upgrade_task(document))
+
+
+def task_projection(fields: Collection[str]) -> Dict[str, int]:
+    """
+    MongoDB projection of the named task fields, the _id is left out unless the id is one of them
+    """
+    # the schema version tells whether the fields need an upgrade
+    return {"_id": 0, "schema_version": 1, **{PARTIAL_TASK_FIELD_KEYS[name]: 1 for name in fields}}
+
+
+def decode_partial_task(document: Dict[str, Any]) -> PartialTask:
+    return PartialTask.model_validate(upgrade_task(document))
@@ -0,0 +1,249 @@
+"""
+Feed of task changes for clients that would otherwise poll the task list.
+
+On a replica set the feed follows a MongoDB change stream, so writes by every process show up.
+Otherwise TaskRepository publishes its own writes, which only covers this process.
+"""
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.core.config import TASK_EVENTS_BUFFER_SIZE, TASK_EVENTS_QUEUE_SIZE, TASK_EVENTS_SOURCE
+from app.db.codec import SCHEDULE_KEYS, decode_task
+from app.db.repositories.schedule import fired_job
+from app.db.storage import Database
+from app.models.task import TaskEvent, TaskEventType, TaskPublic
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_HISTORY_LOST = 286
+
+CHANGE_EVENT_TYPES = {
+    "insert": TaskEventType.created,
+    "update": TaskEventType.updated,
+    "replace": TaskEventType.updated,
+    "delete": TaskEventType.deleted,
+}
+
+
+class Subscription:
+    """
+    Bounded queue of events for one client, ends instead of growing when the client falls behind
+    """
+    
+    def __init__(self, queue_size: int, tenant: Optional[str] = None) -> None:
+        self.queue_size = queue_size
+        # the tenant whose events the client gets, None for the events of every tenant
+        self.tenant = tenant
+        # one slot more than queue_size, so the end marker always fits
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size + 1)
+        self.ended = False
+    
+    def wants(self, event: TaskEvent) -> bool:
+        if self.tenant is None or event.tenant == self.tenant:
+            return True
+        # a reset concerns every client. Other events without a tenant, deletes of an unsharded collection without
+        # pre-images, could be any tenant's, and are left out rather than shown to every tenant.
+        return event.tenant is None and event.type == TaskEventType.reset
+    
+    def push(self, event: TaskEvent) -> bool:
+        if self.ended:
+            return False
+        if self.queue.qsize() >= self.queue_size:
+            # the client reconnects with the id of the last event it got and replays the rest from the buffer
+            self.end()
+            return False
+        
+        self.queue.put_nowait(event)
+        return True
+    
+    def end(self) -> None:
+        if not self.ended:
+            self.ended = True
+            self.queue.put_nowait(None)
+    
+    async def get(self) -> Optional[TaskEvent]:
+        """
+        Next event, None once the subscription ended
+        """
+        return await self.queue.get()
+
+
+class TaskEventBus:
+    def __init__(self, buffer_size: int = TASK_EVENTS_BUFFER_SIZE, queue_size: int = TASK_EVENTS_QUEUE_SIZE) -> None:
+        self.buffer: Deque[TaskEvent] = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscribers: Set[Subscription] = set()
+        # ids from another process or an earlier run are unknown here and lead to a reset
+        self.id_prefix = uuid.uuid4().hex[:12]
+        self.sequence = 0
+        # whether TaskRepository should publish its writes, off while a change stream feeds the bus
+        self.publishes_writes = True
+        # whether change events carry the task as it was before, which tells whose task a delete removed
+        self.pre_images = False
+        self.watcher: Optional[asyncio.Task] = None
+    
+    def publish(self, event: TaskEvent) -> None:
+        if event.id is None:
+            self.sequence += 1
+            event.id = f"{self.id_prefix}-{self.sequence}"
+        
+        self.buffer.append(event)
+        for subscription in list(self.subscribers):
+            if subscription.wants(event) and not subscription.push(event):
+                self.subscribers.discard(subscription)
+    
+    def publish_write(
+            self, type: TaskEventType, task_id: Any, task: Optional[TaskPublic] = None, tenant: Optional[str] = None
+    ) -> None:
+        if self.publishes_writes:
+            tenant = task.tenant if task is not None else tenant
+            self.publish(TaskEvent(type=type, task_id=str(task_id), task=task, tenant=tenant))
+    
+    def reset_event(self) -> TaskEvent:
+        return TaskEvent(id=self.buffer[-1].id if self.buffer else None, type=TaskEventType.reset)
+    
+    def events_after(self, event_id: str) -> Optional[List[TaskEvent]]:
+        """
+        Buffered events newer than event_id, None if event_id is no longer or never was buffered
+        """
+        missed = []
+        for event in reversed(self.buffer):
+            if event.id == event_id:
+                missed.reverse()
+                return missed
+            missed.append(event)
+        return None
+    
+    def subscribe(self, resume_after: Optional[str] = None, tenant: Optional[str] = None) -> Subscription:
+        subscription = Subscription(self.queue_size, tenant)
+        
+        if resume_after is not None:
+            missed = self.events_after(resume_after)
+            if missed is None:
+                subscription.push(self.reset_event())
+            for event in missed or []:
+                if subscription.wants(event) and not subscription.push(event):
+                    # more was missed than fits the queue, the client catches up over several connections
+                    return subscription
+        
+        self.subscribers.add(subscription)
+        return subscription
+    
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self.subscribers.discard(subscription)
+    
+    def follow(self, collection: AsyncIOMotorCollection, pre_images: bool = False) -> None:
+        self.publishes_writes = False
+        self.pre_images = pre_images
+        self.watcher = asyncio.create_task(self.watch(collection))
+    
+    async def watch(self, collection: AsyncIOMotorCollection) -> None:
+        resume_token = None
+        while True:
+            try:
+                async with collection.watch(
+                        full_document="updateLookup",
+                        full_document_before_change="whenAvailable" if self.pre_images else None,
+                        resume_after=resume_token,
+                ) as stream:
+                    async for change in stream:
+                        resume_token = change["_id"]
+                        if (event := change_event(change)) is not None:
+                            self.publish(event)
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code != CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Task change stream failed, resuming: %s", e)
+                else:
+                    logger.warning("Task change stream fell behind the oplog, clients will reload")
+                    resume_token = None
+                    self.publish(TaskEvent(type=TaskEventType.reset))
+            except PyMongoError as e:
+                logger.warning("Task change stream failed, resuming: %s", e)
+            await asyncio.sleep(1)
+    
+    async def close(self) -> None:
+        if self.watcher is not None:
+            self.watcher.cancel()
+            try:
+                await self.watcher
+            except asyncio.CancelledError:
+                pass
+        
+        for subscription in self.subscribers:
+            subscription.end()
+        self.subscribers.clear()
+
+
+def change_event(change: Dict[str, Any]) -> Optional[TaskEvent]:
+    """
+    Event of a change to the tasks collection, None for the scheduler's leases that change no task
+    """
+    event_id = change["_id"]["_data"]
+    type = CHANGE_EVENT_TYPES.get(change["operationType"])
+    if type is None:
+        # drop, rename or invalidate of the collection
+        return TaskEvent(id=event_id, type=TaskEventType.reset)
+    
+    if type == TaskEventType.updated and "updateDescription" in change:
+        updated_fields = change["updateDescription"].get("updatedFields", {})
+        removed_fields = change["updateDescription"].get("removedFields", [])
+        if {key.partition(".")[0] for key in [*updated_fields, *removed_fields]} <= SCHEDULE_KEYS:
+            if (kind := fired_job(updated_fields)) is None:
+                return None
+            type = TaskEventType(kind.value)
+    
+    document = change.get("fullDocument")
+    # deletes have no document, but their pre-image, or the key of a collection sharded by tenant, holds the tenant
+    tenant = (document or change.get("fullDocumentBeforeChange") or change["documentKey"]).get("tenant")
+    return TaskEvent(
+        id=event_id,
+        type=type,
+        task_id=str(change["documentKey"]["_id"]),
+        task=decode_task(document) if document is not None else None,
+        tenant=tenant,
+    )
+
+
+async def supports_change_streams(database: Database) -> bool:
+    """
+    Change streams need a replica set or a sharded cluster
+    """
+    try:
+        hello = await database.command("hello")
+    except PyMongoError:
+        return False
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def enable_pre_images(database: Database) -> bool:
+    """
+    Have MongoDB keep the version of a task before each change for change streams, needs MongoDB 6.0
+    """
+    try:
+        await database.command("collMod", "tasks", changeStreamPreAndPostImages={"enabled": True})
+    except PyMongoError as e:
+        logger.warning("Task change stream pre-images are unavailable, deletes will be left out of live updates: %s", e)
+        return False
+    return True
+
+
+async def start_task_events(database: Database) -> TaskEventBus:
+    if TASK_EVENTS_SOURCE not in ("auto", "changestream", "local"):
+        raise ValueError(f"Unknown TASK_EVENTS_SOURCE: {TASK_EVENTS_SOURCE}")
+    
+    bus = TaskEventBus()
+    if TASK_EVENTS_SOURCE == "changestream" or (
+            TASK_EVENTS_SOURCE == "auto" and await supports_change_streams(database)
+    ):
+        bus.follow(database.get_collection("tasks"), pre_images=await enable_pre_images(database))
+    
+    logger.info("Task events come from %s", "this process" if bus.publishes_writes else "the change stream")
+    return bus
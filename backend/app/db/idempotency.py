@@ -0,0 +1,274 @@
+"""
+Idempotency-Key support: the first response to a key is stored and returned again for retries of the same request.
+
+A key is claimed before the request runs, so two processes never both run it. Duplicates arriving at the process
+running the first request wait for its response, duplicates arriving elsewhere get 409 until it is stored.
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from starlette.status import HTTP_409_CONFLICT, HTTP_422_UNPROCESSABLE_ENTITY
+
+from app.core.config import IDEMPOTENCY_BACKEND, IDEMPOTENCY_LOCK_SECONDS, IDEMPOTENCY_TTL_SECONDS
+from app.core.metrics import MetricsRegistry
+from app.db.storage import Database
+from app.models.core import datetime_now
+
+logger = logging.getLogger(__name__)
+
+# headers of the first response that replays repeat, others such as Date describe the replay itself
+STORED_HEADERS = {"content-type", "etag", "location"}
+
+IDEMPOTENCY_INDEXES = [
+    # drops keys once expired, MongoDB checks for expired documents about once a minute
+    IndexModel([("expires", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+]
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    
+    @classmethod
+    def from_response(cls, response: Response) -> "StoredResponse":
+        headers = [(name, value) for name, value in response.headers.items() if name in STORED_HEADERS]
+        return cls(response.status_code, bytes(response.body), headers)
+    
+    def replay(self) -> Response:
+        response = Response(self.body, status_code=self.status_code, headers=dict(self.headers))
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+
+
+@dataclass
+class IdempotencyRecord:
+    fingerprint: str
+    # None while the request that claimed the key is still running
+    response: Optional[StoredResponse] = None
+
+
+class IdempotencyStore(ABC):
+    """
+    Records of idempotency keys, each either claimed by a running request or holding its response
+    """
+    
+    @abstractmethod
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float) -> Optional[IdempotencyRecord]:
+        """
+        Claim key for a request for lock_seconds, None if claimed, otherwise the record already stored for key.
+        
+        A claim that expired, e.g. because the process holding it died, is taken over.
+        """
+    
+    @abstractmethod
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse, ttl: float) -> None:
+        """
+        Store the response of the request that claimed key, replayed for ttl seconds
+        """
+    
+    @abstractmethod
+    async def release(self, key: str) -> None:
+        """
+        Give up the claim of a request that failed, so a retry runs it again
+        """
+    
+    async def create_indexes(self) -> None:
+        pass
+    
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """
+    Keys of this process only, for a single worker or when clients retry against the same process
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self.clock = clock
+        self.records: OrderedDict[str, Tuple[float, IdempotencyRecord]] = OrderedDict()
+    
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float) -> Optional[IdempotencyRecord]:
+        now = self.clock()
+        self.purge(now)
+        if (entry := self.records.get(key)) is not None and entry[0] > now:
+            return entry[1]
+        
+        self.records[key] = (now + lock_seconds, IdempotencyRecord(fingerprint))
+        return None
+    
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse, ttl: float) -> None:
+        self.records[key] = (self.clock() + ttl, IdempotencyRecord(fingerprint, response))
+        self.records.move_to_end(key)
+    
+    async def release(self, key: str) -> None:
+        self.records.pop(key, None)
+    
+    def purge(self, now: float) -> None:
+        # records are kept in the order they were last written, so most expired ones are found at the front
+        while self.records and next(iter(self.records.values()))[0] <= now:
+            self.records.popitem(last=False)
+
+
+class MongoIdempotencyStore(IdempotencyStore):
+    """
+    Keys in the idempotency_keys collection, shared by every app process and purged by a TTL index
+    """
+    
+    def __init__(self, db: Database) -> None:
+        self.collection = db.get_collection("idempotency_keys")
+    
+    async def create_indexes(self) -> None:
+        await self.collection.create_indexes(IDEMPOTENCY_INDEXES)
+    
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float) -> Optional[IdempotencyRecord]:
+        now = datetime_now()
+        claim = {"fingerprint": fingerprint, "response": None, "expires": now + timedelta(seconds=lock_seconds)}
+        try:
+            # matches only an expired record, otherwise upserting collides with the record on _id
+            await self.collection.update_one({"_id": key, "expires": {"$lt": now}}, {"$set": claim}, upsert=True)
+            return None
+        except DuplicateKeyError:
+            pass
+        
+        if (document := await self.collection.find_one({"_id": key})) is None:
+            # purged between the two commands, the next retry claims it
+            return IdempotencyRecord(fingerprint)
+        return self.decode(document)
+    
+    async def complete(self, key: str, fingerprint: str, response: StoredResponse, ttl: float) -> None:
+        document = {
+            "fingerprint": fingerprint,
+            "response": {
+                "status_code": response.status_code,
+                "body": response.body,
+                "headers": [list(header) for header in response.headers],
+            },
+            "expires": datetime_now() + timedelta(seconds=ttl),
+        }
+        await self.collection.replace_one({"_id": key}, document, upsert=True)
+    
+    async def release(self, key: str) -> None:
+        await self.collection.delete_one({"_id": key, "response": None})
+    
+    @staticmethod
+    def decode(document: Dict[str, Any]) -> IdempotencyRecord:
+        if (response := document.get("response")) is None:
+            return IdempotencyRecord(document["fingerprint"])
+        
+        return IdempotencyRecord(
+            document["fingerprint"],
+            StoredResponse(
+                response["status_code"], bytes(response["body"]), [tuple(header) for header in response["headers"]],
+            ),
+        )
+
+
+class IdempotentRequests:
+    """
+    Runs a request once per idempotency key and answers repeats of it with the stored response
+    """
+    
+    def __init__(self, store: IdempotencyStore, registry: MetricsRegistry, *, ttl: float, lock_seconds: float) -> None:
+        self.store = store
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        # requests of this process still running, by key, with the fingerprint they were claimed with
+        self.running: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.requests = registry.counter(
+            "idempotent_requests_total", "Requests with an Idempotency-Key by how they were answered", ("result",),
+        )
+    
+    async def run(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[Response]]) -> Response:
+        if (running := self.running.get(key)) is not None:
+            claimed_fingerprint, future = running
+            self.check_fingerprint(claimed_fingerprint, fingerprint)
+            self.requests.labels("coalesced").inc()
+            # shielded so a client disconnecting while it waits does not cancel the shared future
+            return (await asyncio.shield(future)).replay()
+        
+        # registered before claiming the key, so duplicates arriving meanwhile wait here instead of getting 409
+        future = asyncio.get_running_loop().create_future()
+        self.running[key] = (fingerprint, future)
+        try:
+            response = await self.run_once(key, fingerprint, handler)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved here, so the exception is not reported as unhandled when no duplicate was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(StoredResponse.from_response(response))
+            return response
+        finally:
+            del self.running[key]
+    
+    async def run_once(self, key: str, fingerprint: str, handler: Callable[[], Awaitable[Response]]) -> Response:
+        if (record := await self.store.claim(key, fingerprint, self.lock_seconds)) is not None:
+            self.check_fingerprint(record.fingerprint, fingerprint)
+            if record.response is None:
+                self.requests.labels("in_progress").inc()
+                raise HTTPException(
+                    HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress",
+                    headers={"Retry-After": "1"},
+                )
+            self.requests.labels("replayed").inc()
+            return record.response.replay()
+        
+        try:
+            response = await handler()
+        except BaseException:
+            await self.release(key)
+            raise
+        
+        self.requests.labels("first").inc()
+        # stored before the key stops counting as running, a duplicate must not find it still claimed
+        await self.complete(key, fingerprint, StoredResponse.from_response(response))
+        return response
+    
+    async def complete(self, key: str, fingerprint: str, stored: StoredResponse) -> None:
+        try:
+            await self.store.complete(key, fingerprint, stored, self.ttl)
+        except PyMongoError as e:
+            # the request already succeeded, failing it now would make the client retry a completed write
+            logger.warning("Storing the response for an Idempotency-Key failed: %s", e)
+    
+    async def release(self, key: str) -> None:
+        try:
+            await self.store.release(key)
+        except PyMongoError as e:
+            logger.warning("Releasing an Idempotency-Key failed, it stays claimed until the claim expires: %s", e)
+    
+    def check_fingerprint(self, claimed_fingerprint: str, fingerprint: str) -> None:
+        if claimed_fingerprint != fingerprint:
+            self.requests.labels("mismatch").inc()
+            raise HTTPException(
+                HTTP_422_UNPROCESSABLE_ENTITY, detail="Idempotency-Key was already used for a different request",
+            )
+
+
+async def create_idempotent_requests(db: Database, registry: MetricsRegistry) -> IdempotentRequests:
+    if IDEMPOTENCY_BACKEND == "local":
+        store = InMemoryIdempotencyStore()
+    elif IDEMPOTENCY_BACKEND == "mongo":
+        store = MongoIdempotencyStore(db)
+    else:
+        raise ValueError(f"Unknown IDEMPOTENCY_BACKEND: {IDEMPOTENCY_BACKEND}")
+    
+    await store.create_indexes()
+    return IdempotentRequests(store, registry, ttl=IDEMPOTENCY_TTL_SECONDS, lock_seconds=IDEMPOTENCY_LOCK_SECONDS)
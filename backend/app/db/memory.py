@@ -0,0 +1,916 @@
+"""
+In-memory backend implementing the storage protocol of app.db.storage, for tests and benchmarks without MongoDB.
+
+Documents live in plain dicts and every operation completes without awaiting anything, which
+also makes each one atomic with respect to other coroutines, like a single document write in MongoDB.
+Indexes created by the repositories are kept as sorted lists, so keyed reads and pages do not scan every document.
+"""
+import bisect
+import re
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, TEXT, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from app.db.search import InvertedIndex
+
+DUPLICATE_KEY_ERROR = 11000
+INDEX_NOT_FOUND = 27
+
+MISSING = object()
+
+# sorts after every index key, whose first element is a type rank
+HIGHEST = (100,)
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+# databases by URL, clients connecting to the same URL share them like clients of one MongoDB server
+SERVERS: Dict[str, Dict[str, "InMemoryDatabase"]] = {}
+
+
+def type_rank(value: Any) -> int:
+    """
+    Position of a value's type in MongoDB's comparison order
+    """
+    if value is None or value is MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, list):
+        return 5
+    if isinstance(value, (bytes, uuid.UUID)):
+        return 6
+    if isinstance(value, datetime):
+        return 9
+    return 7
+
+
+def sort_key(value: Any) -> Tuple[int, Any]:
+    rank = type_rank(value)
+    return (rank, None) if rank == 1 else (rank, value)
+
+
+def copy_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: copy_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [copy_value(v) for v in value]
+    return value
+
+
+def get_path(document: Dict[str, Any], path: str) -> Any:
+    value = document
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def set_path(document: Dict[str, Any], path: str, value: Any) -> None:
+    *parents, key = path.split(".")
+    for parent in parents:
+        document = document.setdefault(parent, {})
+    document[key] = value
+
+
+def unset_path(document: Dict[str, Any], path: str) -> None:
+    *parents, key = path.split(".")
+    for parent in parents:
+        if not isinstance(document := document.get(parent), dict):
+            return
+    document.pop(key, None)
+
+
+# Python types of the $type aliases the repositories use
+BSON_TYPES = {"string": (str,), "date": (datetime,), "binData": (uuid.UUID, bytes), "null": (type(None),)}
+
+
+def candidates(value: Any) -> List[Any]:
+    # a condition on an array field matches if any element, or the array itself, matches
+    return [value, *value] if isinstance(value, list) else [value]
+
+
+def compare(value: Any, operand: Any, op: Callable[[Any, Any], bool]) -> bool:
+    return any(
+        v is not MISSING and type_rank(v) == type_rank(operand) and op(sort_key(v), sort_key(operand))
+        for v in candidates(value)
+    )
+
+
+def equals(value: Any, operand: Any) -> bool:
+    if operand is None:
+        return value is MISSING or any(v is None for v in candidates(value))
+    if isinstance(operand, re.Pattern):
+        return any(isinstance(v, str) and operand.search(v) for v in candidates(value))
+    return any(v == operand and type_rank(v) == type_rank(operand) for v in candidates(value))
+
+
+OPERATORS = {
+    "$eq": equals,
+    "$ne": lambda value, operand: not equals(value, operand),
+    "$in": lambda value, operand: any(equals(value, o) for o in operand),
+    "$nin": lambda value, operand: not any(equals(value, o) for o in operand),
+    "$gt": lambda value, operand: compare(value, operand, lambda a, b: a > b),
+    "$gte": lambda value, operand: compare(value, operand, lambda a, b: a >= b),
+    "$lt": lambda value, operand: compare(value, operand, lambda a, b: a < b),
+    "$lte": lambda value, operand: compare(value, operand, lambda a, b: a <= b),
+    "$exists": lambda value, operand: (value is not MISSING) == bool(operand),
+    "$size": lambda value, operand: isinstance(value, list) and len(value) == operand,
+    "$type": lambda value, operand: any(
+        v is not MISSING and type(v) in BSON_TYPES[operand] for v in candidates(value)
+    ),
+}
+
+
+def matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, operand in condition.items():
+            if op == "$not":
+                if matches_condition(value, operand):
+                    return False
+            elif op == "$regex":
+                if not equals(value, re.compile(operand, re.IGNORECASE if "i" in condition.get("$options", "") else 0)):
+                    return False
+            elif op == "$options":
+                continue
+            elif op not in OPERATORS:
+                raise NotImplementedError(f"Query operator {op} is not supported in memory")
+            elif not OPERATORS[op](value, operand):
+                return False
+        return True
+    
+    return equals(value, condition)
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, q) for q in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, q) for q in condition):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"Query operator {key} is not supported in memory")
+        elif not matches_condition(get_path(document, key), condition):
+            return False
+    
+    return True
+
+
+def apply_update(document: Dict[str, Any], update: Dict[str, Any], inserting: bool = False) -> None:
+    for op, fields in update.items():
+        if op == "$set" or (op == "$setOnInsert" and inserting):
+            for path, value in fields.items():
+                set_path(document, path, copy_value(value))
+        elif op == "$unset":
+            for path in fields:
+                unset_path(document, path)
+        elif op == "$inc":
+            for path, amount in fields.items():
+                current = get_path(document, path)
+                set_path(document, path, (0 if current is MISSING else current) + amount)
+        elif op == "$push":
+            for path, value in fields.items():
+                current = get_path(document, path)
+                set_path(document, path, ([] if current is MISSING else current) + [copy_value(value)])
+        elif op == "$pull":
+            for path, value in fields.items():
+                current = get_path(document, path)
+                if isinstance(current, list):
+                    set_path(document, path, [v for v in current if not matches_condition(v, value)])
+        elif op != "$setOnInsert":
+            raise NotImplementedError(f"Update operator {op} is not supported in memory")
+
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not projection:
+        return copy_value(document)
+    
+    include_id = projection.get("_id", 1)
+    fields = {k: v for k, v in projection.items() if k != "_id"}
+    if fields and all(not v for v in fields.values()):
+        projected = copy_value(document)
+        for path in fields:
+            unset_path(projected, path)
+    else:
+        projected = {}
+        for path in fields:
+            if (value := get_path(document, path)) is not MISSING:
+                set_path(projected, path, copy_value(value))
+        if include_id and "_id" in document:
+            projected["_id"] = document["_id"]
+    
+    if not include_id:
+        projected.pop("_id", None)
+    return projected
+
+
+def normalize_sort(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or ASCENDING)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+
+def sort_documents(documents: List[Dict[str, Any]], sort: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    # stable sorts applied from the least significant key give a compound sort
+    for path, direction in reversed(sort):
+        documents.sort(key=lambda d: sort_key(get_path(d, path)), reverse=direction < 0)
+    return documents
+
+
+def get_field_values(value: Any, keys: List[str]) -> Any:
+    """
+    Value of a field path in an aggregation expression, through an array it is the list of the elements' values
+    """
+    for position, key in enumerate(keys):
+        if isinstance(value, list):
+            return [v for item in value if (v := get_field_values(item, keys[position:])) is not MISSING]
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return value
+
+
+def to_date(value: Any) -> Any:
+    """
+    $toDate of an ISO 8601 string, which MongoDB reads as UTC without an offset, other values stay as they are
+    """
+    if not isinstance(value, str):
+        return value
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo is None else parsed.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def evaluate_expression(expression: Any, document: Dict[str, Any], score: float) -> Any:
+    """
+    Aggregation expressions: field paths, literals, textScore metadata, $toDate and $dateToString
+    """
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = get_field_values(document, expression[1:].split("."))
+        return None if value is MISSING else value
+    if isinstance(expression, dict):
+        if expression.get("$meta") == "textScore":
+            return score
+        if "$toDate" in expression:
+            return to_date(evaluate_expression(expression["$toDate"], document, score))
+        if "$dateToString" in expression:
+            spec = expression["$dateToString"]
+            value = evaluate_expression(spec["date"], document, score)
+            return None if value is None else value.strftime(spec.get("format", "%Y-%m-%dT%H:%M:%S.%LZ"))
+        if any(key.startswith("$") for key in expression):
+            raise NotImplementedError(f"Expression {expression} is not supported in memory")
+        return {key: evaluate_expression(value, document, score) for key, value in expression.items()}
+    if isinstance(expression, list):
+        return [evaluate_expression(value, document, score) for value in expression]
+    return expression
+
+
+def freeze(value: Any) -> Any:
+    """
+    Hashable stand-in for a value, to group documents by it
+    """
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def group_documents(documents: List[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Any, Dict[str, Any]] = {}
+    for document in documents:
+        id = evaluate_expression(spec["_id"], document, 0.0)
+        group = groups.setdefault(freeze(id), {"_id": id})
+        for name, accumulator in spec.items():
+            if name == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            value = evaluate_expression(expression, document, 0.0)
+            if op == "$sum":
+                group[name] = group.get(name, 0) + (value if isinstance(value, (int, float)) else 0)
+            elif op == "$min":
+                group[name] = value if name not in group else min(group[name], value, key=sort_key)
+            elif op == "$max":
+                group[name] = value if name not in group else max(group[name], value, key=sort_key)
+            elif op == "$first":
+                group.setdefault(name, value)
+            elif op == "$push":
+                group.setdefault(name, []).append(value)
+            else:
+                raise NotImplementedError(f"Accumulator {op} is not supported in memory")
+    return list(groups.values())
+
+
+def seek_value(condition: Any) -> Any:
+    """
+    The value a query condition requires a field to equal, MISSING unless an index can seek to it
+    """
+    if isinstance(condition, dict) and set(condition) == {"$eq"}:
+        condition = condition["$eq"]
+    # None also matches missing fields, arrays and subdocuments are not kept in indexes
+    if condition is MISSING or condition is None or isinstance(condition, (dict, list, re.Pattern)):
+        return MISSING
+    return condition
+
+
+def id_lookup(condition: Any) -> Optional[List[Any]]:
+    """
+    The _id values a condition on _id allows, None unless it is an equality or $in
+    """
+    if isinstance(condition, dict) and set(condition) == {"$in"}:
+        return list(dict.fromkeys(condition["$in"]))
+    value = seek_value(condition)
+    return None if value is MISSING else [value]
+
+
+class SortedIndex:
+    """
+    Entries of the sort_key values of the index fields and _id in ascending order, like a MongoDB index.
+    
+    Walked backwards, the entries also serve sorts in the opposite direction, so field directions are not kept.
+    An index over arrays or subdocuments, which MongoDB indexes element by element, is given up instead.
+    """
+    
+    def __init__(self, name: str, paths: List[str], sparse: bool = False) -> None:
+        self.name = name
+        self.paths = paths if paths[-1] == "_id" else [*paths, "_id"]
+        self.sparse = sparse
+        self.entries: List[Tuple[Tuple[int, Any], ...]] = []
+        self.keys: Dict[Any, Tuple[Tuple[int, Any], ...]] = {}
+        self.usable = True
+    
+    def add(self, id: Any, document: Dict[str, Any]) -> None:
+        self.remove(id)
+        values = [get_path(document, path) for path in self.paths]
+        if not self.usable or (self.sparse and all(value is MISSING for value in values[:-1])):
+            return
+        if any(isinstance(value, (dict, list)) for value in values):
+            self.give_up()
+            return
+        
+        entry = tuple(sort_key(value) for value in values)
+        try:
+            bisect.insort(self.entries, entry)
+        except TypeError:
+            # values of one type rank Python cannot order, e.g. bytes and UUIDs
+            self.give_up()
+            return
+        self.keys[id] = entry
+    
+    def remove(self, id: Any) -> None:
+        if (entry := self.keys.pop(id, None)) is not None:
+            del self.entries[bisect.bisect_left(self.entries, entry)]
+    
+    def give_up(self) -> None:
+        self.usable = False
+        self.entries.clear()
+        self.keys.clear()
+    
+    def bounds(self, query: Dict[str, Any]) -> Optional[Tuple[Tuple, Tuple, int]]:
+        """
+        Lowest and highest entry of documents that may match query, and how many leading fields query fixes.
+        
+        None if a sparse index could miss documents that match.
+        """
+        if "$or" in query:
+            rest = {key: condition for key, condition in query.items() if key != "$or"}
+            branches = [self.bounds({**rest, **branch}) for branch in query["$or"]]
+            if any(branch is None for branch in branches):
+                return self.bounds(rest)
+            lows, highs, fixed = zip(*branches)
+            return min(lows), max(highs), min(fixed)
+        
+        prefix = []
+        for path in self.paths:
+            if (value := seek_value(query.get(path, MISSING))) is MISSING:
+                break
+            prefix.append(sort_key(value))
+        low, high = tuple(prefix), (*prefix, HIGHEST)
+        
+        condition = query.get(self.paths[len(prefix)]) if len(prefix) < len(self.paths) else None
+        if isinstance(condition, dict) and condition.keys() & RANGE_OPERATORS:
+            lower = [condition[op] for op in ("$gt", "$gte") if op in condition]
+            upper = [condition[op] for op in ("$lt", "$lte") if op in condition]
+            # a range only matches values of its operand's type
+            rank = type_rank((lower or upper)[0])
+            low = (*prefix, sort_key(max(lower, key=sort_key)) if lower else (rank,))
+            high = (*prefix, sort_key(min(upper, key=sort_key)), HIGHEST) if upper else (*prefix, (rank + 1,))
+        elif isinstance(condition, dict) and set(condition) == {"$in"} and condition["$in"]:
+            values = [seek_value(value) for value in condition["$in"]]
+            if all(value is not MISSING for value in values):
+                low = (*prefix, min(sort_key(value) for value in values))
+                high = (*prefix, max(sort_key(value) for value in values), HIGHEST)
+        
+        if self.sparse and low == ():
+            return None
+        return low, high, len(prefix)
+    
+    def direction(self, sort: List[Tuple[str, int]], fixed: int) -> Optional[int]:
+        """
+        Direction to walk entries in for sort, None if the index does not give that order
+        """
+        # fields fixed to one value by the query do not change the order
+        sort = [(path, direction) for path, direction in sort if path not in self.paths[:fixed]]
+        if not sort:
+            return ASCENDING
+        if len({direction for _, direction in sort}) > 1:
+            return None
+        if [path for path, _ in sort] != self.paths[fixed:fixed + len(sort)]:
+            return None
+        return sort[0][1]
+    
+    def walk(self, start: int, end: int, direction: int) -> Iterator[Any]:
+        """
+        Ids of the entries from start to end, backwards for descending order
+        """
+        positions = range(start, end) if direction > 0 else range(end - 1, start - 1, -1)
+        for position in positions:
+            yield self.entries[position][-1][1]
+
+
+class ListCursor:
+    """
+    Cursor over documents that were already computed, like the result of an aggregation
+    """
+    
+    def __init__(self, documents: List[Dict[str, Any]]) -> None:
+        self.documents = iter(documents)
+    
+    def batch_size(self, batch_size: int) -> "ListCursor":
+        return self
+    
+    def __aiter__(self) -> "ListCursor":
+        return self
+    
+    async def __anext__(self) -> Dict[str, Any]:
+        try:
+            return next(self.documents)
+        except StopIteration:
+            raise StopAsyncIteration
+    
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        documents = list(self.documents)
+        return documents if length is None else documents[:length]
+
+
+class InMemoryCursor:
+    def __init__(self, collection: "InMemoryCollection", query: Dict[str, Any], projection: Optional[Dict[str, Any]]):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._results: Optional[Iterable[Dict[str, Any]]] = None
+    
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "InMemoryCursor":
+        self._sort = normalize_sort(key_or_list, direction)
+        return self
+    
+    def skip(self, skip: int) -> "InMemoryCursor":
+        self._skip = skip
+        return self
+    
+    def limit(self, limit: int) -> "InMemoryCursor":
+        self._limit = limit
+        return self
+    
+    def batch_size(self, batch_size: int) -> "InMemoryCursor":
+        return self
+    
+    def evaluate(self) -> List[Dict[str, Any]]:
+        documents = self.collection.select(self.query, self._sort, self._skip + self._limit if self._limit else 0)
+        return [project(d, self.projection) for d in documents[self._skip:]]
+    
+    def __aiter__(self) -> "InMemoryCursor":
+        return self
+    
+    async def __anext__(self) -> Dict[str, Any]:
+        if self._results is None:
+            self._results = iter(self.evaluate())
+        try:
+            return next(self._results)
+        except StopIteration:
+            raise StopAsyncIteration
+    
+    async def to_list(self, length: Optional[int]) -> List[Dict[str, Any]]:
+        documents = self.evaluate()
+        return documents if length is None else documents[:length]
+
+
+class InMemoryCollection:
+    def __init__(self, name: str, database: Optional["InMemoryDatabase"] = None) -> None:
+        self.name = name
+        self.database = database  # where $graphLookup finds the collection it walks
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+        self.text_index: Optional[InvertedIndex] = None
+        self.text_index_name: Optional[str] = None
+        self.indexes: Dict[str, SortedIndex] = {}
+    
+    def text_scores(self, text: Dict[str, Any]) -> Dict[Any, float]:
+        if self.text_index is None:
+            raise OperationFailure("text index required for $text query", INDEX_NOT_FOUND)
+        return self.text_index.search(text["$search"])
+    
+    def plan(
+            self, query: Dict[str, Any], sort: List[Tuple[str, int]], limit: int
+    ) -> Tuple[Iterable[Dict[str, Any]], bool, Dict[str, Any]]:
+        """
+        Documents that may match query, whether they come in sort order, and the part of query left to match.
+        
+        _id lookups come first, then the index with the fewest candidates. With a limit an index in sort order
+        wins, its walk stops after limit matches.
+        """
+        if (ids := id_lookup(query.get("_id", MISSING))) is not None:
+            # the lookup already matched _id, which saves comparing every document to a long $in list
+            documents = [
+                document for id in ids
+                if (document := self.documents.get(id)) is not None and type_rank(document["_id"]) == type_rank(id)
+            ]
+            return documents, not sort, {key: condition for key, condition in query.items() if key != "_id"}
+        
+        best = None
+        for index in self.indexes.values():
+            if not index.usable or (bounds := index.bounds(query)) is None:
+                continue
+            low, high, fixed = bounds
+            direction = index.direction(sort, fixed)
+            start, end = bisect.bisect_left(index.entries, low), bisect.bisect_left(index.entries, high)
+            if end - start == len(self.documents) and (direction is None or not sort):
+                continue
+            
+            unordered = direction is None
+            cost = (unordered, end - start) if limit else (end - start, unordered)
+            if best is None or cost < best[0]:
+                best = (cost, index, start, end, direction)
+        
+        if best is None:
+            return self.documents.values(), not sort, query
+        _, index, start, end, direction = best
+        ids = index.walk(start, end, direction or ASCENDING)
+        return (self.documents[id] for id in ids), direction is not None, query
+    
+    def select(
+            self, query: Dict[str, Any], sort: Optional[List[Tuple[str, int]]] = None, limit: int = 0
+    ) -> List[Dict[str, Any]]:
+        """
+        Documents matching query in sort order, at most limit of them unless limit is 0
+        """
+        sort = sort or []
+        if "$text" in query:
+            ids = self.text_scores(query["$text"])
+            query = {k: v for k, v in query.items() if k != "$text"}
+            documents, ordered = (self.documents[id] for id in ids), not sort
+        else:
+            documents, ordered, query = self.plan(query, sort, limit)
+        
+        selected = []
+        for document in documents:
+            if matches(document, query):
+                selected.append(document)
+                if ordered and len(selected) == limit:
+                    break
+        
+        if not ordered:
+            selected = sort_documents(selected, sort)
+        return selected[:limit] if limit else selected
+    
+    def store(self, document: Dict[str, Any]) -> None:
+        """
+        Save a new or changed document, every write goes through here to keep the indexes current
+        """
+        self.documents[document["_id"]] = document
+        if self.text_index is not None:
+            self.text_index.add(document["_id"], document)
+        for index in self.indexes.values():
+            index.add(document["_id"], document)
+    
+    def discard(self, id: Any) -> Dict[str, Any]:
+        if self.text_index is not None:
+            self.text_index.remove(id)
+        for index in self.indexes.values():
+            index.remove(id)
+        return self.documents.pop(id)
+    
+    def insert(self, document: Dict[str, Any]) -> Any:
+        document = copy_value(document)
+        document.setdefault("_id", uuid.uuid4())
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name}", DUPLICATE_KEY_ERROR)
+        self.store(document)
+        return document["_id"]
+    
+    def update(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool, many: bool) -> Dict[str, Any]:
+        documents = self.select(query, limit=0 if many else 1)
+        for document in documents:
+            apply_update(document, update)
+            self.store(document)
+        
+        result = {"n": len(documents), "nModified": len(documents)}
+        if not documents and upsert:
+            document = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            apply_update(document, update, inserting=True)
+            result["upserted"] = self.insert(document)
+            result["n"] = 1
+        return result
+    
+    def delete(self, query: Dict[str, Any], many: bool) -> int:
+        documents = self.select(query, limit=0 if many else 1)
+        for document in documents:
+            self.discard(document["_id"])
+        return len(documents)
+    
+    def create_text_index(self, name: str, keys: List[Tuple[str, Any]], weights: Dict[str, float]) -> None:
+        # fields before or after the text fields of a compound text index are matched like any other condition
+        self.text_index_name = name
+        self.text_index = InvertedIndex({k: weights.get(k, 1) for k, kind in keys if kind == TEXT})
+        for id, document in self.documents.items():
+            self.text_index.add(id, document)
+    
+    def create_sorted_index(self, name: str, keys: List[Tuple[str, Any]], options: Dict[str, Any]) -> None:
+        # documents left out by a partial index are unknown here, and _id is looked up in documents itself
+        if name in self.indexes or "partialFilterExpression" in options or [k for k, _ in keys] == ["_id"]:
+            return
+        index = SortedIndex(name, [k for k, _ in keys], sparse=options.get("sparse", False))
+        for id, document in self.documents.items():
+            index.add(id, document)
+        self.indexes[name] = index
+    
+    async def create_indexes(self, indexes: List[Any]) -> List[str]:
+        for index in indexes:
+            await self.create_index(list(index.document["key"].items()), **index.document)
+        return [index.document["name"] for index in indexes]
+    
+    async def create_index(self, keys: Any, **kwargs: Any) -> str:
+        keys = normalize_sort(keys)
+        name = kwargs.get("name", "_".join(f"{k}_{d}" for k, d in keys))
+        if any(kind == TEXT for _, kind in keys):
+            self.create_text_index(name, keys, kwargs.get("weights", {}))
+        else:
+            self.create_sorted_index(name, keys, kwargs)
+        return name
+    
+    async def drop_index(self, index_or_name: Any) -> None:
+        name = index_or_name if isinstance(index_or_name, str) else "_".join(
+            f"{k}_{d}" for k, d in normalize_sort(index_or_name)
+        )
+        # partial indexes were never built here, so unlike MongoDB an unknown name is not an error
+        if name == self.text_index_name:
+            self.text_index, self.text_index_name = None, None
+        self.indexes.pop(name, None)
+    
+    async def drop(self) -> None:
+        self.documents.clear()
+        self.text_index, self.text_index_name = None, None
+        self.indexes.clear()
+    
+    def find(self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None) -> InMemoryCursor:
+        return InMemoryCursor(self, filter or {}, projection)
+    
+    async def find_one(
+            self, filter: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Optional[Dict[str, Any]]:
+        documents = await self.find(filter, projection).sort(kwargs.get("sort") or []).limit(1).to_list(1)
+        return documents[0] if documents else None
+    
+    async def count_documents(self, filter: Dict[str, Any]) -> int:
+        return len(self.select(filter))
+    
+    async def insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        inserted_id = self.insert(document)
+        document.setdefault("_id", inserted_id)
+        return InsertOneResult(inserted_id, True)
+    
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> InsertManyResult:
+        result = await self.bulk_write([InsertOne(d) for d in documents], ordered=ordered)
+        return InsertManyResult([d["_id"] for d in documents if "_id" in d][:result.inserted_count], True)
+    
+    async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self.update(filter, update, upsert, many=False), True)
+    
+    async def update_many(self, filter: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self.update(filter, update, upsert, many=True), True)
+    
+    async def replace_one(self, filter: Dict[str, Any], replacement: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        documents = self.select(filter, limit=1)
+        if documents:
+            self.store({**copy_value(replacement), "_id": documents[0]["_id"]})
+            return UpdateResult({"n": 1, "nModified": 1}, True)
+        if upsert:
+            document = {**copy_value(replacement)}
+            if "_id" in filter and not isinstance(filter["_id"], dict):
+                document.setdefault("_id", filter["_id"])
+            return UpdateResult({"n": 1, "nModified": 0, "upserted": self.insert(document)}, True)
+        return UpdateResult({"n": 0, "nModified": 0}, True)
+    
+    async def delete_one(self, filter: Dict[str, Any]) -> DeleteResult:
+        return DeleteResult({"n": self.delete(filter, many=False)}, True)
+    
+    async def delete_many(self, filter: Dict[str, Any]) -> DeleteResult:
+        return DeleteResult({"n": self.delete(filter, many=True)}, True)
+    
+    async def find_one_and_update(
+            self,
+            filter: Dict[str, Any],
+            update: Dict[str, Any],
+            projection: Optional[Dict[str, Any]] = None,
+            sort: Optional[List[Tuple[str, int]]] = None,
+            upsert: bool = False,
+            return_document: bool = ReturnDocument.BEFORE,
+    ) -> Optional[Dict[str, Any]]:
+        documents = self.select(filter, normalize_sort(sort) if sort else None, 1)
+        if documents:
+            document = documents[0]
+            before = copy_value(document)
+            apply_update(document, update)
+            self.store(document)
+            return project(document if return_document else before, projection)
+        
+        if upsert:
+            result = self.update(filter, update, upsert=True, many=False)
+            return project(self.documents[result["upserted"]], projection) if return_document else None
+        return None
+    
+    async def find_one_and_delete(
+            self, filter: Dict[str, Any], projection: Optional[Dict[str, Any]] = None, sort: Optional[List] = None
+    ) -> Optional[Dict[str, Any]]:
+        documents = self.select(filter, normalize_sort(sort) if sort else None, 1)
+        if not documents:
+            return None
+        return project(self.discard(documents[0]["_id"]), projection)
+    
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> ListCursor:
+        scores: Dict[Any, float] = {}
+        documents = None
+        
+        for position, stage in enumerate(pipeline):
+            (name, spec), = stage.items()
+            if position == 0:
+                # a leading $match without $text uses the indexes like a find
+                matched = name == "$match" and "$text" not in spec
+                documents = [copy_value(d) for d in (self.select(spec) if matched else self.documents.values())]
+                if matched:
+                    continue
+            if name == "$match":
+                if "$text" in spec:
+                    if position != 0:
+                        raise OperationFailure("$match with $text is only allowed as the first pipeline stage")
+                    scores = self.text_scores(spec["$text"])
+                    documents = [copy_value(self.documents[id]) for id in scores]
+                    spec = {k: v for k, v in spec.items() if k != "$text"}
+                documents = [d for d in documents if matches(d, spec)]
+            elif name in ("$addFields", "$set"):
+                for document in documents:
+                    score = scores.get(document.get("_id"), 0.0)
+                    for path, expression in spec.items():
+                        set_path(document, path, evaluate_expression(expression, document, score))
+            elif name == "$project":
+                documents = [project(d, spec) for d in documents]
+            elif name == "$unset":
+                for document in documents:
+                    for path in [spec] if isinstance(spec, str) else spec:
+                        unset_path(document, path)
+            elif name == "$sort":
+                documents = sort_documents(documents, normalize_sort(spec))
+            elif name == "$skip":
+                documents = documents[spec:]
+            elif name == "$limit":
+                documents = documents[:spec]
+            elif name == "$group":
+                documents = group_documents(documents, spec)
+            elif name == "$count":
+                documents = [{spec: len(documents)}] if documents else []
+            elif name == "$graphLookup":
+                for document in documents:
+                    document[spec["as"]] = self.graph_lookup(document, spec)
+            else:
+                raise NotImplementedError(f"Aggregation stage {name} is not supported in memory")
+        
+        return ListCursor(documents if documents is not None else [copy_value(d) for d in self.documents.values()])
+    
+    def graph_lookup(self, document: Dict[str, Any], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Documents $graphLookup finds for one input document, walking breadth first and visiting each document once
+        """
+        source = self if spec["from"] == self.name else self.database.get_collection(spec["from"])
+        restrict = spec.get("restrictSearchWithMatch", {})
+        max_depth = spec.get("maxDepth")
+        
+        found: Dict[Any, Dict[str, Any]] = {}
+        values = evaluate_expression(spec["startWith"], document, 0.0)
+        values = values if isinstance(values, list) else [values]
+        depth = 0
+        while max_depth is None or depth <= max_depth:
+            # missing and null values connect to nothing, rather than to every document without the field
+            values = [value for value in values if value is not None]
+            if not values:
+                break
+            next_values = []
+            for match in source.select({**restrict, spec["connectToField"]: {"$in": values}}):
+                if match["_id"] in found:
+                    continue
+                match = copy_value(match)
+                if "depthField" in spec:
+                    match[spec["depthField"]] = depth
+                found[match["_id"]] = match
+                if (value := get_path(match, spec["connectFromField"])) is not MISSING:
+                    next_values.extend(value if isinstance(value, list) else [value])
+            values = next_values
+            depth += 1
+        return list(found.values())
+    
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        result = {
+            "writeErrors": [], "writeConcernErrors": [], "nInserted": 0, "nUpserted": 0,
+            "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": [],
+        }
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    request._doc.setdefault("_id", self.insert(request._doc))
+                    result["nInserted"] += 1
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    raw = self.update(request._filter, request._doc, request._upsert, many=isinstance(request, UpdateMany))
+                    self.count_update(result, index, raw)
+                elif isinstance(request, ReplaceOne):
+                    raw = (await self.replace_one(request._filter, request._doc, request._upsert)).raw_result
+                    self.count_update(result, index, raw)
+                elif isinstance(request, (DeleteOne, DeleteMany)):
+                    result["nRemoved"] += self.delete(request._filter, many=isinstance(request, DeleteMany))
+                else:
+                    raise NotImplementedError(f"{type(request).__name__} is not supported in memory")
+            except DuplicateKeyError as e:
+                result["writeErrors"].append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": str(e)})
+                if ordered:
+                    break
+        
+        if result["writeErrors"]:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+    
+    @staticmethod
+    def count_update(result: Dict[str, Any], index: int, raw: Dict[str, Any]) -> None:
+        if "upserted" in raw:
+            result["nUpserted"] += 1
+            result["upserted"].append({"index": index, "_id": raw["upserted"]})
+        else:
+            result["nMatched"] += raw["n"]
+            result["nModified"] += raw["nModified"]
+
+
+class InMemoryDatabase:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.collections: Dict[str, InMemoryCollection] = {}
+    
+    def get_collection(self, name: str) -> InMemoryCollection:
+        if name not in self.collections:
+            self.collections[name] = InMemoryCollection(name, self)
+        return self.collections[name]
+    
+    __getitem__ = get_collection
+    
+    async def command(self, command: Any, **kwargs: Any) -> Dict[str, Any]:
+        if command == "ping":
+            return {"ok": 1.0}
+        if command == "hello":
+            # a standalone server, without change streams
+            return {"isWritablePrimary": True, "maxWireVersion": 17, "ok": 1.0}
+        raise NotImplementedError(f"Command {command} is not supported in memory")
+
+
+class InMemoryMotorClient:
+    """
+    Drop-in for AsyncIOMotorClient, connection options other than the URL are accepted and ignored
+    """
+    
+    def __init__(self, url: str = "memory://", *args: Any, **kwargs: Any) -> None:
+        self.databases = SERVERS.setdefault(url, {})
+        self.admin = InMemoryDatabase("admin")
+    
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        if name not in self.databases:
+            self.databases[name] = InMemoryDatabase(name)
+        return self.databases[name]
+    
+    get_database = __getitem__
+    
+    def close(self) -> None:
+        pass
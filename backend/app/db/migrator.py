@@ -0,0 +1,126 @@
+"""
+Background task that rewrites task documents of older schema versions, while requests upgrade them as they read.
+
+Every worker process runs one, but only the process holding the migration's lease rewrites batches. It checkpoints
+after each batch, so a restarted or another process resumes where it stopped. Once a pass over the tasks finds
+nothing to rewrite the migration is done, and task ids are only looked up as UUIDs.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from fastapi import FastAPI
+from pymongo.errors import PyMongoError
+
+from app.core.config import (
+    MIGRATION_BATCH_INTERVAL_SECONDS,
+    MIGRATION_BATCH_SIZE,
+    MIGRATION_ENABLED,
+    MIGRATION_LEASE_SECONDS,
+)
+from app.db.repositories.migrations import MigrationRepository
+from app.db.repositories.tasks import MIGRATION_STARTS, TaskRepository
+from app.models.core import datetime_now
+from app.models.task import TASK_SCHEMA_VERSION
+
+logger = logging.getLogger(__name__)
+
+# _id of the migration's document in the migrations collection
+TASKS_MIGRATION = "tasks"
+
+
+class TaskMigrator:
+    def __init__(self, app: FastAPI, *, batch_size: int, batch_interval: float, lease: timedelta) -> None:
+        self.app = app
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        # no task is stored by an older schema version any more
+        self.done = False
+        self.migrated = app.metrics.counter(
+            "tasks_migrated_total", "Task documents rewritten to the current schema version by the migrator",
+        )
+        self.runner: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        self.runner = asyncio.create_task(self.run())
+    
+    async def run(self) -> None:
+        while not self.done:
+            try:
+                claimed = await self.migrate_once()
+            except PyMongoError as e:
+                logger.warning("Migrating tasks failed, retrying in %ss: %s", self.lease.total_seconds(), e)
+                claimed = False
+            if not self.done:
+                # while another process migrates, look again about when its lease would run out
+                await asyncio.sleep(self.batch_interval if claimed else self.lease.total_seconds())
+    
+    async def migrate_once(self) -> bool:
+        """
+        Rewrite the next batch if this process holds the lease of the migration, False if another process does
+        """
+        migrations = MigrationRepository(self.app.database, app=self.app)
+        state = await migrations.claim(
+            TASKS_MIGRATION, owner=self.owner, version=TASK_SCHEMA_VERSION, now=datetime_now(), lease=self.lease,
+        )
+        if state is None:
+            state = await migrations.get(TASKS_MIGRATION) or {}
+            self.done = state.get("version") == TASK_SCHEMA_VERSION and state.get("done", False)
+            return False
+        
+        if state.get("version") != TASK_SCHEMA_VERSION:
+            # the first migration to this version starts a pass at the beginning
+            state = {"version": TASK_SCHEMA_VERSION, "after": MIGRATION_STARTS[0], "rewritten": 0, "done": False}
+            await migrations.checkpoint(TASKS_MIGRATION, owner=self.owner, progress=state)
+        if state["done"]:
+            self.done = True
+            return True
+        
+        task_repo = TaskRepository(self.app.database, app=self.app)
+        count, after = await task_repo.migrate_tasks(after=state["after"], batch_size=self.batch_size)
+        self.migrated.inc(count)
+        rewritten = state["rewritten"] + count
+        
+        if after is not None:
+            progress = {"after": after, "rewritten": rewritten, "done": False}
+        else:
+            # tasks written by requests while the pass read them were skipped, the next pass finds them again
+            logger.info("Task migration pass rewrote %s tasks", rewritten)
+            progress = {"after": MIGRATION_STARTS[0], "rewritten": 0, "done": rewritten == 0}
+        if not await migrations.checkpoint(
+                TASKS_MIGRATION, owner=self.owner, progress={**progress, "updated": datetime_now()}, migrated=count,
+        ):
+            logger.info("Another process took over the task migration")
+            return False
+        
+        self.done = progress["done"]
+        if self.done:
+            logger.info("Task migration to schema version %s is done", TASK_SCHEMA_VERSION)
+        return True
+    
+    async def close(self) -> None:
+        if self.runner is not None:
+            self.runner.cancel()
+            try:
+                await self.runner
+            except asyncio.CancelledError:
+                pass
+            self.runner = None
+
+
+def start_task_migrator(app: FastAPI) -> Optional[TaskMigrator]:
+    if not MIGRATION_ENABLED:
+        return None
+    
+    migrator = TaskMigrator(
+        app,
+        batch_size=MIGRATION_BATCH_SIZE,
+        batch_interval=MIGRATION_BATCH_INTERVAL_SECONDS,
+        lease=timedelta(seconds=MIGRATION_LEASE_SECONDS),
+    )
+    migrator.start()
+    return migrator
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import Counter
+from typing import Dict, Tuple, Union
+
+from pymongo import monitoring
+
+from app.core.metrics import MetricsRegistry
+from app.core.tracing import current_trace
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool counters, the driver calls these hooks from its worker threads
+    """
+    
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.checkout_started = threading.local()
+        self.connections_open = 0
+        self.connections_checked_out = 0
+        self.wait_queue_size = 0
+        self.checkouts = 0
+        self.checkout_wait_seconds = 0.0
+        self.checkout_failures = Counter()
+        self.pool_clears = 0
+    
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        self.checkout_started.at = time.perf_counter()
+        with self.lock:
+            self.wait_queue_size += 1
+    
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        waited = time.perf_counter() - getattr(self.checkout_started, "at", time.perf_counter())
+        with self.lock:
+            self.wait_queue_size -= 1
+            self.connections_checked_out += 1
+            self.checkouts += 1
+            self.checkout_wait_seconds += waited
+    
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        with self.lock:
+            self.wait_queue_size -= 1
+            self.checkout_failures[event.reason] += 1
+    
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        with self.lock:
+            self.connections_checked_out -= 1
+    
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        with self.lock:
+            self.connections_open += 1
+    
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        with self.lock:
+            self.connections_open -= 1
+    
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        with self.lock:
+            self.pool_clears += 1
+    
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+    
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+    
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+    
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Duration of every command by collection and operation, added to the request trace when it is sampled
+    """
+    
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.durations = registry.histogram(
+            "mongodb_command_duration_seconds", "Duration of MongoDB commands", ("collection", "command"),
+        )
+        self.failures = registry.counter(
+            "mongodb_command_failures_total", "MongoDB commands that returned an error", ("collection", "command"),
+        )
+        self.collections: Dict[Tuple[object, int], str] = {}
+    
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        # the collection is only part of the started event, keyed by connection since request ids repeat across servers
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self.collections[event.connection_id, event.request_id] = collection if isinstance(collection, str) else ""
+    
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self.record(event, failed=False)
+    
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self.record(event, failed=True)
+    
+    def record(
+            self, event: Union[monitoring.CommandSucceededEvent, monitoring.CommandFailedEvent], failed: bool
+    ) -> None:
+        collection = self.collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        self.durations.labels(collection, event.command_name).observe(seconds)
+        if failed:
+            self.failures.labels(collection, event.command_name).inc()
+        
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span(
+                f"mongodb.{event.command_name}", time.perf_counter() - seconds, seconds, collection=collection,
+            )
@@ -0,0 +1,116 @@
+import base64
+import binascii
+import heapq
+import json
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union
+
+from app.models.core import SortOrder
+
+
+def encode_payload(payload: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_payload(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+
+# sort key of a task as stored, version 1 documents may hold updated and _id as ISO and UUID strings
+SortKey = Tuple[Union[datetime, str], Union[uuid.UUID, str]]
+
+
+def encode_cursor(updated: Union[datetime, str], id: Union[uuid.UUID, str]) -> str:
+    """
+    Build an opaque cursor pointing right after the document with the given sort key, as it is stored
+    """
+    if isinstance(updated, str):
+        # marked, so the next page compares against strings like the one stored
+        return encode_payload([updated, str(id), 1])
+    return encode_payload([updated.isoformat(), str(id)])
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """
+    Reverse encode_cursor, raise ValueError if the cursor was not produced by it
+    """
+    try:
+        payload = decode_payload(cursor)
+        if len(payload) == 3 and payload[2] == 1:
+            updated, id, _ = payload
+            # validated, but kept exactly as stored
+            datetime.fromisoformat(updated), uuid.UUID(id)
+            return updated, id
+        updated, id = payload
+        return datetime.fromisoformat(updated), uuid.UUID(id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed cursor: {cursor}") from e
+
+
+def encode_search_cursor(score: float, id: uuid.UUID) -> str:
+    """
+    Cursor of search results, which are ordered by relevance instead of last update
+    """
+    return encode_payload([score, str(id)])
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, uuid.UUID]:
+    try:
+        score, id = decode_payload(cursor)
+        if isinstance(score, bool) or not isinstance(score, (int, float)):
+            raise TypeError(score)
+        return float(score), uuid.UUID(id)
+    except (binascii.Error, UnicodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Malformed cursor: {cursor}") from e
+
+
+def keyset_filter(updated: Union[datetime, str], id: Union[uuid.UUID, str], order: SortOrder) -> Dict[str, Any]:
+    """
+    Match documents strictly after (updated, _id) in the given order, so every page is an index seek.
+    
+    MongoDB sorts the ISO strings in updated of version 1 documents before every datetime, and a comparison only
+    matches values of its own type. The documents of the other type that come later in the order match too. Those
+    documents were last written before the first version, so the order stays by last update until they are migrated.
+    """
+    op = "$lt" if order == SortOrder.desc else "$gt"
+    conditions = [
+        {"updated": {op: updated}},
+        {"updated": updated, "_id": {op: id}},
+    ]
+    if isinstance(updated, str) and order == SortOrder.asc:
+        conditions.append({"updated": {"$type": "date"}})
+    elif not isinstance(updated, str) and order == SortOrder.desc:
+        conditions.append({"updated": {"$type": "string"}})
+    
+    return {"$or": conditions}
+
+
+def search_keyset_filter(score: float, id: uuid.UUID) -> Dict[str, Any]:
+    """
+    Match results after (score, _id) in relevance order, highest score first and ties by ascending _id
+    """
+    return {
+        "$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "_id": {"$gt": id}},
+        ]
+    }
+
+
+def merge_keyset_pages(*pages: List[Dict[str, Any]], order: SortOrder) -> List[Dict[str, Any]]:
+    """
+    Merge pages of several collections, each sorted by (updated, _id) in order, into one sorted page.
+    
+    A document in more than one of them, e.g. while it is being archived, is kept once.
+    """
+    merged = heapq.merge(*pages, key=lambda d: (d["updated"], d["_id"]), reverse=order == SortOrder.desc)
+    
+    seen = set()
+    documents = []
+    for document in merged:
+        if document["_id"] not in seen:
+            seen.add(document["_id"])
+            documents.append(document)
+    return documents
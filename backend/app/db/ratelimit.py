@@ -0,0 +1,123 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from app.core.config import (
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_PER_SECOND,
+    RATE_LIMIT_URL,
+)
+
+# KEYS[1] bucket, ARGV rate and burst, returns the wait as a string since Lua numbers become integers
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class RateLimitStore(ABC):
+    """
+    Token buckets per client key: rate tokens a second flow in up to burst, each request takes one
+    """
+    
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+    
+    @abstractmethod
+    async def take(self, key: str) -> float:
+        """
+        Take a token from the bucket of key, 0 if there was one, otherwise seconds until there is
+        """
+    
+    async def close(self) -> None:
+        pass
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """
+    Buckets of this process only, so each of N workers lets a client through N times as often
+    """
+    
+    def __init__(
+            self, rate: float, burst: int, max_keys: int, clock: Callable[[], float] = time.monotonic
+    ) -> None:
+        super().__init__(rate, burst)
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+    
+    async def take(self, key: str) -> float:
+        now = self.clock()
+        tokens, updated = self.buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        
+        self.buckets[key] = (tokens, now)
+        # forgetting the least recently seen client only refills its bucket, made up keys cannot exhaust memory
+        while len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+        return wait
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """
+    Buckets shared by every app process, updated atomically by a script on the Redis clock
+    """
+    
+    key_prefix = "ratelimit:"
+    
+    def __init__(self, rate: float, burst: int, url: str) -> None:
+        super().__init__(rate, burst)
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package") from e
+        
+        self.redis = redis.from_url(url)
+        self.script = self.redis.register_script(TOKEN_BUCKET_SCRIPT)
+    
+    async def take(self, key: str) -> float:
+        wait = await self.script(keys=[self.key_prefix + key], args=[self.rate, self.burst])
+        return float(wait)
+    
+    async def close(self) -> None:
+        await self.redis.close()
+
+
+def create_rate_limit_store() -> Optional[RateLimitStore]:
+    if RATE_LIMIT_PER_SECOND <= 0:
+        return None
+    
+    if RATE_LIMIT_BACKEND == "local":
+        return InMemoryRateLimitStore(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, max_keys=RATE_LIMIT_MAX_CLIENTS)
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisRateLimitStore(RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, url=RATE_LIMIT_URL)
+    
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
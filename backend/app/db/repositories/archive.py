@@ -0,0 +1,76 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReplaceOne
+from pymongo.errors import OperationFailure
+
+from app.core.config import ARCHIVE_TTL_DAYS
+from app.db.codec import decode_task
+from app.db.repositories.base import BaseRepository, drop_indexes
+from app.models.core import datetime_now
+from app.models.task import TaskPublic, TaskStatus
+
+INDEX_OPTIONS_CONFLICT = 85
+
+# statuses of tasks that are archived once they are old enough
+ARCHIVED_STATUSES = [TaskStatus.completed.value, TaskStatus.cancelled.value]
+
+ARCHIVE_INDEXES = [
+    # purges archived tasks, MongoDB checks for expired documents about once a minute
+    IndexModel([("archived", ASCENDING)], name="archived_ttl", expireAfterSeconds=int(ARCHIVE_TTL_DAYS * 86400)),
+    # the same keyset pagination as the tasks collection, for listings with include_archived
+    IndexModel([("tenant", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)], name="tenant_updated_id"),
+    IndexModel(
+        [("tenant", ASCENDING), ("status", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)],
+        name="tenant_status_updated_id",
+    ),
+]
+# replaced by the indexes led by tenant
+LEGACY_ARCHIVE_INDEXES = ["updated_id", "status_updated_id"]
+
+
+class TaskArchiveRepository(BaseRepository):
+    """
+    Tasks moved out of the tasks collection by soft deletes and the archiver, read only with include_archived
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = self.db.get_collection("tasks_archive")
+    
+    async def create_indexes(self) -> List[str]:
+        await drop_indexes(self.collection, LEGACY_ARCHIVE_INDEXES)
+        try:
+            return await self.collection.create_indexes(ARCHIVE_INDEXES)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise
+        
+        # ARCHIVE_TTL_DAYS changed since the index was built, which only collMod can apply
+        ttl_index = ARCHIVE_INDEXES[0].document
+        await self.db.command(
+            "collMod",
+            self.collection.name,
+            index={"name": ttl_index["name"], "expireAfterSeconds": ttl_index["expireAfterSeconds"]},
+        )
+        return await self.collection.create_indexes(ARCHIVE_INDEXES)
+    
+    async def store(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """
+        Copy task documents into the archive, storing one twice only replaces the earlier copy
+        """
+        archived = datetime_now()
+        operations = [
+            ReplaceOne({"_id": document["_id"]}, {**document, "archived": archived}, upsert=True)
+            for document in documents
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+    
+    async def discard(self, ids: List[Any]) -> None:
+        if ids:
+            await self.collection.delete_many({"_id": {"$in": ids}})
+    
+    async def get_task_by_id(self, *, id: Any) -> Optional[TaskPublic]:
+        if (task := await self.collection.find_one({"_id": id, "tenant": self.tenant})) is not None:
+            return decode_task(task)
+        return None
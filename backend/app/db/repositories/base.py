@@ -1,6 +1,28 @@
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Iterable, Optional
+
+from fastapi import FastAPI
+from pymongo.errors import OperationFailure
+
+from app.core.config import DEFAULT_TENANT
+from app.db.storage import Collection, Database
+
+INDEX_NOT_FOUND = 27
 
 
 class BaseRepository:
-    def __init__(self, db: AsyncIOMotorDatabase) -> None:
+    def __init__(self, db: Database, app: Optional[FastAPI] = None, tenant: str = DEFAULT_TENANT) -> None:
         self.db = db
+        self.app = app  # gives access to state shared by all requests, e.g. caches
+        self.tenant = tenant  # whose tasks are read and written, requests get theirs from get_tenant
+
+
+async def drop_indexes(collection: Collection, names: Iterable[str]) -> None:
+    """
+    Drop indexes that were replaced, whether or not they were ever built
+    """
+    for name in names:
+        try:
+            await collection.drop_index(name)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise
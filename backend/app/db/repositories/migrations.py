@@ -0,0 +1,54 @@
+"""
+Progress of the background migrations of collections, one document per migration in the migrations collection.
+
+The document also leases its migration to one process, which rewrites the collection while the others only check
+now and then whether it is done, and take over if the lease runs out.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.db.repositories.base import BaseRepository
+
+
+class MigrationRepository(BaseRepository):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = self.db.get_collection("migrations")
+    
+    async def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": name})
+    
+    async def claim(
+            self, name: str, *, owner: str, version: int, now: datetime, lease: timedelta
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Lease the migration to owner or extend the lease owner holds, None while another owner holds it.
+        
+        A migration to a version newer than version is left to the release that started it.
+        """
+        try:
+            # matches only a lease of owner or one that ran out, otherwise upserting collides with the document on _id
+            return await self.collection.find_one_and_update(
+                {
+                    "_id": name,
+                    "$or": [{"owner": owner}, {"lease_until": {"$lt": now}}],
+                    "version": {"$not": {"$gt": version}},
+                },
+                {"$set": {"owner": owner, "lease_until": now + lease}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return None
+    
+    async def checkpoint(self, name: str, *, owner: str, progress: Dict[str, Any], migrated: int = 0) -> bool:
+        """
+        Save the progress of the migration, False if owner lost the lease in the meantime
+        """
+        result = await self.collection.update_one(
+            {"_id": name, "owner": owner}, {"$set": progress, "$inc": {"migrated": migrated}},
+        )
+        return result.matched_count == 1
@@ -0,0 +1,120 @@
+"""
+Reminder and due jobs of tasks, kept on the task documents themselves.
+
+A task whose jobs need a look has next_fire_at set. The scheduler of any process leases such a task by moving
+next_fire_at past its lease in one find_one_and_update, so no other scheduler claims it until the lease runs out.
+"""
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+
+from app.db.repositories.base import BaseRepository
+from app.models.task import TaskJobKind, TaskStatus
+
+# task field holding the time of each kind of job, on equal times the reminder fires first
+JOB_FIELDS = {TaskJobKind.reminder: "remind_at", TaskJobKind.due: "due_at"}
+
+
+def pending_jobs(document: Dict[str, Any]) -> List[Tuple[datetime, TaskJobKind]]:
+    """
+    Jobs of a pending task that did not fire at their current time yet, earliest first.
+    
+    A job fires once per time, moving remind_at or due_at schedules it again.
+    """
+    if document.get("status") != TaskStatus.pending.value:
+        return []
+    
+    fired = document.get("fired") or {}
+    jobs = [
+        (at, kind)
+        for kind, field in JOB_FIELDS.items()
+        if (at := document.get(field)) is not None and fired.get(field) != at
+    ]
+    return sorted(jobs, key=lambda job: job[0])
+
+
+def next_fire_time(document: Dict[str, Any]) -> Optional[datetime]:
+    jobs = pending_jobs(document)
+    return jobs[0][0] if jobs else None
+
+
+def schedule_new_task(document: Dict[str, Any]) -> None:
+    """
+    Set next_fire_at on the document of a task about to be inserted, if it has jobs
+    """
+    if (at := next_fire_time(document)) is not None:
+        document["next_fire_at"] = at
+
+
+def task_update_operation(encoded_update_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    MongoDB update applying an encoded task update.
+    
+    An update that may change the task's jobs hands the task to the scheduler right away to be rescheduled,
+    and breaks a lease in progress, so the release of a job read before the update cannot undo that.
+    """
+    if not (
+            encoded_update_data.keys() & set(JOB_FIELDS.values())
+            or encoded_update_data.get("status") == TaskStatus.pending.value
+    ):
+        return {"$set": encoded_update_data}
+    
+    return {
+        "$set": {**encoded_update_data, "next_fire_at": encoded_update_data["updated"]},
+        "$unset": {"lease": ""},
+    }
+
+
+def fired_job(updated_fields: Dict[str, Any]) -> Optional[TaskJobKind]:
+    """
+    The job whose firing a change stream update of a task records, if it does
+    """
+    fired = {key.partition(".")[2] for key in updated_fields if key.startswith("fired.")}
+    # the whole subdocument is reported when the first job of a task fired
+    fired.update(updated_fields.get("fired") or {})
+    for kind, field in JOB_FIELDS.items():
+        if field in fired:
+            return kind
+    return None
+
+
+class TaskScheduleRepository(BaseRepository):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = self.db.get_collection("tasks")
+    
+    async def claim(self, *, now: datetime, lease: timedelta) -> Optional[Dict[str, Any]]:
+        """
+        Lease the task due first, if any is due by now, its document holds the lease token under "lease"
+        """
+        return await self.collection.find_one_and_update(
+            {"next_fire_at": {"$lte": now}},
+            {"$set": {"next_fire_at": now + lease, "lease": uuid.uuid4().hex}},
+            sort=[("next_fire_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+    
+    async def release(self, document: Dict[str, Any], fired: Optional[TaskJobKind] = None) -> bool:
+        """
+        End the lease of a claimed task, recording the job that fired and scheduling its next one.
+        
+        False if the lease was lost, because it ran out or the task was updated or deleted in the meantime.
+        """
+        update: Dict[str, Dict[str, Any]] = {"$set": {}, "$unset": {"lease": ""}}
+        fired_times = dict(document.get("fired") or {})
+        if fired is not None:
+            field = JOB_FIELDS[fired]
+            fired_times[field] = document[field]
+            update["$set"][f"fired.{field}"] = document[field]
+        
+        if (at := next_fire_time({**document, "fired": fired_times})) is not None:
+            update["$set"]["next_fire_at"] = at
+        else:
+            update["$unset"]["next_fire_at"] = ""
+        if not update["$set"]:
+            del update["$set"]
+        
+        result = await self.collection.update_one({"_id": document["_id"], "lease": document["lease"]}, update)
+        return result.matched_count == 1
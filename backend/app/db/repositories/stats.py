@@ -0,0 +1,141 @@
+import logging
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from pymongo import ASCENDING, DeleteMany, IndexModel, ReplaceOne, UpdateOne
+from pymongo.errors import PyMongoError
+
+from app.db.repositories.base import BaseRepository
+from app.models.core import datetime_now
+from app.models.task import TaskStats, TaskStatsDay, TaskStatus
+
+logger = logging.getLogger(__name__)
+
+# counters of every task of a tenant, the other documents count the tasks last updated on the day in their _id
+ALL_TASKS = "all"
+
+DAY_FORMAT = "%Y-%m-%d"
+
+STATS_INDEXES = [
+    # the counters of one tenant, which rebuild_stats replaces
+    IndexModel([("tenant", ASCENDING)], name="tenant"),
+]
+
+
+def counter_id(tenant: Optional[str], bucket: str) -> str:
+    """
+    _id of the counters of a tenant's bucket, buckets hold no "/" so the last one ends the tenant
+    """
+    return f"{tenant}/{bucket}"
+
+
+def task_buckets(document: Mapping[str, Any]) -> Iterable[Tuple[Tuple[Optional[str], str], str]]:
+    tenant = document.get("tenant")
+    yield (tenant, ALL_TASKS), document["status"]
+    yield (tenant, document["updated"].strftime(DAY_FORMAT)), document["status"]
+
+
+def stats_changes(before: Iterable[Mapping[str, Any]] = (), after: Iterable[Mapping[str, Any]] = ()) -> Counter:
+    """
+    Changes of the counters, keyed by ((tenant, bucket), status), when tasks go from the before to the after documents
+    """
+    changes = Counter()
+    for document in before:
+        for bucket in task_buckets(document):
+            changes[bucket] -= 1
+    for document in after:
+        for bucket in task_buckets(document):
+            changes[bucket] += 1
+    return changes
+
+
+def stats_from_counts(counts: Mapping[str, int]) -> Tuple[int, Dict[str, int]]:
+    by_status = {status.value: counts.get(status.value, 0) for status in TaskStatus}
+    return sum(by_status.values()), by_status
+
+
+class TaskStatsRepository(BaseRepository):
+    """
+    Task counts of a tenant per status and per day, kept as counters so reads do not depend on the number of tasks
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collection = self.db.get_collection("task_stats")
+        self.tasks = self.db.get_collection("tasks")
+    
+    async def create_indexes(self) -> List[str]:
+        return await self.collection.create_indexes(STATS_INDEXES)
+    
+    async def apply(self, changes: Counter) -> None:
+        """
+        Add changes to the counters in one round trip, each counter document changes atomically with $inc
+        """
+        increments = defaultdict(dict)
+        for (bucket, status), delta in changes.items():
+            if delta:
+                increments[bucket][f"counts.{status}"] = delta
+        if not increments:
+            return
+        
+        operations = [
+            # the tenant is kept outside the _id too, so rebuild_stats finds the counters of a tenant
+            UpdateOne(
+                {"_id": counter_id(tenant, bucket)}, {"$inc": inc, "$setOnInsert": {"tenant": tenant}}, upsert=True,
+            )
+            for (tenant, bucket), inc in increments.items()
+        ]
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            # the task write already happened, the counters drift until rebuild_stats runs
+            logger.error("Task stats update failed, rebuild them to repair: %s", e)
+    
+    async def get_stats(self, *, days: int) -> TaskStats:
+        today = datetime_now().date()
+        day_ids = [(today - timedelta(days=n)).strftime(DAY_FORMAT) for n in range(days)]
+        counter_ids = [counter_id(self.tenant, bucket) for bucket in (ALL_TASKS, *day_ids)]
+        
+        counters = {
+            document["_id"]: document.get("counts", {})
+            async for document in self.collection.find({"_id": {"$in": counter_ids}})
+        }
+        
+        by_day = []
+        for day_id in day_ids:
+            total, by_status = stats_from_counts(counters.get(counter_id(self.tenant, day_id), {}))
+            by_day.append(TaskStatsDay(day=date.fromisoformat(day_id), total=total, by_status=by_status))
+        
+        total, by_status = stats_from_counts(counters.get(counter_id(self.tenant, ALL_TASKS), {}))
+        return TaskStats(total=total, by_status=by_status, by_day=by_day)
+    
+    async def rebuild_stats(self) -> None:
+        """
+        Recount the tenant's tasks with $group and overwrite its counters, repairs drift left by failed counter writes.
+        
+        Writes that land while the tasks are counted can be missed, run it again if tasks were being written.
+        """
+        pipeline = [
+            {"$match": {"tenant": self.tenant}},
+            {"$group": {
+                # documents the migrator has not rewritten yet may hold updated as an ISO string
+                "_id": {
+                    "day": {"$dateToString": {"format": DAY_FORMAT, "date": {"$toDate": "$updated"}}},
+                    "status": "$status",
+                },
+                "count": {"$sum": 1},
+            }},
+        ]
+        counts = defaultdict(Counter)
+        async for group in self.tasks.aggregate(pipeline):
+            counts[counter_id(self.tenant, group["_id"]["day"])][group["_id"]["status"]] += group["count"]
+            counts[counter_id(self.tenant, ALL_TASKS)][group["_id"]["status"]] += group["count"]
+        
+        documents = [
+            {"_id": bucket, "tenant": self.tenant, "counts": dict(bucket_counts)}
+            for bucket, bucket_counts in counts.items()
+        ]
+        operations = [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents]
+        operations.append(DeleteMany({"tenant": self.tenant, "_id": {"$nin": list(counts)}}))
+        await self.collection.bulk_write(operations, ordered=True)
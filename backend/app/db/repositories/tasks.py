@@ -1,11 +1,181 @@
-from typing import List
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 from datetime import datetime
+import uuid
 
 from fastapi import HTTPException
-from fastapi.encoders import jsonable_encoder
+from pymongo import ASCENDING, DESCENDING, HASHED, TEXT, DeleteOne, IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from starlette.status import (
+    HTTP_200_OK,
+    HTTP_201_CREATED,
+    HTTP_204_NO_CONTENT,
+    HTTP_304_NOT_MODIFIED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+    HTTP_412_PRECONDITION_FAILED,
+    HTTP_500_INTERNAL_SERVER_ERROR,
+)
 
-from app.db.repositories.base import BaseRepository
-from app.models.task import TaskCreate, TaskPublic, TaskInDB, TaskUpdate
+from app.core.config import (
+    ARCHIVE_BATCH_SIZE,
+    DEFAULT_PAGE_SIZE,
+    EXPORT_BATCH_SIZE,
+    MAX_TASK_GRAPH_DEPTH,
+    MIGRATION_BATCH_SIZE,
+    TASK_SHARDING,
+)
+from app.db.cache import TaskCache
+from app.db.events import TaskEventBus
+from app.db.codec import (
+    decode_partial_task,
+    decode_task,
+    encode_task,
+    encode_task_update,
+    parse_task_id,
+    task_id_condition,
+    task_projection,
+    upgrade_task,
+)
+from app.db.pagination import (
+    decode_cursor,
+    decode_search_cursor,
+    encode_cursor,
+    encode_search_cursor,
+    keyset_filter,
+    merge_keyset_pages,
+    search_keyset_filter,
+)
+from app.db.repositories.archive import ARCHIVED_STATUSES, TaskArchiveRepository
+from app.db.repositories.base import BaseRepository, drop_indexes
+from app.db.repositories.schedule import schedule_new_task, task_update_operation
+from app.db.repositories.stats import TaskStatsRepository, stats_changes
+from app.db.singleflight import SingleFlight
+from app.models.core import SortOrder, datetime_now
+from app.models.task import (
+    TASK_SCHEMA_VERSION,
+    PartialTask,
+    PartialTaskPage,
+    TaskBatchItemResult,
+    TaskBatchUpdate,
+    TaskCreate,
+    TaskEventType,
+    TaskGraph,
+    TaskGraphNode,
+    TaskPage,
+    TaskPublic,
+    TaskInDB,
+    TaskRelation,
+    TaskStatus,
+    TaskUpdate,
+)
+
+DUPLICATE_KEY_ERROR = 11000
+
+T = TypeVar("T")
+
+# fields every listed task is read with, whatever fields were asked for, they make up cursors and page ETags
+PAGE_FIELDS = frozenset({"id", "updated"})
+
+# every query of a tenant's tasks has the tenant as an equality, so the tenant leads the indexes it uses
+TASK_INDEXES = [
+    # keyset pagination over all tasks of a tenant, walked backwards for ascending order
+    IndexModel([("tenant", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)], name="tenant_updated_id"),
+    # keyset pagination filtered by status
+    IndexModel(
+        [("tenant", ASCENDING), ("status", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)],
+        name="tenant_status_updated_id",
+    ),
+    # the archiver's batches, which look for old completed and cancelled tasks of every tenant at once
+    IndexModel([("status", ASCENDING), ("updated", ASCENDING)], name="status_updated"),
+    # subtasks of a task, for the walks of task graphs
+    IndexModel([("tenant", ASCENDING), ("parent_id", ASCENDING)], name="tenant_parent_id"),
+    # the scheduler's claims, only tasks with remind_at or due_at jobs to fire have next_fire_at
+    IndexModel([("next_fire_at", ASCENDING)], name="next_fire_at", sparse=True),
+    # full-text search, a match in the name counts more than one in the description
+    IndexModel(
+        [("tenant", ASCENDING), ("name", TEXT), ("description", TEXT)],
+        name="tenant_name_description_text",
+        weights={"name": 3, "description": 1},
+        default_language="english",
+    ),
+]
+# replaced by the indexes led by tenant, a collection holds one text index, so the old one must go first
+LEGACY_TASK_INDEXES = ["updated_id", "status_updated_id", "name_description_text"]
+
+# tasks of one tenant stay on one shard, so its queries target that shard, while tenants spread evenly
+TASK_SHARD_KEY = {"tenant": HASHED}
+TASK_SHARD_INDEX = IndexModel(list(TASK_SHARD_KEY.items()), name="tenant_hashed")
+
+# where a migration pass starts among the string ids of version 1 documents, and then among the UUIDs. MongoDB
+# sorts strings first, and a range condition on _id only matches ids of the type it compares to.
+MIGRATION_STARTS = ["", uuid.UUID(int=0)]
+
+# $graphLookup from a task to its subtasks or dependencies, and from a task up to its parent, the parent's parent and
+# so on. References are UUIDs, tasks still stored under a string id are only reached once the migrator rewrote them.
+TASK_RELATION_LOOKUPS = {
+    TaskRelation.subtasks: {"startWith": "$_id", "connectFromField": "_id", "connectToField": "parent_id"},
+    TaskRelation.dependencies: {"startWith": "$depends_on", "connectFromField": "depends_on", "connectToField": "_id"},
+}
+PARENT_LOOKUP = {"startWith": "$parent_id", "connectFromField": "parent_id", "connectToField": "_id"}
+DEPENDENTS_LOOKUP = {"startWith": "$_id", "connectFromField": "_id", "connectToField": "depends_on"}
+# for a relation, None for the parent, the walk on from the tasks a task is linked to and the walk from the task the
+# other way, which bounds how far a chain reaches on both sides of the task, see check_relation
+RELATION_CHECK_LOOKUPS = {
+    None: (PARENT_LOOKUP, TASK_RELATION_LOOKUPS[TaskRelation.subtasks]),
+    TaskRelation.dependencies: (TASK_RELATION_LOOKUPS[TaskRelation.dependencies], DEPENDENTS_LOOKUP),
+}
+# fields linking a task to others, bulk updates leave them alone, see bulk_update
+RELATION_FIELDS = {"parent_id", "depends_on"}
+# writes of a batch, each one after the first reads and writes again the tasks other requests changed meanwhile
+BATCH_WRITE_ROUNDS = 3
+
+
+def walked_levels(record: Dict[str, Any]) -> int:
+    """
+    Levels of tasks walk_relation reached from record, 0 when it is linked to none
+    """
+    return max(record["depths"], default=-1) + 1
+
+
+def holds(record: Optional[Dict[str, Any]], fields: Dict[str, Any]) -> bool:
+    """
+    Whether record stores every value of fields
+    """
+    return record is not None and all(record.get(key) == value for key, value in fields.items())
+
+
+def write_error_result(index: int, id: str, error: dict) -> TaskBatchItemResult:
+    status_code = HTTP_409_CONFLICT if error.get("code") == DUPLICATE_KEY_ERROR else HTTP_500_INTERNAL_SERVER_ERROR
+    
+    return TaskBatchItemResult(index=index, id=id, status_code=status_code, detail=error.get("errmsg"))
+
+
+def duplicate_id_result(index: int, id: str) -> TaskBatchItemResult:
+    return TaskBatchItemResult(
+        index=index, id=id, status_code=HTTP_409_CONFLICT, detail=f"Task {id} appears more than once in the batch",
+    )
+
+
+def task_page(
+        records: List[dict], next_cursor: Optional[str], fields: Optional[FrozenSet[str]]
+) -> Union[TaskPage, PartialTaskPage]:
+    if fields is None:
+        return TaskPage(tasks=[decode_task(t) for t in records], next_cursor=next_cursor)
+    return PartialTaskPage(tasks=[decode_partial_task(t) for t in records], next_cursor=next_cursor)
 
 
 class TaskRepository(BaseRepository):
@@ -16,55 +186,771 @@ class TaskRepository(BaseRepository):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.collection = self.db.get_collection("tasks")
+        self.cache: Optional[TaskCache] = getattr(self.app, "task_cache", None)
+        self.events: Optional[TaskEventBus] = getattr(self.app, "task_events", None)
+        self.reads: Optional[SingleFlight] = getattr(self.app, "task_reads", None)
+        self.migrator = getattr(self.app, "task_migrator", None)
+        self.stats = TaskStatsRepository(self.db, app=self.app, tenant=self.tenant)
+        self.archive = TaskArchiveRepository(self.db, app=self.app, tenant=self.tenant)
+    
+    def publish(
+            self, type: TaskEventType, task_id: Any, task: Optional[TaskPublic] = None, tenant: Optional[str] = None
+    ) -> None:
+        """
+        Tell readers about a write to a task of tenant, by default the repository's own
+        """
+        tenant = self.tenant if tenant is None else tenant
+        if self.reads is not None:
+            # reads already in flight may have missed this write, later callers must not join them
+            self.reads.forget("get", (tenant, str(task_id)))
+            self.reads.forget("list")
+            self.reads.forget("search")
+        if self.events is not None:
+            self.events.publish_write(type, task_id, task, tenant=tenant)
+    
+    async def invalidate(self, task_id: str) -> None:
+        if self.cache is not None and (id := parse_task_id(task_id)) is not None:
+            await self.cache.delete(str(id))
     
-    async def list_all_tasks(self) -> List[TaskPublic]:
-        task_records = await self.collection.find().to_list(10)
+    def id_condition(self, *ids: uuid.UUID) -> Any:
+        """
+        _id condition of the given tasks, it also matches string ids until the migrator rewrote them all
+        """
+        if self.migrator is not None and self.migrator.done:
+            return {"$in": list(ids)}
+        return task_id_condition(*ids)
+    
+    async def coalesce(self, kind: str, key: Hashable, read: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run read, or share the identical one already in flight when coalescing is on
+        """
+        if self.reads is None:
+            return await read()
+        return await self.reads.do(kind, key, read)
+    
+    def graph_lookup(self, lookup: Dict[str, str], max_depth: int) -> Dict[str, Any]:
+        """
+        $graphLookup stage walking lookup among the tenant's tasks into graph, each task with its depth, 0 for the first
+        step
+        """
+        return {"$graphLookup": {
+            "from": self.collection.name,
+            **lookup,
+            "as": "graph",
+            "maxDepth": max_depth,
+            "depthField": "depth",
+            "restrictSearchWithMatch": {"tenant": self.tenant},
+        }}
+    
+    async def check_relations(self, *, task_id: Optional[uuid.UUID], relations: Dict[str, Any]) -> None:
+        """
+        Raise unless the parent_id and depends_on among relations name tasks of this tenant without closing a cycle. A
+        task cannot be a subtask of its own subtasks, nor depend on a task that depends on it. A new task, task_id
+        None, has neither, so only its references are looked up.
+        
+        The check reads the stored tasks, two concurrent updates may still close a cycle. Graph reads visit every task
+        once, so they stay finite even then.
+        """
+        if (parent_id := relations.get("parent_id")) is not None:
+            await self.check_relation(task_id=task_id, targets=[parent_id], relation=None)
+        if depends_on := relations.get("depends_on"):
+            await self.check_relation(task_id=task_id, targets=depends_on, relation=TaskRelation.dependencies)
+    
+    async def check_relation(
+            self, *, task_id: Optional[uuid.UUID], targets: List[uuid.UUID], relation: Optional[TaskRelation]
+    ) -> None:
+        """
+        One aggregation finding the targets and walking on from them, up their parents when relation is None. For an
+        existing task a second one walks from the task the other way, down its subtasks or to the tasks depending on
+        it, which move along with it.
+        """
+        kind = "dependency" if relation == TaskRelation.dependencies else "parent"
+        if task_id in targets:
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail=f"Task {task_id} cannot be its own {kind}")
+        
+        lookup, reverse_lookup = RELATION_CHECK_LOOKUPS[relation]
+        records = await self.walk_relation(lookup, self.id_condition(*targets))
         
-        return [TaskPublic.model_validate(t) for t in task_records]
+        found = {parse_task_id(record["_id"]) for record in records}
+        if missing := [target for target in targets if target not in found]:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=f"The {kind} task {missing[0]} was not found")
+        if task_id is not None and any(parse_task_id(id) == task_id for record in records for id in record["reached"]):
+            detail = (
+                f"Task {task_id} cannot be a subtask of its own subtask" if relation is None
+                else f"Task {task_id} cannot depend on a task that depends on it"
+            )
+            raise HTTPException(status_code=HTTP_409_CONFLICT, detail=detail)
+        
+        # levels the task ends up below the top of its longest chain, and that its own chain reaches below it
+        above = 1 + max(map(walked_levels, records))
+        below = 0
+        if task_id is not None:
+            records = await self.walk_relation(reverse_lookup, self.id_condition(task_id))
+            below = max(map(walked_levels, records), default=0)
+        if above + below > MAX_TASK_GRAPH_DEPTH:
+            raise HTTPException(
+                status_code=HTTP_400_BAD_REQUEST,
+                detail=f"Chains of {kind} tasks are limited to {MAX_TASK_GRAPH_DEPTH} levels",
+            )
+    
+    async def walk_relation(self, lookup: Dict[str, str], id_condition: Any) -> List[Dict[str, Any]]:
+        """
+        The tenant's tasks matching id_condition, each with the ids and depths of the tasks lookup walks to from it
+        """
+        pipeline = [
+            {"$match": {"_id": id_condition, "tenant": self.tenant}},
+            # a chain reaching the walk's last level is already longer than allowed with a task added to it, so any
+            # longer chain is never walked to its end
+            self.graph_lookup(lookup, MAX_TASK_GRAPH_DEPTH - 1),
+            # only the ids and depths of the tasks walked leave the server
+            {"$set": {"reached": "$graph._id", "depths": "$graph.depth"}},
+            {"$project": {"reached": 1, "depths": 1}},
+        ]
+        return await self.collection.aggregate(pipeline).to_list(None)
+    
+    async def create_indexes(self) -> List[str]:
+        await drop_indexes(self.collection, LEGACY_TASK_INDEXES)
+        # shardCollection needs an index on the shard key of a collection that already holds tasks
+        indexes = [*TASK_INDEXES, TASK_SHARD_INDEX] if TASK_SHARDING else TASK_INDEXES
+        return (
+            await self.collection.create_indexes(indexes)
+            + await self.archive.create_indexes()
+            + await self.stats.create_indexes()
+        )
+    
+    async def adopt_tasks_without_tenant(self) -> int:
+        """
+        Give the tasks stored before tasks had tenants to this repository's tenant, and count them in its stats
+        """
+        # matches tasks without the field too, which sort first in the indexes led by tenant
+        adopted = await self.collection.update_many({"tenant": None}, {"$set": {"tenant": self.tenant}})
+        await self.archive.collection.update_many({"tenant": None}, {"$set": {"tenant": self.tenant}})
+        if adopted.modified_count:
+            # counters from before tenants counted the same tasks, without saying whose they were
+            await self.stats.collection.delete_many({"tenant": None})
+            await self.stats.rebuild_stats()
+        return adopted.modified_count
+    
+    async def list_all_tasks(
+            self,
+            *,
+            limit: int = DEFAULT_PAGE_SIZE,
+            cursor: Optional[str] = None,
+            status: Optional[TaskStatus] = None,
+            order: SortOrder = SortOrder.desc,
+            include_archived: bool = False,
+            fields: Optional[FrozenSet[str]] = None,
+    ) -> Union[TaskPage, PartialTaskPage]:
+        """
+        A page of tasks in update order, with only the given fields and those of PAGE_FIELDS if fields are given
+        """
+        async def read() -> Union[TaskPage, PartialTaskPage]:
+            query = {"tenant": self.tenant}
+            if status is not None:
+                query["status"] = status.value
+            if cursor is not None:
+                try:
+                    updated, id = decode_cursor(cursor)
+                except ValueError:
+                    raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+                query.update(keyset_filter(updated, id, order))
+            
+            direction = DESCENDING if order == SortOrder.desc else ASCENDING
+            sort = [("updated", direction), ("_id", direction)]
+            projection = None if fields is None else task_projection(fields | PAGE_FIELDS)
+            # the next cursor holds the sort key as stored, which compares like the documents' own
+            stored_keys = {}
+            
+            def upgrade(records: List[dict]) -> List[dict]:
+                upgraded = []
+                for record in records:
+                    upgraded.append(task := upgrade_task(record))
+                    stored_keys[task["_id"]] = (record["updated"], record["_id"])
+                return upgraded
+            
+            # fetch one extra record to learn whether another page exists
+            task_records = await self.collection.find(query, projection).sort(sort).limit(limit + 1).to_list(limit + 1)
+            # pages are merged by native values, which older documents may not hold yet
+            task_records = upgrade(task_records)
+            if include_archived:
+                # the archive is paginated by the same keys, so the page is the start of both merged
+                archived_cursor = self.archive.collection.find(query, projection).sort(sort).limit(limit + 1)
+                archived_records = upgrade(await archived_cursor.to_list(limit + 1))
+                task_records = merge_keyset_pages(task_records, archived_records, order=order)[:limit + 1]
+            
+            next_cursor = None
+            if len(task_records) > limit:
+                task_records = task_records[:limit]
+                next_cursor = encode_cursor(*stored_keys[task_records[-1]["_id"]])
+            
+            return task_page(task_records, next_cursor, fields)
+        
+        return await self.coalesce("list", (self.tenant, limit, cursor, status, order, include_archived, fields), read)
+    
+    async def search_tasks(
+            self,
+            *,
+            q: str,
+            limit: int = DEFAULT_PAGE_SIZE,
+            cursor: Optional[str] = None,
+            status: Optional[TaskStatus] = None,
+            fields: Optional[FrozenSet[str]] = None,
+    ) -> Union[TaskPage, PartialTaskPage]:
+        """
+        Tasks matching the text search q, most relevant first
+        """
+        async def read() -> Union[TaskPage, PartialTaskPage]:
+            # the text index is led by tenant, which a $text query has to match exactly
+            match = {"tenant": self.tenant, "$text": {"$search": q}}
+            if status is not None:
+                match["status"] = status.value
+            
+            pipeline = [{"$match": match}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+            if cursor is not None:
+                try:
+                    score, id = decode_search_cursor(cursor)
+                except ValueError:
+                    raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+                pipeline.append({"$match": search_keyset_filter(score, id)})
+            # fetch one extra record to learn whether another page exists
+            pipeline += [{"$sort": {"score": -1, "_id": 1}}, {"$limit": limit + 1}]
+            if fields is not None:
+                pipeline.append({"$project": {**task_projection(fields | PAGE_FIELDS), "score": 1}})
+            
+            task_records = [upgrade_task(task) for task in await self.collection.aggregate(pipeline).to_list(limit + 1)]
+            
+            next_cursor = None
+            if len(task_records) > limit:
+                task_records = task_records[:limit]
+                last = task_records[-1]
+                next_cursor = encode_search_cursor(last["score"], last["_id"])
+            
+            return task_page(task_records, next_cursor, fields)
+        
+        return await self.coalesce("search", (self.tenant, q, limit, cursor, status, fields), read)
+    
+    async def iter_tasks(
+            self,
+            *,
+            status: Optional[TaskStatus] = None,
+            updated_after: Optional[datetime] = None,
+            updated_before: Optional[datetime] = None,
+            batch_size: int = EXPORT_BATCH_SIZE,
+            fields: Optional[FrozenSet[str]] = None,
+    ) -> AsyncIterator[Union[List[TaskPublic], List[PartialTask]]]:
+        """
+        Walk every matching task in update order, yielding at most batch_size tasks at a time
+        """
+        query = {"tenant": self.tenant}
+        if status is not None:
+            query["status"] = status.value
+        if updated_after is not None or updated_before is not None:
+            query["updated"] = {}
+            if updated_after is not None:
+                query["updated"]["$gte"] = updated_after
+            if updated_before is not None:
+                query["updated"]["$lt"] = updated_before
+        
+        projection = None if fields is None else task_projection(fields)
+        cursor = self.collection.find(query, projection).sort(
+            [("updated", ASCENDING), ("_id", ASCENDING)]
+        ).batch_size(batch_size)
+        decode = decode_task if fields is None else decode_partial_task
+        
+        batch = []
+        async for task_record in cursor:
+            batch.append(decode(task_record))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        
+        if batch:
+            yield batch
     
     async def create_task(self, *, task: TaskCreate) -> TaskPublic:
-        create_data = task.model_dump()
+        create_data = {**task.model_dump(), "tenant": self.tenant}
+        await self.check_relations(task_id=None, relations=create_data)
         created_task = TaskInDB.model_validate(create_data)  # autofill created task with id and timestamp
-        encoded_created_task = jsonable_encoder(created_task)
-   
-        new_task = await self.collection.insert_one(encoded_created_task)
-        fetched_created_task = await self.collection.find_one(
-            {"_id": new_task.inserted_id}
-        )
+        encoded_created_task = encode_task(created_task)
+        schedule_new_task(encoded_created_task)
+        
+        await self.collection.insert_one(encoded_created_task)
+        await self.stats.apply(stats_changes(after=[encoded_created_task]))
+        
+        # the inserted document is exactly what was built here, so there is no need to read it back
+        created_task = decode_task(encoded_created_task)
+        if self.cache is not None:
+            await self.cache.set(created_task)
+        self.publish(TaskEventType.created, created_task.id, created_task)
+        
+        return created_task
+    
+    async def get_task_by_id(self, *, id: str, include_archived: bool = False) -> TaskPublic:
+        if (task_id := parse_task_id(id)) is None:
+            return None
+        
+        if self.cache is not None and (task := await self.cache.get(str(task_id))) is not None:
+            # ids are unique across tenants, a cached task of another tenant means this one has none
+            return task if task.tenant == self.tenant else None
+        
+        async def read() -> Optional[TaskPublic]:
+            read_started = self.cache.start_read() if self.cache is not None else 0
+            query = {"_id": self.id_condition(task_id), "tenant": self.tenant}
+            if (task := await self.collection.find_one(query)) is not None:
+                task = decode_task(task)
+                if self.cache is not None:
+                    # a write that landed during the read leaves the cache alone, the task read may be older
+                    await self.cache.fill(task, read_started)
+                return task
         
-        return TaskPublic.model_validate(fetched_created_task)
+        if (task := await self.coalesce("get", (self.tenant, str(task_id)), read)) is not None:
+            return task
+        
+        # archived tasks are rarely read and never cached, the cache only holds live tasks
+        if include_archived:
+            return await self.archive.get_task_by_id(id=task_id)
     
-    async def get_task_by_id(self, *, id: str, ) -> TaskPublic:
-        if (task := await self.collection.find_one({"_id": id})) is not None:
-            return TaskPublic.model_validate(task)
+    async def get_task_graph(self, *, task_id: str, relation: TaskRelation, max_depth: int) -> Optional[TaskGraph]:
+        """
+        The task with its subtasks or dependencies, theirs and so on up to max_depth levels, in one aggregation
+        """
+        if (id := parse_task_id(task_id)) is None:
+            return None
+        
+        pipeline = [
+            {"$match": {"_id": self.id_condition(id), "tenant": self.tenant}},
+            # one level more than asked for tells whether the graph goes on
+            self.graph_lookup(TASK_RELATION_LOOKUPS[relation], max_depth),
+        ]
+        records = await self.collection.aggregate(pipeline).to_list(1)
+        if not records:
+            return None
+        
+        task = upgrade_task(records[0])
+        graph = task.pop("graph")
+        # a cycle closed by concurrent updates leads back to the task itself
+        nodes = [
+            TaskGraphNode.model_validate({**upgrade_task(node), "depth": node["depth"] + 1})
+            for node in graph if node["depth"] < max_depth and node["_id"] != task["_id"]
+        ]
+        nodes.sort(key=lambda node: (node.depth, str(node.id)))
+        
+        return TaskGraph(
+            task=decode_task(task),
+            relation=relation,
+            tasks=nodes,
+            truncated=any(node["depth"] == max_depth for node in graph),
+        )
     
-    async def update_task_by_id(self, task_id: str, task: TaskPublic, task_update: TaskUpdate) -> TaskPublic:
+    async def update_task_by_id(
+            self,
+            *,
+            task_id: str,
+            task_update: TaskUpdate,
+            expected_updated: Optional[List[datetime]] = None,
+    ) -> TaskPublic:
+        """
+        Apply task_update in one round trip, if expected_updated is given the task must still be at one of those versions
+        """
+        id = parse_task_id(task_id)
+        query = {"_id": None if id is None else self.id_condition(id), "tenant": self.tenant}
+        if expected_updated is not None:
+            query["updated"] = {"$in": expected_updated}
+        
         update_data = task_update.model_dump(exclude_unset=True)
         
-        # if there are any changes, change updated field to now, else raise 304 error
-        if update_data:
-            update_data['updated'] = datetime.now()
-        else:
-            raise HTTPException(status_code=304, detail=f"Task {task_id} is not modified")
+        # if there are no changes, tell a missing task apart from an unmodified one and raise
+        if not update_data:
+            if query["_id"] is None or await self.collection.find_one(query, projection={"_id": 1}) is None:
+                await self.raise_missing_or_modified(task_id=task_id, expected_updated=expected_updated)
+            raise HTTPException(status_code=HTTP_304_NOT_MODIFIED, detail=f"Task {task_id} is not modified")
         
-        updated_task = task.model_copy(update=update_data)
-        encoded_updated_task = jsonable_encoder(updated_task)
+        if id is not None:
+            await self.check_relations(task_id=id, relations=update_data)
+        update_data["updated"] = datetime_now()
         
-        await self.collection.update_one(
-            {"_id": task_id}, {"$set": encoded_updated_task}
-        )
+        encoded_update_data = encode_task_update(update_data)
         
-        if (
-                fetched_updated_task := await self.collection.find_one({"_id": task_id})
+        # the version before the update tells which counters to move, the new one is merged here
+        if query["_id"] is None or (
+                old_task := await self.collection.find_one_and_update(
+                    query,
+                    task_update_operation(encoded_update_data),
+                    return_document=ReturnDocument.BEFORE,
+                )
         ) is None:
-            raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+            await self.raise_missing_or_modified(task_id=task_id, expected_updated=expected_updated)
         
-        return TaskPublic.model_validate(fetched_updated_task)
+        old_task = upgrade_task(old_task)
+        new_task = {**old_task, **encoded_update_data}
+        await self.stats.apply(stats_changes(before=[old_task], after=[new_task]))
+        
+        updated_task = decode_task(new_task)
+        if self.cache is not None:
+            await self.cache.set(updated_task)
+        self.publish(TaskEventType.updated, updated_task.id, updated_task)
+        
+        return updated_task
+    
+    async def raise_missing_or_modified(self, *, task_id: str, expected_updated: Optional[List[datetime]]) -> None:
+        await self.invalidate(task_id)
+        
+        # only a conditional write needs another look to know why nothing matched
+        if (
+                expected_updated is not None
+                and (id := parse_task_id(task_id)) is not None
+                and await self.collection.find_one(
+                    {"_id": self.id_condition(id), "tenant": self.tenant}, projection={"_id": 1}
+                ) is not None
+        ):
+            raise HTTPException(status_code=HTTP_412_PRECONDITION_FAILED, detail=f"Task {task_id} has been modified")
+        
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found")
     
-    async def delete_task_by_id(self, task_id: str):
-        delete_result = await self.collection.delete_one({"_id": task_id})
+    async def delete_task_by_id(self, task_id: str, soft: bool = False):
+        """
+        Delete a task, or with soft move it to the archive where include_archived still finds it
+        """
+        if (id := parse_task_id(task_id)) is None:
+            raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+        
+        projection = None if soft else {"tenant": 1, "status": 1, "updated": 1}
+        deleted_task = await self.collection.find_one_and_delete(
+            {"_id": self.id_condition(id), "tenant": self.tenant}, projection=projection,
+        )
+        await self.invalidate(task_id)
         
-        if delete_result.deleted_count != 1:
+        if deleted_task is None:
             raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+        deleted_task = upgrade_task(deleted_task)
+        if soft:
+            try:
+                await self.archive.store([deleted_task])
+            except PyMongoError:
+                # put the task back rather than lose it
+                await self.collection.insert_one(deleted_task)
+                raise
+        await self.stats.apply(stats_changes(before=[deleted_task]))
+        self.publish(TaskEventType.deleted, id)
         
         return None
+    
+    async def bulk_create(self, *, tasks: List[TaskCreate]) -> List[TaskBatchItemResult]:
+        created_tasks = [TaskInDB.model_validate({**task.model_dump(), "tenant": self.tenant}) for task in tasks]
+        encoded_created_tasks = [encode_task(task) for task in created_tasks]
+        for encoded_task in encoded_created_tasks:
+            schedule_new_task(encoded_task)
+        
+        # only tasks with a parent or dependencies cost a query
+        relation_errors = {}
+        for index, task in enumerate(tasks):
+            try:
+                await self.check_relations(task_id=None, relations=task.model_dump(include=RELATION_FIELDS))
+            except HTTPException as e:
+                relation_errors[index] = e
+        inserted_indexes = [index for index in range(len(tasks)) if index not in relation_errors]
+        
+        write_errors = {}
+        if inserted_indexes:
+            try:
+                await self.collection.insert_many(
+                    [encoded_created_tasks[index] for index in inserted_indexes], ordered=False,
+                )
+            except BulkWriteError as e:
+                write_errors = {inserted_indexes[error["index"]]: error for error in e.details["writeErrors"]}
+        
+        await self.stats.apply(stats_changes(
+            after=[encoded_created_tasks[index] for index in inserted_indexes if index not in write_errors]
+        ))
+        
+        results = []
+        for index, encoded_task in enumerate(encoded_created_tasks):
+            task_id = str(encoded_task["_id"])
+            if index in relation_errors:
+                error = relation_errors[index]
+                results.append(TaskBatchItemResult(
+                    index=index, id=task_id, status_code=error.status_code, detail=error.detail,
+                ))
+            elif index in write_errors:
+                results.append(write_error_result(index, task_id, write_errors[index]))
+            else:
+                # new ids cannot be stale in the cache, and caching a whole import would evict the hot tasks
+                created_task = decode_task(encoded_task)
+                self.publish(TaskEventType.created, task_id, created_task)
+                results.append(TaskBatchItemResult(
+                    index=index, id=task_id, status_code=HTTP_201_CREATED, task=created_task,
+                ))
+        
+        return results
+    
+    async def read_batch(
+            self, ids: List[uuid.UUID], projection: Optional[Dict[str, Any]] = None
+    ) -> Dict[uuid.UUID, Dict[str, Any]]:
+        """
+        The stored documents of the tenant's tasks among ids, by id
+        """
+        if not ids:
+            return {}
+        query = {"_id": self.id_condition(*ids), "tenant": self.tenant}
+        return {
+            parse_task_id(record["_id"]): record async for record in self.collection.find(query, projection=projection)
+        }
+    
+    def version_filter(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Filter matching the task of record only while it is still at the version read
+        """
+        return {"_id": record["_id"], "tenant": self.tenant, "updated": record.get("updated")}
+    
+    async def bulk_update(self, *, task_updates: List[TaskBatchUpdate]) -> List[TaskBatchItemResult]:
+        """
+        Apply the updates with one unordered bulk_write, each pinned on the updated value read, so the counters move
+        from the version it replaced. An update matches nothing once another request changed its task since the read,
+        such tasks are read and written again, up to BATCH_WRITE_ROUNDS times.
+        """
+        ids = [id for task_update in task_updates if (id := parse_task_id(task_update.id)) is not None]
+        records = await self.read_batch(ids)
+        
+        results = [None] * len(task_updates)
+        pending: Dict[int, Tuple[uuid.UUID, Dict[str, Any]]] = {}
+        seen_ids = set()
+        for index, task_update in enumerate(task_updates):
+            task_id = task_update.id
+            id = parse_task_id(task_id)
+            update_data = task_update.model_dump(exclude_unset=True, exclude={"id"})
+            
+            if id is not None and id in seen_ids:
+                results[index] = duplicate_id_result(index, task_id)
+            elif id not in records:
+                results[index] = TaskBatchItemResult(
+                    index=index, id=task_id, status_code=HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found",
+                )
+            elif not update_data:
+                results[index] = TaskBatchItemResult(
+                    index=index, id=task_id, status_code=HTTP_304_NOT_MODIFIED, detail=f"Task {task_id} is not modified",
+                )
+            elif update_data.keys() & RELATION_FIELDS:
+                # checked against the stored tasks, updates in one batch could together close a cycle
+                results[index] = TaskBatchItemResult(
+                    index=index,
+                    id=task_id,
+                    status_code=HTTP_400_BAD_REQUEST,
+                    detail="parent_id and depends_on are changed one task at a time, with PUT /api/tasks/{task_id}/",
+                )
+            else:
+                pending[index] = (id, update_data)
+            seen_ids.add(id)
+        
+        stats_before, stats_after = [], []
+        for attempt in range(BATCH_WRITE_ROUNDS):
+            if attempt:
+                records = await self.read_batch([id for id, _ in pending.values()])
+            updated = datetime_now()
+            operations, written = [], []
+            for index, (id, update_data) in list(pending.items()):
+                task_id = task_updates[index].id
+                if (record := records.get(id)) is None:
+                    del pending[index]
+                    await self.invalidate(task_id)
+                    results[index] = TaskBatchItemResult(
+                        index=index, id=task_id, status_code=HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found",
+                    )
+                    continue
+                encoded_update_data = encode_task_update({**update_data, "updated": updated})
+                operations.append(UpdateOne(self.version_filter(record), task_update_operation(encoded_update_data)))
+                written.append((index, id, upgrade_task(record), encoded_update_data))
+            if not operations:
+                break
+            
+            write_errors, matched_count = {}, 0
+            try:
+                matched_count = (await self.collection.bulk_write(operations, ordered=False)).matched_count
+            except BulkWriteError as e:
+                write_errors = {error["index"]: error for error in e.details["writeErrors"]}
+                matched_count = e.details["nMatched"]
+            
+            missed_ids = set()
+            if matched_count + len(write_errors) < len(operations):
+                # an update reached its task if the task holds all it wrote, another write within the same
+                # millisecond leaves the same updated value
+                stored = await self.read_batch([id for _, id, _, _ in written])
+                missed_ids = {
+                    id for _, id, _, encoded_update_data in written if not holds(stored.get(id), encoded_update_data)
+                }
+            
+            for operation_index, (index, id, old_task, encoded_update_data) in enumerate(written):
+                task_id = task_updates[index].id
+                if operation_index in write_errors:
+                    await self.invalidate(task_id)
+                    results[index] = write_error_result(index, task_id, write_errors[operation_index])
+                elif id in missed_ids:
+                    continue
+                else:
+                    new_task = {**old_task, **encoded_update_data}
+                    stats_before.append(old_task)
+                    stats_after.append(new_task)
+                    updated_task = decode_task(new_task)
+                    if self.cache is not None:
+                        await self.cache.set(updated_task)
+                    self.publish(TaskEventType.updated, updated_task.id, updated_task)
+                    results[index] = TaskBatchItemResult(
+                        index=index, id=task_id, status_code=HTTP_200_OK, task=updated_task,
+                    )
+                del pending[index]
+        await self.stats.apply(stats_changes(stats_before, stats_after))
+        
+        for index in pending:
+            results[index] = await self.batch_conflict_result(index, task_updates[index].id)
+        
+        return results
+    
+    async def bulk_delete(self, *, task_ids: List[str]) -> List[TaskBatchItemResult]:
+        """
+        Delete the tasks with one unordered bulk_write, each delete pinned on the updated value read, so the counters
+        move by the version deleted. Tasks another request changed since the read are read and deleted again, up to
+        BATCH_WRITE_ROUNDS times.
+        """
+        results = [None] * len(task_ids)
+        pending: Dict[int, uuid.UUID] = {}
+        seen_ids = set()
+        for index, task_id in enumerate(task_ids):
+            id = parse_task_id(task_id)
+            if id is not None and id in seen_ids:
+                results[index] = duplicate_id_result(index, task_id)
+            elif id is not None:
+                pending[index] = id
+            seen_ids.add(id)
+        
+        deleted_tasks = []
+        for _ in range(BATCH_WRITE_ROUNDS):
+            records = await self.read_batch(list(pending.values()), {"tenant": 1, "status": 1, "updated": 1})
+            operations, written = [], []
+            for index, id in list(pending.items()):
+                if (record := records.get(id)) is None:
+                    del pending[index]
+                else:
+                    operations.append(DeleteOne(self.version_filter(record)))
+                    written.append((index, record))
+            if not operations:
+                break
+            
+            kept_ids = set()
+            if (await self.collection.bulk_write(operations, ordered=False)).deleted_count < len(operations):
+                # as in archive_tasks, a task still there was changed since it was read
+                kept_ids = set(await self.read_batch([pending[index] for index, _ in written], {"_id": 1}))
+            for index, record in written:
+                if pending[index] not in kept_ids:
+                    deleted_tasks.append(upgrade_task(record))
+                    results[index] = TaskBatchItemResult(
+                        index=index, id=task_ids[index], status_code=HTTP_204_NO_CONTENT,
+                    )
+                    del pending[index]
+        await self.stats.apply(stats_changes(before=deleted_tasks))
+        for task_id in task_ids:
+            await self.invalidate(task_id)
+        
+        for index, task_id in enumerate(task_ids):
+            if index in pending:
+                results[index] = await self.batch_conflict_result(index, task_id)
+            elif results[index] is None:
+                results[index] = TaskBatchItemResult(
+                    index=index, id=task_id, status_code=HTTP_404_NOT_FOUND, detail=f"Task {task_id} not found",
+                )
+            elif results[index].status_code == HTTP_204_NO_CONTENT:
+                self.publish(TaskEventType.deleted, parse_task_id(task_id))
+        
+        return results
+    
+    async def batch_conflict_result(self, index: int, task_id: str) -> TaskBatchItemResult:
+        await self.invalidate(task_id)
+        return TaskBatchItemResult(
+            index=index,
+            id=task_id,
+            status_code=HTTP_409_CONFLICT,
+            detail=f"Task {task_id} kept changing while the batch was written",
+        )
+    
+    async def archive_tasks(self, *, updated_before: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        """
+        Move completed and cancelled tasks of every tenant last updated before updated_before to the archive, one batch
+        at a time.
+        
+        Tasks are copied before they are deleted, a failure in between leaves a task in both places but never loses it.
+        """
+        query = {"status": {"$in": ARCHIVED_STATUSES}, "updated": {"$lt": updated_before}}
+        archived_count = 0
+        while True:
+            task_records = await self.collection.find(query).limit(batch_size).to_list(batch_size)
+            if not task_records:
+                return archived_count
+            
+            await self.archive.store(task_records)
+            ids = [task["_id"] for task in task_records]
+            # matching the query again keeps tasks that were updated since they were read
+            delete_result = await self.collection.delete_many({"_id": {"$in": ids}, **query})
+            
+            moved_records = task_records
+            if delete_result.deleted_count < len(ids):
+                kept_ids = {
+                    task["_id"] async for task in self.collection.find({"_id": {"$in": ids}}, projection={"_id": 1})
+                }
+                await self.archive.discard(list(kept_ids))
+                moved_records = [task for task in task_records if task["_id"] not in kept_ids]
+            
+            await self.stats.apply(stats_changes(before=moved_records))
+            for task in moved_records:
+                await self.invalidate(str(task["_id"]))
+                self.publish(TaskEventType.deleted, task["_id"], tenant=task.get("tenant"))
+            archived_count += len(moved_records)
+    
+    async def migrate_tasks(
+            self, *, after: Any = MIGRATION_STARTS[0], batch_size: int = MIGRATION_BATCH_SIZE
+    ) -> Tuple[int, Optional[Any]]:
+        """
+        Rewrite the next batch of tasks of every tenant stored by an older schema version, walking _id upwards from
+        after. Returns how many were rewritten and where the next batch starts, None once the pass is complete.
+        
+        A task under a UUID written by a request since it was read is left as it is, the next pass finds it again.
+        """
+        # documents without schema_version are of version 1
+        query = {"_id": {"$gt": after}, "schema_version": {"$not": {"$gte": TASK_SCHEMA_VERSION}}}
+        task_records = await self.collection.find(query).sort("_id", ASCENDING).limit(batch_size).to_list(batch_size)
+        
+        operations, changed_ids, moved_ids = [], [], []
+        for task in task_records:
+            upgraded = upgrade_task(task)
+            if upgraded["_id"] != task["_id"]:
+                moved_ids.append(task["_id"])
+                continue
+            # only the upgraded fields are set, the scheduler may be holding a lease on the task
+            changes = {key: value for key, value in upgraded.items() if task.get(key) != value}
+            operations.append(UpdateOne({"_id": task["_id"], "updated": task.get("updated")}, {"$set": changes}))
+            if any(task.get(key) != value for key, value in upgraded.items() if key != "schema_version"):
+                changed_ids.append(upgraded["_id"])
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+        
+        # an _id cannot change. The document under the string goes first and what was deleted, with whatever requests
+        # wrote since it was read, comes back under the UUID. The task is missing for a moment, never there twice.
+        for id in moved_ids:
+            if (deleted := await self.collection.find_one_and_delete({"_id": id})) is None:
+                # deleted by a request since it was read
+                continue
+            upgraded = upgrade_task(deleted)
+            try:
+                await self.collection.insert_one(upgraded)
+            except BaseException:
+                # put the task back rather than lose it, also when the pass is cancelled, the next pass tries again
+                await self.collection.insert_one(deleted)
+                raise
+            changed_ids.append(upgraded["_id"])
+        # cached copies of tasks whose values changed, e.g. timestamps truncated to milliseconds, are stale
+        for id in changed_ids:
+            await self.invalidate(str(id))
+        
+        if len(task_records) == batch_size:
+            return len(task_records), task_records[-1]["_id"]
+        # the string ids are done, the UUIDs follow
+        if isinstance(after, str):
+            return len(task_records), MIGRATION_STARTS[1]
+        return len(task_records), None
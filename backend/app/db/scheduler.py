@@ -0,0 +1,178 @@
+"""
+Background task that fires the reminder and due jobs of tasks.
+
+Every worker process runs one. Each job is claimed with a lease on its task, so one scheduler fires it and a job
+whose scheduler died fires again once the lease runs out: handlers see every job at least once.
+"""
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import FastAPI
+from pymongo.errors import PyMongoError
+
+from app.core.config import (
+    SCHEDULER_BATCH_SIZE,
+    SCHEDULER_ENABLED,
+    SCHEDULER_LEASE_SECONDS,
+    SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_POLL_SECONDS,
+)
+from app.db.codec import decode_task
+from app.db.repositories.schedule import TaskScheduleRepository, pending_jobs
+from app.models.core import datetime_now
+from app.models.task import TaskEventType, TaskJobKind, TaskPublic
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskJob:
+    kind: TaskJobKind
+    # the remind_at or due_at the job fires for
+    at: datetime
+    task: TaskPublic
+
+
+JobHandler = Callable[[TaskJob], Awaitable[None]]
+
+
+class TaskScheduler:
+    def __init__(
+            self,
+            app: FastAPI,
+            *,
+            batch_size: int,
+            poll_interval: float,
+            lease: timedelta,
+            max_concurrency: int,
+    ) -> None:
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.handlers: List[JobHandler] = []
+        # claims wait for a free slot, so no job is leased while it cannot be handled yet
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.fired = app.metrics.counter("task_jobs_fired_total", "Task jobs whose handlers all succeeded", ("kind",))
+        self.failed = app.metrics.counter(
+            "task_jobs_failed_total", "Task jobs fired again after their lease since a handler failed", ("kind",),
+        )
+        self.runner: Optional[asyncio.Task] = None
+    
+    def add_handler(self, handler: JobHandler) -> None:
+        """
+        Call handler with every job that fires, after the handlers added before it
+        """
+        self.handlers.append(handler)
+    
+    def start(self) -> None:
+        self.runner = asyncio.create_task(self.run())
+    
+    async def run(self) -> None:
+        # workers started together should not all claim at the same moment
+        await asyncio.sleep(random.uniform(0, self.poll_interval))
+        while True:
+            try:
+                claimed = await self.run_once()
+            except PyMongoError as e:
+                logger.warning("Claiming task jobs failed, retrying in %ss: %s", self.poll_interval, e)
+                claimed = 0
+            except Exception:
+                # anything else would end the runner, and no job would fire until the process restarts
+                logger.exception("Running task jobs failed, retrying in %ss", self.poll_interval)
+                claimed = 0
+            # after a full batch more jobs are likely due already
+            if claimed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+    
+    async def run_once(self) -> int:
+        """
+        Claim up to batch_size due tasks and fire their jobs, returns once every claimed job is handled
+        """
+        schedule_repo = TaskScheduleRepository(self.app.database, app=self.app)
+        dispatches: List[asyncio.Task] = []
+        try:
+            while len(dispatches) < self.batch_size:
+                await self.slots.acquire()
+                now = datetime_now()
+                try:
+                    document = await schedule_repo.claim(now=now, lease=self.lease)
+                except BaseException:
+                    self.slots.release()
+                    raise
+                if document is None:
+                    self.slots.release()
+                    break
+                dispatches.append(asyncio.create_task(self.dispatch(schedule_repo, document, now)))
+        finally:
+            # jobs already claimed are handled even if the next claim failed
+            await asyncio.gather(*dispatches)
+        return len(dispatches)
+    
+    async def dispatch(self, schedule_repo: TaskScheduleRepository, document: Dict[str, Any], now: datetime) -> None:
+        """
+        Fire the earliest job of a claimed task if it is due, then release the task until its next job
+        """
+        try:
+            fired = None
+            if (jobs := pending_jobs(document)) and jobs[0][0] <= now:
+                at, fired = jobs[0]
+                try:
+                    # a document that does not decode fails like a handler would
+                    job = TaskJob(kind=fired, at=at, task=decode_task(document))
+                    for handler in self.handlers:
+                        await handler(job)
+                except Exception:
+                    logger.exception(
+                        "Task %s %s job failed, firing again in %s", document["_id"], fired.value, self.lease,
+                    )
+                    self.failed.labels(fired.value).inc()
+                    return
+                self.fired.labels(fired.value).inc()
+            
+            if not await schedule_repo.release(document, fired):
+                logger.info("Task %s was updated or claimed again while its job was handled", document["_id"])
+        except PyMongoError as e:
+            logger.warning("Releasing task %s failed, looking at it again after the lease: %s", document["_id"], e)
+        finally:
+            self.slots.release()
+    
+    async def close(self) -> None:
+        if self.runner is not None:
+            self.runner.cancel()
+            try:
+                await self.runner
+            except asyncio.CancelledError:
+                pass
+            self.runner = None
+
+
+def job_event_publisher(app: FastAPI) -> JobHandler:
+    """
+    Handler sending a reminder or due event to the clients following task events
+    """
+    async def publish(job: TaskJob) -> None:
+        # with a change stream the release of the job is the event, publish_write leaves it to that
+        app.task_events.publish_write(TaskEventType(job.kind.value), job.task.id, job.task)
+    
+    return publish
+
+
+def start_task_scheduler(app: FastAPI) -> Optional[TaskScheduler]:
+    if not SCHEDULER_ENABLED:
+        return None
+    
+    scheduler = TaskScheduler(
+        app,
+        batch_size=SCHEDULER_BATCH_SIZE,
+        poll_interval=SCHEDULER_POLL_SECONDS,
+        lease=timedelta(seconds=SCHEDULER_LEASE_SECONDS),
+        max_concurrency=SCHEDULER_MAX_CONCURRENCY,
+    )
+    scheduler.add_handler(job_event_publisher(app))
+    scheduler.start()
+    return scheduler
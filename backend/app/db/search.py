@@ -0,0 +1,142 @@
+"""
+In-process full-text index for backends without MongoDB text search.
+
+Follows $text semantics closely enough for tests and benchmarks: case-insensitive terms with
+English stop words dropped and suffixes stemmed, any term matches, "quoted phrases" are required
+and -terms exclude. Scores weigh each field like a text index, but are not equal to textScore.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Mapping, Set
+
+TOKEN = re.compile(r"\w+")
+QUERY_TOKEN = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+
+STOP_WORDS = frozenset(
+    "a about an and are as at be but by for from has have i in is it its of on or that the this to was were "
+    "will with".split()
+)
+
+SUFFIXES = ("ingly", "edly", "ing", "ed", "ly")
+
+
+def stem(word: str) -> str:
+    """
+    Crude English stemmer, maps bake, baked, baking and bakes to the same term
+    """
+    if word.endswith("ies") and len(word) > 4:
+        word = word[:-3] + "y"
+    elif word.endswith("s") and not word.endswith("ss") and len(word) > 3:
+        word = word[:-1]
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(word) for word in TOKEN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+@dataclass
+class TextQuery:
+    terms: Set[str] = field(default_factory=set)
+    phrases: List[str] = field(default_factory=list)
+    excluded_terms: Set[str] = field(default_factory=set)
+    excluded_phrases: List[str] = field(default_factory=list)
+
+
+def parse_query(search: str) -> TextQuery:
+    query = TextQuery()
+    for negated_phrase, phrase, negated, word in QUERY_TOKEN.findall(search):
+        if phrase:
+            (query.excluded_phrases if negated_phrase else query.phrases).append(phrase.lower())
+            # words of a phrase also take part in scoring, like in MongoDB
+            if not negated_phrase:
+                query.terms.update(tokenize(phrase))
+        elif word:
+            (query.excluded_terms if negated else query.terms).update(tokenize(word))
+    return query
+
+
+class InvertedIndex:
+    """
+    Postings of stemmed terms per field, kept in step with the documents by add and remove
+    """
+    
+    def __init__(self, weights: Mapping[str, float]) -> None:
+        self.weights = dict(weights)
+        # term -> document id -> field -> occurrences
+        self.postings: Dict[str, Dict[Hashable, Dict[str, int]]] = defaultdict(dict)
+        self.lengths: Dict[Hashable, Dict[str, int]] = {}
+        self.texts: Dict[Hashable, Dict[str, str]] = {}
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def add(self, id: Hashable, document: Mapping[str, Any]) -> None:
+        self.remove(id)
+        
+        texts, lengths = {}, {}
+        for name in self.weights:
+            value = document.get(name)
+            if not isinstance(value, str):
+                continue
+            
+            tokens = tokenize(value)
+            texts[name], lengths[name] = value.lower(), len(tokens)
+            for token in tokens:
+                fields = self.postings[token].setdefault(id, {})
+                fields[name] = fields.get(name, 0) + 1
+        
+        self.texts[id] = texts
+        self.lengths[id] = lengths
+    
+    def remove(self, id: Hashable) -> None:
+        texts = self.texts.pop(id, None)
+        self.lengths.pop(id, None)
+        if texts is None:
+            return
+        
+        for name, text in texts.items():
+            for token in set(tokenize(text)):
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(id, None)
+                    if not postings:
+                        del self.postings[token]
+    
+    def contains_phrase(self, id: Hashable, phrase: str) -> bool:
+        return any(phrase in text for text in self.texts[id].values())
+    
+    def search(self, search: str) -> Dict[Hashable, float]:
+        """
+        Score of every matching document by id
+        """
+        query = parse_query(search)
+        
+        scores: Dict[Hashable, float] = defaultdict(float)
+        for term in query.terms:
+            for id, fields in self.postings.get(term, {}).items():
+                for name, count in fields.items():
+                    # diminishing returns for repeated terms, normalized by field length
+                    scores[id] += self.weights[name] * (0.5 + 0.5 * count / self.lengths[id][name])
+        
+        if query.phrases and not query.terms:
+            scores = {id: 0.0 for id in self.texts}
+        
+        excluded = set()
+        for term in query.excluded_terms:
+            excluded.update(self.postings.get(term, ()))
+        
+        return {
+            id: score
+            for id, score in scores.items()
+            if id not in excluded
+            and all(self.contains_phrase(id, phrase) for phrase in query.phrases)
+            and not any(self.contains_phrase(id, phrase) for phrase in query.excluded_phrases)
+        }
@@ -0,0 +1,63 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from app.core.config import TASK_READ_COALESCING
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    calls: int = 0
+    coalesced: int = 0
+
+
+class SingleFlight:
+    """
+    Runs one read at a time per key, callers arriving while it is in flight share its result or error.
+    
+    Reads run as tasks of their own, so a caller that goes away does not cancel the read for the others.
+    """
+    
+    def __init__(self) -> None:
+        self.flights: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        # by kind of read, e.g. "get" or "list"
+        self.stats: Dict[str, SingleFlightStats] = defaultdict(SingleFlightStats)
+    
+    async def do(self, kind: str, key: Hashable, read: Callable[[], Awaitable[T]]) -> T:
+        stats = self.stats[kind]
+        stats.calls += 1
+        if (flight := self.flights.get((kind, key))) is not None:
+            stats.coalesced += 1
+        else:
+            flight = asyncio.create_task(read())
+            self.flights[(kind, key)] = flight
+            flight.add_done_callback(lambda done: self.land(kind, key, done))
+        
+        return await asyncio.shield(flight)
+    
+    def forget(self, kind: str, key: Optional[Hashable] = None) -> None:
+        """
+        Let later callers start a new read of key, or of every key of kind, instead of joining one in flight.
+        
+        Called after writes, so a read started before a write never answers a caller that arrived after it.
+        """
+        if key is not None:
+            self.flights.pop((kind, key), None)
+            return
+        
+        for flight_key in [flight_key for flight_key in self.flights if flight_key[0] == kind]:
+            del self.flights[flight_key]
+    
+    def land(self, kind: str, key: Hashable, flight: asyncio.Task) -> None:
+        if self.flights.get((kind, key)) is flight:
+            del self.flights[(kind, key)]
+        if not flight.cancelled():
+            # retrieved here, so an error no caller waited for any more is not reported as unhandled
+            flight.exception()
+
+
+def create_task_reads() -> Optional[SingleFlight]:
+    return SingleFlight() if TASK_READ_COALESCING else None
@@ -0,0 +1,110 @@
+"""
+The part of the Motor API the repositories use.
+
+Repositories only talk to a Database and its Collections, so any backend implementing these protocols can stand
+in for MongoDB. Motor implements them, and so does the in-memory backend of app.db.memory.
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol, Sequence, Tuple, Union
+
+from pymongo import IndexModel
+
+Document = Dict[str, Any]
+Sort = Union[str, List[Tuple[str, int]]]
+
+
+class Cursor(Protocol):
+    def sort(self, key_or_list: Sort, direction: Optional[int] = None) -> "Cursor":
+        ...
+    
+    def skip(self, skip: int) -> "Cursor":
+        ...
+    
+    def limit(self, limit: int) -> "Cursor":
+        ...
+    
+    def batch_size(self, batch_size: int) -> "Cursor":
+        ...
+    
+    def __aiter__(self) -> AsyncIterator[Document]:
+        ...
+    
+    async def to_list(self, length: Optional[int]) -> List[Document]:
+        ...
+
+
+class Collection(Protocol):
+    name: str
+    
+    def find(self, filter: Optional[Document] = None, projection: Optional[Document] = None) -> Cursor:
+        ...
+    
+    async def find_one(self, filter: Optional[Document] = None, projection: Optional[Document] = None, **kwargs: Any):
+        ...
+    
+    async def count_documents(self, filter: Document) -> int:
+        ...
+    
+    async def insert_one(self, document: Document) -> Any:
+        ...
+    
+    async def insert_many(self, documents: List[Document], ordered: bool = True) -> Any:
+        ...
+    
+    async def update_one(self, filter: Document, update: Document, upsert: bool = False) -> Any:
+        ...
+    
+    async def update_many(self, filter: Document, update: Document, upsert: bool = False) -> Any:
+        ...
+    
+    async def replace_one(self, filter: Document, replacement: Document, upsert: bool = False) -> Any:
+        ...
+    
+    async def delete_one(self, filter: Document) -> Any:
+        ...
+    
+    async def delete_many(self, filter: Document) -> Any:
+        ...
+    
+    async def find_one_and_update(
+            self,
+            filter: Document,
+            update: Document,
+            projection: Optional[Document] = None,
+            sort: Optional[Sort] = None,
+            upsert: bool = False,
+            return_document: bool = False,
+    ) -> Optional[Document]:
+        ...
+    
+    async def find_one_and_delete(
+            self, filter: Document, projection: Optional[Document] = None, sort: Optional[Sort] = None
+    ) -> Optional[Document]:
+        ...
+    
+    def aggregate(self, pipeline: List[Document]) -> Cursor:
+        ...
+    
+    async def bulk_write(self, requests: Sequence[Any], ordered: bool = True) -> Any:
+        ...
+    
+    async def create_indexes(self, indexes: List[IndexModel]) -> List[str]:
+        ...
+    
+    async def create_index(self, keys: Sort, **kwargs: Any) -> str:
+        ...
+    
+    async def drop_index(self, index_or_name: Any) -> None:
+        ...
+    
+    async def drop(self) -> None:
+        ...
+
+
+class Database(Protocol):
+    name: str
+    
+    def get_collection(self, name: str) -> Collection:
+        ...
+    
+    async def command(self, command: Any, **kwargs: Any) -> Document:
+        ...
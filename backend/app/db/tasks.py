@@ -1,27 +1,116 @@
 import os
+from typing import Dict, List
 
 from fastapi import FastAPI
 from motor.motor_asyncio import AsyncIOMotorClient
 
-from app.core.config import DATABASE_URL, DATABASE_NAME
+from app.core.config import (
+    DATABASE_BACKEND,
+    DATABASE_URL,
+    DATABASE_NAME,
+    DEFAULT_TENANT,
+    MONGO_COMPRESSORS,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    TASK_SHARDING,
+)
+from app.core.metrics import MetricsRegistry
+from app.core.profiling import startup_profile
+from app.db.monitoring import CommandMetrics, PoolMetrics
+from app.db.repositories.stats import TaskStatsRepository
+from app.db.repositories.tasks import TASK_SHARD_KEY, TaskRepository
 
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def create_client(pool_metrics: PoolMetrics, command_metrics: CommandMetrics) -> AsyncIOMotorClient:
+    if DATABASE_BACKEND == "memory":
+        # imported only here, a MongoDB deployment never loads the in-memory backend
+        from app.db.memory import InMemoryMotorClient
+        # databases are shared by every connection to DATABASE_URL in this process, nothing is sent anywhere
+        return InMemoryMotorClient(DATABASE_URL)
+    if DATABASE_BACKEND != "mongo":
+        raise ValueError(f"Unknown DATABASE_BACKEND: {DATABASE_BACKEND}")
+    
+    compression = {"compressors": list(MONGO_COMPRESSORS)} if MONGO_COMPRESSORS else {}
+    return AsyncIOMotorClient(
+        DATABASE_URL,
+        uuidRepresentation='standard',
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        event_listeners=[pool_metrics, command_metrics],
+        **compression,
+    )
+
+
+async def shard_tasks(mongo_client: AsyncIOMotorClient, database_name: str) -> None:
+    """
+    Shard the live and the archived tasks by TASK_SHARD_KEY, which does nothing once they are
+    """
+    for collection_name in ("tasks", "tasks_archive"):
+        await mongo_client.admin.command("shardCollection", f"{database_name}.{collection_name}", key=TASK_SHARD_KEY)
+
+
+def get_database_name() -> str:
+    return f"{DATABASE_NAME}_test" if os.environ.get("TESTING") else DATABASE_NAME
+
+
 async def connect_to_db(app: FastAPI) -> None:
-    database_name = f"{DATABASE_NAME}_test" if os.environ.get("TESTING") else DATABASE_NAME
+    database_name = get_database_name()
+    pool_metrics = PoolMetrics()
+    mongo_client = create_client(pool_metrics, CommandMetrics(app.metrics))
     
     try:
-        mongo_client = AsyncIOMotorClient(DATABASE_URL, uuidRepresentation='standard')
-        app.mongo_client = mongo_client
-        app.database = mongo_client[database_name]
-        logger.info("--- DB CONNECTED SUCCESSFULLY ---")
+        # open the first connection now so misconfiguration fails startup instead of the first requests
+        with startup_profile.phase("mongodb: first ping"):
+            await mongo_client.admin.command("ping")
+        database = mongo_client[database_name]
+        task_repo = TaskRepository(database)
+        with startup_profile.phase("mongodb: indexes"):
+            await task_repo.create_indexes()
+        if DEFAULT_TENANT:
+            with startup_profile.phase("mongodb: tasks without tenant"):
+                await task_repo.adopt_tasks_without_tenant()
+        if TASK_SHARDING:
+            await shard_tasks(mongo_client, database_name)
     except Exception as e:
-        logger.warning("--- DB CONNECTION ERROR ---")
-        logger.warning(e)
-        logger.warning("--- DB CONNECTION ERROR ---")
+        mongo_client.close()
+        logger.error("--- DB CONNECTION ERROR ---")
+        logger.error(e)
+        logger.error("--- DB CONNECTION ERROR ---")
+        raise
+    
+    app.mongo_client = mongo_client
+    app.database = database
+    app.pool_metrics = pool_metrics
+    logger.info("--- DB CONNECTED SUCCESSFULLY ---")
+
+
+async def rebuild_task_stats(tenants: List[str]) -> Dict[str, int]:
+    """
+    Recount the task stats of tenants for python -m app --rebuild-stats, returns the number of tasks of each.
+    
+    Writes to a tenant's tasks while they are counted can be missed, so pause them meanwhile.
+    """
+    mongo_client = create_client(PoolMetrics(), CommandMetrics(MetricsRegistry()))
+    try:
+        database = mongo_client[get_database_name()]
+        totals = {}
+        for tenant in tenants:
+            stats_repo = TaskStatsRepository(database, tenant=tenant)
+            await stats_repo.rebuild_stats()
+            totals[tenant] = (await stats_repo.get_stats(days=1)).total
+        return totals
+    finally:
+        mongo_client.close()
 
 
 async def close_db_connection(app: FastAPI) -> None:
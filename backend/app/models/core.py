@@ -1,8 +1,9 @@
-from typing import Optional
+from typing import Annotated, Optional
 from datetime import datetime
+from enum import Enum
 import uuid
 
-from pydantic import BaseModel, Field, field_serializer
+from pydantic import AfterValidator, BaseModel, Field, field_serializer
 
 
 class CoreModel(BaseModel):
@@ -13,12 +14,38 @@ class CoreModel(BaseModel):
     pass
 
 
+class SortOrder(str, Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    json = "json"
+
+
+def datetime_now() -> datetime:
+    """
+    Current time truncated to milliseconds, the precision MongoDB stores
+    """
+    now = datetime.now()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def to_local_datetime(value: datetime) -> datetime:
+    """
+    Naive local time truncated to milliseconds, like datetime_now, so times given with an offset compare to it
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+LocalDatetime = Annotated[datetime, AfterValidator(to_local_datetime)]
+
+
 class DateTimeModelMixin(BaseModel):
-    updated: Optional[datetime] = Field(default_factory=datetime.now)
-    
-    @field_serializer('updated')
-    def convert_datetime_to_string(self, v):
-        return str(v)
+    updated: Optional[datetime] = Field(default_factory=datetime_now)
 
 
 class UUIDModelMixin(BaseModel):
@@ -1,9 +1,15 @@
-from typing import Optional
+import uuid
+from datetime import date, datetime
+from typing import Dict, List, Optional
 from enum import Enum
 
-from pydantic import field_serializer, field_validator
+from pydantic import BaseModel, Field, field_serializer, field_validator
 
-from app.models.core import CoreModel, DateTimeModelMixin, UUIDModelMixin
+from app.models.core import CoreModel, DateTimeModelMixin, LocalDatetime, UUIDModelMixin
+
+# layout of stored task documents, those of older versions are upgraded when read and rewritten by the migrator.
+# Version 1 documents carry no schema_version, some were written by jsonable_encoder with string ids and timestamps.
+TASK_SCHEMA_VERSION = 2
 
 
 class TaskStatus(str, Enum):
@@ -12,15 +18,31 @@ class TaskStatus(str, Enum):
     cancelled = "cancelled"
 
 
-class TaskBase(CoreModel):
+class TaskRelationsMixin(BaseModel):
+    # the task this one is a subtask of, null makes it a top-level task again
+    parent_id: Optional[uuid.UUID] = None
+    # tasks this one is blocked by
+    depends_on: List[uuid.UUID] = Field(default_factory=list)
+    
+    @field_validator('depends_on')
+    def drop_repeated_dependencies(cls, value: List[uuid.UUID]) -> List[uuid.UUID]:
+        return list(dict.fromkeys(value))
+
+
+class TaskBase(CoreModel, TaskRelationsMixin):
     name: Optional[str]
     description: Optional[str]
     status: Optional[TaskStatus] = "pending"
+    # a reminder event fires at remind_at and a due event at due_at, while the task is pending
+    due_at: Optional[LocalDatetime] = None
+    remind_at: Optional[LocalDatetime] = None
 
 
-class TaskCreate(CoreModel):
+class TaskCreate(CoreModel, TaskRelationsMixin):
     name: str
     description: str
+    due_at: Optional[LocalDatetime] = None
+    remind_at: Optional[LocalDatetime] = None
     
     model_config = {
         'json_schema_extra': {
@@ -62,9 +84,125 @@ class TaskUpdate(TaskBase):
             return value
 
 
+class TaskBatchUpdate(TaskUpdate):
+    id: str
+    
+    model_config = {
+        'json_schema_extra': {
+            "examples": [
+                {
+                    "id": "3fa85f64-5717-4562-b3fc-2c963f66afa6",
+                    "status": "completed"
+                }
+            ]}
+    }
+
+
 class TaskInDB(UUIDModelMixin, DateTimeModelMixin, TaskCreate, TaskBase):
     status: TaskStatus = "pending"
+    # who the task belongs to, every read and write of a task is scoped by it
+    tenant: Optional[str] = None
+    # stored with every task, but of no interest to clients
+    schema_version: int = Field(TASK_SCHEMA_VERSION, exclude=True)
 
 
 class TaskPublic(TaskInDB):
-    pass
+    # when the task moved to the archive, only set on tasks read with include_archived
+    archived: Optional[datetime] = None
+
+
+class TaskPage(CoreModel):
+    tasks: List[TaskPublic]
+    next_cursor: Optional[str] = None
+
+
+class PartialTask(CoreModel):
+    """
+    Task read with a projection of its fields, the others are None
+    """
+    id: Optional[uuid.UUID] = Field(None, alias="_id")
+    name: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[TaskStatus] = None
+    due_at: Optional[datetime] = None
+    remind_at: Optional[datetime] = None
+    parent_id: Optional[uuid.UUID] = None
+    depends_on: Optional[List[uuid.UUID]] = None
+    updated: Optional[datetime] = None
+    archived: Optional[datetime] = None
+
+
+class PartialTaskPage(CoreModel):
+    tasks: List[PartialTask]
+    next_cursor: Optional[str] = None
+
+
+class TaskRelation(str, Enum):
+    # tasks with the task as parent_id, their subtasks and so on
+    subtasks = "subtasks"
+    # tasks the task depends_on, their dependencies and so on
+    dependencies = "dependencies"
+
+
+class TaskGraphNode(TaskPublic):
+    # 1 for a direct subtask or dependency of the root task, 2 for one of theirs, and so on
+    depth: int
+
+
+class TaskGraph(CoreModel):
+    task: TaskPublic
+    relation: TaskRelation
+    # in order of depth
+    tasks: List[TaskGraphNode]
+    # tasks deeper than max_depth were left out
+    truncated: bool
+
+
+class TaskBatchItemResult(CoreModel):
+    index: int
+    id: Optional[str] = None
+    status_code: int
+    detail: Optional[str] = None
+    task: Optional[TaskPublic] = None
+
+
+class TaskBatchResult(CoreModel):
+    results: List[TaskBatchItemResult]
+
+
+class TaskEventType(str, Enum):
+    created = "created"
+    updated = "updated"
+    deleted = "deleted"
+    # a pending task reached its remind_at or due_at
+    reminder = "reminder"
+    due = "due"
+    # events were lost, e.g. the resume token is too old, clients should list tasks again
+    reset = "reset"
+
+
+class TaskJobKind(str, Enum):
+    reminder = "reminder"
+    due = "due"
+
+
+class TaskEvent(CoreModel):
+    id: Optional[str] = None
+    type: TaskEventType
+    task_id: Optional[str] = None
+    task: Optional[TaskPublic] = None
+    # only subscribers of this tenant get the event, every subscriber if it is None, e.g. for resets
+    tenant: Optional[str] = Field(None, exclude=True)
+
+
+class TaskStatsDay(CoreModel):
+    day: date
+    total: int
+    by_status: Dict[str, int]
+
+
+class TaskStats(CoreModel):
+    total: int
+    by_status: Dict[str, int]
+    # tasks by the day of their last update, most recent day first
+    by_day: List[TaskStatsDay]
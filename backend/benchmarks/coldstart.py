@@ -0,0 +1,106 @@
+"""
+Measure the cold start of the server: seconds from starting python -m app to its first served request.
+
+Starts a single worker --runs times and keeps the whole startup in the number, interpreter, imports, building
+the app and connecting to the database. Needs the same .env as the app unless --backend memory:
+    
+    python -m benchmarks.coldstart --backend memory --runs 10 [--output coldstart.json]
+    python -m benchmarks.coldstart --backend memory --baseline coldstart.json [--max-regression 0.2]
+
+--docs-disabled starts the server with DOCS_ENABLED=false, STARTUP_PROFILE=true in the environment makes each
+worker log where its startup went.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+from benchmarks.load import percentile, use_memory_backend
+from benchmarks.workers import SERVER_COMMAND, free_port, wait_until_serving
+
+
+def measure(args: argparse.Namespace, env: Dict[str, str]) -> float:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [*SERVER_COMMAND, "--workers", "1", "--port", str(port), "--log-level", args.log_level], env=env,
+    )
+    try:
+        asyncio.run(wait_until_serving(f"http://127.0.0.1:{port}", args.startup_timeout, interval=args.interval))
+        return time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(seconds: List[float]) -> Dict[str, Any]:
+    ordered = sorted(seconds)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 1),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    The median is compared, single runs vary with whatever else the host is doing
+    """
+    previous, current = baseline["total"]["p50_ms"], results["total"]["p50_ms"]
+    if previous and current > previous * (1 + max_regression):
+        return [f"cold start p50 {previous}ms -> {current}ms"]
+    return []
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="mongo")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--docs-disabled", action="store_true", help="start the server with DOCS_ENABLED=false")
+    parser.add_argument("--interval", type=float, default=0.01, help="seconds between readiness requests")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--log-level", default="warning", help="of the server, info shows STARTUP_PROFILE reports")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against, exits with 1 on regression")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="tolerated p50 change, 0.2 is 20%%")
+    args = parser.parse_args()
+    
+    if args.backend == "memory":
+        use_memory_backend()
+    env = dict(os.environ)
+    if args.docs_disabled:
+        env["DOCS_ENABLED"] = "false"
+    
+    seconds = []
+    print(f"{'run':>4} {'ms':>9}")
+    for run in range(args.runs):
+        seconds.append(measure(args, env))
+        print(f"{run + 1:>4} {seconds[-1] * 1000:>9.1f}")
+    
+    results = {
+        "config": {name: getattr(args, name) for name in ("backend", "runs", "docs_disabled")},
+        "total": summarize(seconds),
+    }
+    total = results["total"]
+    print(f"min {total['min_ms']}ms  p50 {total['p50_ms']}ms  max {total['max_ms']}ms")
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"regression  {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
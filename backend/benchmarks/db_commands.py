@@ -0,0 +1,116 @@
+"""
+Count the MongoDB commands each task endpoint sends, so extra round trips show up as regressions.
+
+Needs the same .env as the app with DATABASE_BACKEND=mongo, runs against the test database:
+    
+    python -m benchmarks.db_commands [--check]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from typing import Dict, List
+
+from pymongo import monitoring
+
+# commands the driver sends on its own, unrelated to the request being served
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "endSessions", "saslStart", "saslContinue"}
+
+# upper bound of commands per request, keep in sync with TaskRepository
+# writes that change a task also $inc the task_stats counters
+EXPECTED_COMMANDS = {
+    "task:create-task": 2,
+    "task:get-task-by-id": 1,
+    "task:get-all-tasks": 1,
+    "task:update-task-by-id": 2,
+    "task:update-task-by-id (no-op)": 1,
+    "task:update-task-by-id (missing)": 1,
+    "task:delete-task-by-id": 2,
+}
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self) -> None:
+        self.commands: List[str] = []
+    
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in IGNORED_COMMANDS:
+            self.commands.append(event.command_name)
+    
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        pass
+    
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+    
+    def reset(self) -> List[str]:
+        commands, self.commands = self.commands, []
+        return commands
+
+
+async def count_commands(counter: CommandCounter) -> Dict[str, List[str]]:
+    from async_asgi_testclient import TestClient
+    from app.api.server import get_application
+    
+    app = get_application()
+    commands = {}
+    
+    async with TestClient(app, headers={"Content-Type": "application/json"}) as client:
+        if app.task_migrator is not None:
+            # its batches start right after startup and would be counted with the first requests
+            await app.task_migrator.close()
+        counter.reset()  # drop startup commands such as createIndexes
+        
+        async def measure(name: str, method: str, path: str, **kwargs):
+            res = await getattr(client, method)(path, **kwargs)
+            commands[name] = counter.reset()
+            return res
+        
+        res = await measure(
+            "task:create-task", "post", app.url_path_for("task:create-task"),
+            json={"name": "Benchmark task", "description": "Counts database commands"},
+        )
+        task_id = res.json()["_id"]
+        task_path = app.url_path_for("task:get-task-by-id", task_id=task_id)
+        missing_task_path = app.url_path_for("task:get-task-by-id", task_id="missing task")
+        
+        await measure("task:get-task-by-id", "get", task_path)
+        await measure("task:get-all-tasks", "get", app.url_path_for("task:get-all-tasks"))
+        await measure("task:update-task-by-id", "put", task_path, json={"status": "completed"})
+        await measure("task:update-task-by-id (no-op)", "put", task_path, json={})
+        await measure("task:update-task-by-id (missing)", "put", missing_task_path, json={"status": "completed"})
+        await measure("task:delete-task-by-id", "delete", task_path)
+    
+    return commands
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="exit with 1 if an endpoint exceeds its budget")
+    args = parser.parse_args()
+    
+    from app.core.config import DATABASE_BACKEND
+    if DATABASE_BACKEND != "mongo":
+        # only the driver reports commands, in memory every endpoint would count 0 and pass the check
+        parser.error(f"DATABASE_BACKEND={DATABASE_BACKEND} sends no MongoDB commands, run against MongoDB")
+    
+    os.environ["TESTING"] = "1"
+    counter = CommandCounter()
+    monitoring.register(counter)  # applies to the client created at app startup
+    
+    commands = asyncio.run(count_commands(counter))
+    
+    regressions = 0
+    for name, sent in commands.items():
+        budget = EXPECTED_COMMANDS[name]
+        flag = "" if len(sent) <= budget else "  <-- over budget"
+        regressions += bool(flag)
+        summary = ", ".join(f"{command} x{n}" for command, n in Counter(sent).items())
+        print(f"{name:<36} {len(sent):>3} / {budget}  {summary}{flag}")
+    
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+"""
+Load test the task API with a mixed read/write workload and report latency percentiles per route.
+
+Drives the app from get_application in-process, or a running server over HTTP. The memory backend
+keeps the data in process with app.db.memory, so in-process runs need no MongoDB:
+    
+    python -m benchmarks.load --backend memory --requests 5000 --output results.json
+    python -m benchmarks.load --mode http --url http://localhost:8000 --duration 30
+    python -m benchmarks.load --backend memory --baseline baseline.json [--max-regression 0.2]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# share of each operation in the workload, deletes are balanced by creates to keep the data set stable
+WORKLOAD = {
+    "task:get-task-by-id": 45,
+    "task:get-all-tasks": 15,
+    "task:search-tasks": 10,
+    "task:create-task": 10,
+    "task:update-task-by-id": 15,
+    "task:delete-task-by-id": 5,
+}
+
+STATUSES = ["pending", "completed", "cancelled"]
+
+# task text is drawn from these words, so a search matches a few percent of the tasks
+VOCABULARY = (
+    "apple bake buy call clean cook draft email fix garden groceries invoice laundry meeting order paint pay "
+    "plan read report review schedule ship sort train update walk wash water write"
+).split()
+
+PERCENTILES = (50, 95, 99)
+
+
+class ASGIClient:
+    """
+    Calls the ASGI app directly, no sockets involved
+    """
+    
+    def __init__(self, app) -> None:
+        self.app = app
+    
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"benchmark"), (b"content-type", b"application/json")],
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+        messages = [{"type": "http.request", "body": body or b"", "more_body": False}]
+        response = {"status": 0, "body": []}
+        
+        async def receive():
+            return messages.pop() if messages else {"type": "http.disconnect"}
+        
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+        
+        await self.app(scope, receive, send)
+        return response["status"], b"".join(response["body"])
+    
+    async def close(self) -> None:
+        pass
+
+
+class HTTPClient:
+    """
+    Minimal keep-alive HTTP/1.1 client, one connection per worker
+    """
+    
+    def __init__(self, url: str) -> None:
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+    
+    async def request(self, method: str, path: str, body: Optional[bytes] = None) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        
+        body = body or b""
+        head = (
+            f"{method} {self.prefix}{path} HTTP/1.1\r\n"
+            f"Host: {self.host}:{self.port}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n"
+        )
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+        
+        status_line = await self.reader.readline()
+        if not status_line:
+            await self.close()
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        if headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while size := int((await self.reader.readline()).split(b";")[0], 16):
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            await self.reader.readline()
+            content = b"".join(chunks)
+        else:
+            content = await self.reader.readexactly(int(headers.get("content-length", 0)))
+        
+        if headers.get("connection") == "close":
+            await self.close()
+        return status, content
+    
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(1000 * sum(latencies) / len(latencies), 3) if latencies else 0.0,
+    }
+    for p in PERCENTILES:
+        summary[f"p{p}_ms"] = round(1000 * percentile(latencies, p), 3)
+    return summary
+
+
+class LoadTest:
+    def __init__(self, client_factory, paths, *, seed: int) -> None:
+        self.client_factory = client_factory
+        self.paths = paths
+        self.random = random.Random(seed)
+        self.task_ids: List[str] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.operations = list(WORKLOAD)
+        self.weights = list(WORKLOAD.values())
+    
+    def new_task(self) -> bytes:
+        name = " ".join(self.random.sample(VOCABULARY, 2))
+        description = " ".join(self.random.sample(VOCABULARY, 4))
+        return json.dumps({"name": name.capitalize(), "description": description}).encode()
+    
+    async def seed(self, client, count: int) -> None:
+        for _ in range(count):
+            status, content = await client.request("POST", self.paths["task:create-task"], self.new_task())
+            if status != 201:
+                raise RuntimeError(f"Seeding failed with {status}: {content[:200]!r}")
+            self.task_ids.append(json.loads(content)["_id"])
+    
+    def next_request(self) -> Tuple[str, str, str, Optional[bytes]]:
+        operation = self.random.choices(self.operations, self.weights)[0]
+        if operation in ("task:get-task-by-id", "task:update-task-by-id", "task:delete-task-by-id") and not self.task_ids:
+            operation = "task:create-task"
+        
+        if operation == "task:create-task":
+            return operation, "POST", self.paths[operation], self.new_task()
+        if operation == "task:get-all-tasks":
+            return operation, "GET", f"{self.paths[operation]}?limit=20", None
+        if operation == "task:search-tasks":
+            return operation, "GET", f"{self.paths[operation]}?limit=20&q={self.random.choice(VOCABULARY)}", None
+        
+        if operation == "task:delete-task-by-id":
+            task_id = self.task_ids.pop(self.random.randrange(len(self.task_ids)))
+        else:
+            task_id = self.random.choice(self.task_ids)
+        path = self.paths["task:get-task-by-id"].format(task_id=task_id)
+        
+        if operation == "task:update-task-by-id":
+            return operation, "PUT", path, json.dumps({"status": self.random.choice(STATUSES)}).encode()
+        if operation == "task:delete-task-by-id":
+            return operation, "DELETE", path, None
+        return operation, "GET", path, None
+    
+    async def worker(self, deadline: float, budget: List[int]) -> None:
+        client = self.client_factory()
+        try:
+            while time.perf_counter() < deadline and budget[0] > 0:
+                budget[0] -= 1
+                operation, method, path, body = self.next_request()
+                
+                start = time.perf_counter()
+                try:
+                    status, content = await client.request(method, path, body)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                    status, content = 0, b""
+                self.latencies[operation].append(time.perf_counter() - start)
+                
+                if not 200 <= status < 300:
+                    self.errors[operation] += 1
+                elif operation == "task:create-task":
+                    self.task_ids.append(json.loads(content)["_id"])
+        finally:
+            await client.close()
+    
+    async def run(self, *, requests: int, duration: float, concurrency: int, seed_tasks: int) -> Dict[str, Any]:
+        client = self.client_factory()
+        await self.seed(client, seed_tasks)
+        await client.close()
+        
+        budget = [requests or sys.maxsize]
+        start = time.perf_counter()
+        deadline = start + (duration or math.inf)
+        await asyncio.gather(*(self.worker(deadline, budget) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            "elapsed_seconds": round(elapsed, 3),
+            "total": summarize(all_latencies, sum(self.errors.values()), elapsed),
+            "routes": {
+                operation: summarize(self.latencies[operation], self.errors[operation], elapsed)
+                for operation in self.operations
+                if self.latencies[operation]
+            },
+        }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    Routes whose p95 or throughput got worse than the baseline by more than max_regression
+    """
+    regressions = []
+    for route, current in {"total": results["total"], **results["routes"]}.items():
+        previous = baseline["total"] if route == "total" else baseline["routes"].get(route)
+        if previous is None:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{route}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous["rps"] and current["rps"] < previous["rps"] * (1 - max_regression):
+            regressions.append(f"{route}: rps {previous['rps']} -> {current['rps']}")
+    return regressions
+
+
+def set_default_settings() -> None:
+    """
+    Settings the app refuses to import without, for runs that never connect to MongoDB
+    """
+    for name, value in (("SECRET_KEY", "benchmark"), ("DATABASE_URL", "memory://"), ("DATABASE_NAME", "benchmark")):
+        os.environ.setdefault(name, value)
+
+
+def use_memory_backend() -> None:
+    """
+    Make the app keep its data in process instead of connecting to MongoDB
+    """
+    os.environ["DATABASE_BACKEND"] = "memory"
+    set_default_settings()
+
+
+def route_paths(app) -> Dict[str, str]:
+    paths = {name: app.url_path_for(name) for name in ("task:create-task", "task:get-all-tasks", "task:search-tasks")}
+    paths["task:get-task-by-id"] = app.url_path_for("task:get-task-by-id", task_id="{task_id}")
+    return paths
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.api.server import get_application
+    
+    app = get_application()
+    options = dict(requests=args.requests, duration=args.duration, concurrency=args.concurrency, seed_tasks=args.seed_tasks)
+    
+    if args.mode == "http":
+        return await LoadTest(lambda: HTTPClient(args.url), route_paths(app), seed=args.seed).run(**options)
+    
+    await app.router.startup()
+    try:
+        return await LoadTest(lambda: ASGIClient(app), route_paths(app), seed=args.seed).run(**options)
+    finally:
+        await app.router.shutdown()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", default="http://localhost:8000", help="server to load in http mode")
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="mongo", help="database for inprocess mode")
+    parser.add_argument("--requests", type=int, default=2000, help="stop after this many requests, 0 for no limit")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds, 0 for no limit")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed-tasks", type=int, default=200, help="tasks created before measuring")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the workload")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON to compare against, exits with 1 on regression")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="tolerated p95 and rps change, 0.2 is 20%%")
+    args = parser.parse_args()
+    
+    if not args.requests and not args.duration:
+        parser.error("one of --requests or --duration must be set")
+    if args.mode == "http":
+        set_default_settings()  # the app is only built to resolve route paths
+    elif args.backend == "memory":
+        use_memory_backend()
+    
+    results = asyncio.run(run(args))
+    results["config"] = {
+        name: getattr(args, name) for name in ("mode", "backend", "requests", "duration", "concurrency", "seed_tasks")
+    }
+    
+    print(f"{'route':<26} {'requests':>8} {'errors':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, summary in {**results["routes"], "total": results["total"]}.items():
+        print(
+            f"{route:<26} {summary['requests']:>8} {summary['errors']:>6} {summary['rps']:>9.1f} "
+            f"{summary['p50_ms']:>8.2f} {summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f}"
+        )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for regression in regressions:
+            print(f"regression  {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Measure how fast the task scheduler fires a backlog of due jobs, and check that none fires twice.
+
+Inserts --tasks pending tasks that are all due, then runs --workers schedulers against them at once, as
+that many worker processes would. Claims go through the next_fire_at index on either backend:
+    
+    python -m benchmarks.scheduler --backend memory --tasks 10000 --workers 4
+    python -m benchmarks.scheduler --tasks 50000 --workers 8 --handler-ms 5 [--output scheduler.json]
+
+Seeded tasks are deleted again at the end.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from benchmarks.load import use_memory_backend
+
+SEED_BATCH_SIZE = 1000
+
+
+async def seed(app, count: int) -> List[Any]:
+    from app.db.repositories.tasks import TaskRepository
+    from app.models.core import datetime_now
+    from app.models.task import TaskCreate
+    
+    task_repo = TaskRepository(app.database)
+    now = datetime_now()
+    ids = []
+    for start in range(0, count, SEED_BATCH_SIZE):
+        tasks = [
+            # due over the last hour, so claims do not all go for the same index key
+            TaskCreate(name=f"Due task {i}", description="Benchmark", due_at=now - timedelta(seconds=i % 3600))
+            for i in range(start, min(start + SEED_BATCH_SIZE, count))
+        ]
+        ids += [result.id for result in await task_repo.bulk_create(tasks=tasks)]
+    return ids
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.api.server import get_application
+    from app.db.codec import parse_task_id
+    from app.db.scheduler import TaskJob, TaskScheduler
+    
+    app = get_application()
+    await app.router.startup()
+    try:
+        ids = await seed(app, args.tasks)
+        fired: Counter = Counter()
+        
+        async def handle(job: TaskJob) -> None:
+            if args.handler_ms:
+                await asyncio.sleep(args.handler_ms / 1000)
+            fired[(job.task.id, job.kind)] += 1
+        
+        async def drain(scheduler: TaskScheduler) -> None:
+            while await scheduler.run_once():
+                pass
+        
+        schedulers = []
+        for _ in range(args.workers):
+            scheduler = TaskScheduler(
+                app,
+                batch_size=args.batch_size,
+                poll_interval=1,
+                lease=timedelta(seconds=60),
+                max_concurrency=args.concurrency,
+            )
+            scheduler.add_handler(handle)
+            schedulers.append(scheduler)
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(drain(scheduler) for scheduler in schedulers))
+        elapsed = time.perf_counter() - start
+        
+        await app.database.get_collection("tasks").delete_many({"_id": {"$in": [parse_task_id(id) for id in ids]}})
+    finally:
+        await app.router.shutdown()
+    
+    jobs = sum(fired.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "jobs": jobs,
+        "jobs_per_second": round(jobs / elapsed, 1) if elapsed else 0.0,
+        "duplicates": jobs - len(fired),
+        "missed": args.tasks - len(fired),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["memory", "mongo"], default="mongo")
+    parser.add_argument("--tasks", type=int, default=10000, help="due tasks to fire")
+    parser.add_argument("--workers", type=int, default=4, help="schedulers claiming at once")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20, help="handlers running at once per scheduler")
+    parser.add_argument("--handler-ms", type=float, default=0, help="time each job's handler takes")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    
+    # only the schedulers under test may claim the seeded jobs
+    os.environ["SCHEDULER_ENABLED"] = "false"
+    if args.backend == "memory":
+        use_memory_backend()
+    
+    results = asyncio.run(run(args))
+    results["config"] = {
+        name: getattr(args, name) for name in ("backend", "tasks", "workers", "batch_size", "concurrency", "handler_ms")
+    }
+    
+    print(f"{'jobs':>8} {'seconds':>9} {'jobs/s':>9} {'duplicates':>10} {'missed':>7}")
+    print(
+        f"{results['jobs']:>8} {results['elapsed_seconds']:>9.3f} {results['jobs_per_second']:>9.1f} "
+        f"{results['duplicates']:>10} {results['missed']:>7}"
+    )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    
+    return 1 if results["duplicates"] or results["missed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
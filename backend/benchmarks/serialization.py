@@ -0,0 +1,107 @@
+"""
+Compare the CPU cost per request of the legacy and the lean task serialization paths.
+
+The legacy path is what task routes did before: jsonable_encoder documents, full validation of
+every document read back, then FastAPI validating and encoding the response_model again.
+The lean path stores native BSON types, validates each document once in pydantic-core
+and renders responses with pydantic-core, skipping the response_model validation.
+    
+    python -m benchmarks.serialization [--number 20000]
+"""
+import argparse
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.api.responses import ModelResponse
+from app.db.codec import decode_task, encode_task
+from app.models.task import TaskCreate, TaskInDB, TaskPage, TaskPublic
+
+PAGE_SIZE = 50
+
+TASK_FIELD = create_response_field(name="response", type_=TaskPublic)
+PAGE_FIELD = create_response_field(name="response", type_=TaskPage)
+
+
+def new_task_create() -> TaskCreate:
+    return TaskCreate(name="Cook a pie", description="Should be an apple pie")
+
+
+async def legacy_render(field, content) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def legacy_create() -> bytes:
+    created_task = TaskInDB.model_validate(new_task_create().model_dump())
+    document = jsonable_encoder(created_task)
+    # the document read back from Mongo after insert_one
+    return await legacy_render(TASK_FIELD, TaskPublic.model_validate(dict(document)))
+
+
+async def lean_create() -> bytes:
+    created_task = TaskInDB.model_validate(new_task_create().model_dump())
+    document = encode_task(created_task)
+    return ModelResponse(decode_task(document)).body
+
+
+def benchmarks() -> Dict[str, Callable[[], Awaitable[bytes]]]:
+    legacy_documents = [jsonable_encoder(TaskInDB.model_validate(new_task_create().model_dump())) for _ in range(PAGE_SIZE)]
+    lean_documents = [encode_task(TaskInDB.model_validate(new_task_create().model_dump())) for _ in range(PAGE_SIZE)]
+    
+    async def legacy_get() -> bytes:
+        return await legacy_render(TASK_FIELD, TaskPublic.model_validate(legacy_documents[0]))
+    
+    async def lean_get() -> bytes:
+        return ModelResponse(decode_task(lean_documents[0])).body
+    
+    async def legacy_list() -> bytes:
+        page = TaskPage(tasks=[TaskPublic.model_validate(d) for d in legacy_documents])
+        return await legacy_render(PAGE_FIELD, page)
+    
+    async def lean_list() -> bytes:
+        return ModelResponse(TaskPage(tasks=[decode_task(d) for d in lean_documents])).body
+    
+    return {
+        "create": (legacy_create, lean_create),
+        "get by id": (legacy_get, lean_get),
+        f"list {PAGE_SIZE}": (legacy_list, lean_list),
+    }
+
+
+async def time_per_call(fn: Callable[[], Awaitable[bytes]], number: int) -> float:
+    for _ in range(min(number, 100)):  # warm up
+        await fn()
+    
+    started = time.process_time()
+    for _ in range(number):
+        await fn()
+    
+    return (time.process_time() - started) / number
+
+
+async def run(number: int) -> List[str]:
+    lines = [f"{'request':<12} {'legacy us':>10} {'lean us':>10} {'speedup':>8}"]
+    for name, (legacy, lean) in benchmarks().items():
+        legacy_time = await time_per_call(legacy, number)
+        lean_time = await time_per_call(lean, number)
+        lines.append(f"{name:<12} {legacy_time * 1e6:>10.1f} {lean_time * 1e6:>10.1f} {legacy_time / lean_time:>7.1f}x")
+    
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="calls per path")
+    args = parser.parse_args()
+    
+    for line in asyncio.run(run(args.number)):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Measure how throughput scales with the number of server workers.
+
+Starts python -m app with 1, 2, 4 ... workers, loads each over HTTP with the benchmarks.load workload
+and reports requests per second against the single worker run. Needs the same .env as the app:
+    
+    python -m benchmarks.workers --max-workers 8 --duration 20 --clients 4 [--output scaling.json]
+
+The load comes from --clients processes on the same host, so leave cores free for them or the client
+becomes the bottleneck. Workers share MongoDB, a saturated database flattens the curve as well.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.load import HTTPClient, LoadTest, route_paths, set_default_settings, summarize
+
+SERVER_COMMAND = [sys.executable, "-m", "app"]
+# served by every configuration, /openapi.json is not with DOCS_ENABLED=false
+READY_PATH = "/api/tasks/?limit=1"
+
+spawn = multiprocessing.get_context("spawn")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_counts(max_workers: int) -> List[int]:
+    counts = []
+    count = 1
+    while count < max_workers:
+        counts.append(count)
+        count *= 2
+    return counts + [max_workers]
+
+
+async def wait_until_serving(url: str, timeout: float, interval: float = 0.2) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        client = HTTPClient(url)
+        try:
+            # a 401 without a tenant token is served as well
+            status, _ = await client.request("GET", READY_PATH)
+            if status < 500:
+                return
+        except OSError:
+            pass
+        finally:
+            await client.close()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Server at {url} did not start in {timeout}s")
+        await asyncio.sleep(interval)
+
+
+def run_client(url: str, paths: Dict[str, str], options: Dict[str, Any], seed: int) -> Dict[str, Any]:
+    """
+    One load generating process, returns raw latencies so percentiles can be taken over all clients
+    """
+    test = LoadTest(lambda: HTTPClient(url), paths, seed=seed)
+    results = asyncio.run(test.run(**options))
+    return {
+        "elapsed_seconds": results["elapsed_seconds"],
+        "latencies": [latency for latencies in test.latencies.values() for latency in latencies],
+        "errors": sum(test.errors.values()),
+    }
+
+
+def measure(workers: int, args: argparse.Namespace, paths: Dict[str, str], env: Dict[str, str]) -> Dict[str, Any]:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [*SERVER_COMMAND, "--workers", str(workers), "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        asyncio.run(wait_until_serving(url, args.startup_timeout))
+        # the first worker answers before the others finished startup
+        time.sleep(args.settle)
+        
+        options = dict(
+            requests=0,
+            duration=args.duration,
+            concurrency=max(1, args.concurrency // args.clients),
+            seed_tasks=args.seed_tasks // args.clients,
+        )
+        with spawn.Pool(args.clients) as pool:
+            client_results = pool.starmap(
+                run_client, [(url, paths, options, args.seed + client) for client in range(args.clients)],
+            )
+    finally:
+        server.terminate()
+        server.wait()
+    
+    latencies = [latency for result in client_results for latency in result["latencies"]]
+    errors = sum(result["errors"] for result in client_results)
+    elapsed = max(result["elapsed_seconds"] for result in client_results)
+    return {"workers": workers, **summarize(latencies, errors, elapsed)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per worker count")
+    parser.add_argument("--concurrency", type=int, default=64, help="connections, split over the clients")
+    parser.add_argument("--clients", type=int, default=1, help="load generating processes")
+    parser.add_argument("--seed-tasks", type=int, default=200, help="tasks created before measuring")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the workload")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait for every worker to start")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    
+    # the server reads its settings from .env, not from the placeholders needed to build the app here
+    server_env = dict(os.environ)
+    set_default_settings()
+    from app.api.server import get_application
+    paths = route_paths(get_application())
+    
+    results: List[Dict[str, Any]] = []
+    baseline: Optional[float] = None
+    print(f"{'workers':>7} {'rps':>9} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for workers in worker_counts(args.max_workers):
+        result = measure(workers, args, paths, server_env)
+        baseline = baseline or result["rps"]
+        result["speedup"] = round(result["rps"] / baseline, 2) if baseline else 0.0
+        results.append(result)
+        print(
+            f"{workers:>7} {result['rps']:>9.1f} {result['speedup']:>7.2f}x {result['p50_ms']:>8.2f} "
+            f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['errors']:>6}"
+        )
+    
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
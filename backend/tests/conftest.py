@@ -11,7 +11,12 @@ from fastapi.encoders import jsonable_encoder
 from async_asgi_testclient import TestClient
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.core.config import DATABASE_URL, DATABASE_NAME
+# DATABASE_BACKEND=memory pytest runs the tests offline, without a .env
+if os.environ.get("DATABASE_BACKEND") == "memory":
+    for name, value in (("SECRET_KEY", "test"), ("DATABASE_URL", "memory://"), ("DATABASE_NAME", "backend")):
+        os.environ.setdefault(name, value)
+
+from app.core.config import DATABASE_BACKEND, DATABASE_URL, DATABASE_NAME
 from app.models.task import TaskCreate, TaskPublic, TaskUpdate
 from app.db.repositories.tasks import TaskRepository
 
@@ -21,6 +26,10 @@ def prepare_test_env() -> None:
     # Create synchronous Mongodb and set testing to True
     warnings.filterwarnings("ignore", category=DeprecationWarning)
     os.environ["TESTING"] = "1"
+    if DATABASE_BACKEND == "memory":
+        yield None
+        return
+    
     mongo_client = MongoClient(DATABASE_URL)
     
     yield None
@@ -83,7 +92,6 @@ def test_task_factory(db: AsyncIOMotorDatabase, new_task: dict) -> Callable:
         created_task = await task_repo.create_task(task=TaskCreate.model_validate(new_task))
         updated_task = await task_repo.update_task_by_id(
             task_id=str(created_task.id),
-            task=created_task,
             task_update=TaskUpdate.model_validate({"status": status})
         )
         return updated_task
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from async_asgi_testclient import TestClient
+from fastapi import FastAPI, status
+
+from app.api.middleware.admission import AdmissionMiddleware, client_key
+from app.core.metrics import MetricsRegistry, render
+from app.db.ratelimit import InMemoryRateLimitStore
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def admission_app(registry: MetricsRegistry, release: asyncio.Event, **options) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/slow")
+    async def slow() -> dict:
+        await release.wait()
+        return {}
+    
+    @app.get("/fast")
+    async def fast() -> dict:
+        return {}
+    
+    app.add_middleware(AdmissionMiddleware, registry=registry, **options)
+    return app
+
+
+class TestInMemoryRateLimitStore:
+    async def test_bucket_refills_at_rate(self) -> None:
+        clock = FakeClock()
+        store = InMemoryRateLimitStore(rate=2, burst=2, max_keys=10, clock=clock)
+        
+        assert [await store.take("client") for _ in range(2)] == [0.0, 0.0]
+        assert await store.take("client") == pytest.approx(0.5)
+        assert await store.take("other client") == 0.0
+        
+        clock.now = 0.5
+        assert await store.take("client") == 0.0
+    
+    async def test_least_recently_seen_clients_are_forgotten(self) -> None:
+        store = InMemoryRateLimitStore(rate=1, burst=1, max_keys=2, clock=FakeClock())
+        for key in ("a", "b", "c"):
+            await store.take(key)
+        
+        assert list(store.buckets) == ["b", "c"]
+
+
+class TestClientKey:
+    async def test_key_header_takes_precedence_over_peer_address(self) -> None:
+        scope = {"headers": [(b"x-forwarded-for", b"10.0.0.1, 10.0.0.2")], "client": ("127.0.0.1", 5000)}
+        
+        assert client_key(scope, "X-Forwarded-For") == "10.0.0.1"
+        assert client_key(scope) == "127.0.0.1"
+        assert client_key({"headers": [], "client": ("127.0.0.1", 5000)}, "X-Forwarded-For") == "127.0.0.1"
+
+
+class TestAdmissionMiddleware:
+    async def test_clients_over_their_rate_get_429(self) -> None:
+        registry = MetricsRegistry()
+        store = InMemoryRateLimitStore(rate=1, burst=2, max_keys=10, clock=FakeClock())
+        app = admission_app(registry, asyncio.Event(), rate_limits=store, key_header="X-Client")
+        
+        async with TestClient(app) as client:
+            codes = [(await client.get("/fast", headers={"X-Client": "greedy"})).status_code for _ in range(3)]
+            res = await client.get("/fast", headers={"X-Client": "polite"})
+            assert res.status_code == status.HTTP_200_OK
+            
+            res = await client.get("/fast", headers={"X-Client": "greedy"})
+        
+        assert codes == [200, 200, 429]
+        assert res.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert res.headers["Retry-After"] == "1"
+        
+        output = render(registry.metrics.values())
+        assert 'http_requests_rejected_total{reason="rate_limited"} 2' in output
+        assert "http_requests_admitted_total 3" in output
+    
+    async def test_requests_over_in_flight_cap_get_503(self) -> None:
+        registry = MetricsRegistry()
+        release = asyncio.Event()
+        app = admission_app(registry, release, max_in_flight=1)
+        
+        async with TestClient(app) as client:
+            slow = asyncio.create_task(client.get("/slow"))
+            while not registry.get("http_requests_capped_in_flight").labels().value:
+                await asyncio.sleep(0.01)
+            
+            res = await client.get("/fast")
+            assert res.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            assert res.headers["Retry-After"] == "1"
+            
+            release.set()
+            assert (await slow).status_code == status.HTTP_200_OK
+            assert (await client.get("/fast")).status_code == status.HTTP_200_OK
+        
+        assert 'http_requests_rejected_total{reason="overloaded"} 1' in render(registry.metrics.values())
+    
+    async def test_unbounded_paths_are_not_capped(self) -> None:
+        release = asyncio.Event()
+        app = admission_app(MetricsRegistry(), release, max_in_flight=1, unbounded_paths={"/slow"})
+        
+        async with TestClient(app) as client:
+            slow = asyncio.create_task(client.get("/slow"))
+            await asyncio.sleep(0.05)
+            
+            assert (await client.get("/fast")).status_code == status.HTTP_200_OK
+            release.set()
+            await slow
@@ -0,0 +1,168 @@
+from typing import List
+
+import pytest
+
+from fastapi import FastAPI, status
+from async_asgi_testclient import TestClient
+
+from app.db.cache import InMemoryCacheBackend, LRUTaskCache, SharedTaskCache
+from app.db.repositories.tasks import TaskRepository
+from app.models.task import TaskCreate, TaskInDB, TaskPublic
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_task(i: int = 0) -> TaskPublic:
+    created_task = TaskInDB.model_validate(TaskCreate(name=f"Cached task {i}", description="Cached").model_dump())
+    return TaskPublic.model_validate(created_task.model_dump())
+
+
+class TestLRUTaskCache:
+    async def test_get_returns_cached_task(self) -> None:
+        cache = LRUTaskCache(max_size=10, ttl=60)
+        task = make_task()
+        
+        assert await cache.get(str(task.id)) is None
+        await cache.set(task)
+        assert await cache.get(str(task.id)) == task
+        
+        assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    
+    async def test_least_recently_used_task_is_evicted(self) -> None:
+        cache = LRUTaskCache(max_size=2, ttl=60)
+        tasks = [make_task(i) for i in range(3)]
+        
+        await cache.set(tasks[0])
+        await cache.set(tasks[1])
+        await cache.get(str(tasks[0].id))
+        await cache.set(tasks[2])
+        
+        assert await cache.get(str(tasks[1].id)) is None
+        assert await cache.get(str(tasks[0].id)) == tasks[0]
+        assert cache.stats.evictions == 1
+    
+    async def test_task_expires_after_ttl(self) -> None:
+        clock = FakeClock()
+        cache = LRUTaskCache(max_size=10, ttl=5, clock=clock)
+        task = make_task()
+        
+        await cache.set(task)
+        clock.now = 4.9
+        assert await cache.get(str(task.id)) == task
+        clock.now = 5
+        assert await cache.get(str(task.id)) is None
+        assert cache.stats.expirations == 1
+    
+    async def test_delete_drops_task(self) -> None:
+        cache = LRUTaskCache(max_size=10, ttl=60)
+        task = make_task()
+        
+        await cache.set(task)
+        await cache.delete(str(task.id))
+        assert await cache.get(str(task.id)) is None
+
+
+    async def test_reads_overtaken_by_a_write_do_not_fill(self) -> None:
+        cache = LRUTaskCache(max_size=10, ttl=60)
+        task, other = make_task(0), make_task(1)
+        
+        read_started = cache.start_read()
+        await cache.delete(str(task.id))
+        
+        assert not await cache.fill(task, read_started)
+        assert await cache.get(str(task.id)) is None
+        assert await cache.fill(other, read_started)
+        assert await cache.fill(task, cache.start_read())
+
+
+class TestSharedTaskCache:
+    async def test_tasks_are_shared_between_processes(self) -> None:
+        backend = InMemoryCacheBackend()
+        first = SharedTaskCache(backend, local=LRUTaskCache(max_size=10, ttl=1), ttl=60)
+        second = SharedTaskCache(backend, local=LRUTaskCache(max_size=10, ttl=1), ttl=60)
+        task = make_task()
+        
+        await first.set(task)
+        assert await second.get(str(task.id)) == task
+        assert (second.stats.hits, second.stats.misses) == (1, 0)
+        
+        await first.delete(str(task.id))
+        await second.local.delete(str(task.id))
+        assert await second.get(str(task.id)) is None
+        assert second.stats.misses == 1
+
+
+class TestTaskRoutesUseCache:
+    async def test_repeated_reads_hit_cache(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        hits = app.task_cache.stats.hits
+        for _ in range(3):
+            res = await client.get(app.url_path_for("task:get-task-by-id", task_id=test_task.id))
+            assert res.status_code == status.HTTP_200_OK
+        
+        assert app.task_cache.stats.hits == hits + 2
+    
+    async def test_writes_keep_cache_fresh(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        task_path = app.url_path_for("task:get-task-by-id", task_id=test_task.id)
+        await client.get(task_path)
+        
+        res = await client.put(task_path, json={"status": "completed"})
+        assert res.status_code == status.HTTP_200_OK
+        res = await client.get(task_path)
+        assert res.json()["status"] == "completed"
+        
+        res = await client.delete(task_path)
+        assert res.status_code == status.HTTP_204_NO_CONTENT
+        res = await client.get(task_path)
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+    
+    async def test_read_overtaken_by_a_delete_is_not_cached(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        task_id = str(test_task.id)
+        task_repo = TaskRepository(app.database, app=app, tenant=test_task.tenant)
+        await app.task_cache.delete(task_id)
+        find_one = task_repo.collection.find_one
+        
+        async def overtaken_find_one(*args, **kwargs):
+            task = await find_one(*args, **kwargs)
+            # deleted after the read got the task, before the read fills the cache
+            await task_repo.collection.delete_one({"_id": test_task.id})
+            await task_repo.invalidate(task_id)
+            return task
+        
+        monkeypatch.setattr(task_repo.collection, "find_one", overtaken_find_one)
+        assert await task_repo.get_task_by_id(id=task_id) is not None
+        monkeypatch.undo()
+        
+        assert await app.task_cache.get(task_id) is None
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=task_id))
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+    
+    async def test_batch_writes_keep_cache_fresh(
+            self, app: FastAPI, client: TestClient, test_list_of_tasks: List[TaskPublic]
+    ) -> None:
+        first_task, second_task = test_list_of_tasks[:2]
+        for task in (first_task, second_task):
+            await client.get(app.url_path_for("task:get-task-by-id", task_id=task.id))
+        
+        await client.patch(
+            app.url_path_for("task:update-tasks-batch"), json=[{"id": str(first_task.id), "name": "Renamed"}]
+        )
+        await client.delete(app.url_path_for("task:delete-tasks-batch"), json=[str(second_task.id)])
+        
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=first_task.id))
+        assert res.json()["name"] == "Renamed"
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=second_task.id))
+        assert res.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,135 @@
+import gzip
+import zlib
+from typing import AsyncIterator, Optional
+
+import pytest
+
+from async_asgi_testclient import TestClient
+from fastapi import FastAPI, Header, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.api.etag import etag_matches
+from app.api.middleware.compression import CompressionMiddleware, available_encodings, negotiate
+from app.core.metrics import MetricsRegistry, render
+
+pytestmark = pytest.mark.asyncio
+
+LARGE = {"tasks": [{"name": f"Task {i}", "description": "Repeats across tasks"} for i in range(100)]}
+ETAG = '"1234.20240101T000000000000"'
+
+
+def compression_app(registry: MetricsRegistry) -> FastAPI:
+    app = FastAPI()
+    
+    @app.get("/large")
+    async def large() -> JSONResponse:
+        return JSONResponse(LARGE)
+    
+    @app.get("/tagged")
+    async def tagged(if_none_match: Optional[str] = Header(None)) -> Response:
+        if etag_matches(if_none_match, ETAG):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": ETAG})
+        return JSONResponse(LARGE, headers={"ETag": ETAG})
+    
+    @app.put("/tagged")
+    async def update_tagged(if_match: str = Header()) -> JSONResponse:
+        return JSONResponse({"if_match": if_match})
+    
+    @app.get("/small")
+    async def small() -> JSONResponse:
+        return JSONResponse({"name": "Task"})
+    
+    @app.get("/stream")
+    async def stream() -> StreamingResponse:
+        async def lines() -> AsyncIterator[bytes]:
+            for i in range(3):
+                yield f'{{"line": {i}}}\n'.encode()
+        
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    
+    @app.get("/events")
+    async def events() -> StreamingResponse:
+        async def lines() -> AsyncIterator[bytes]:
+            yield b"retry: 1000\n\n" * 200
+        
+        return StreamingResponse(lines(), media_type="text/event-stream")
+    
+    app.add_middleware(CompressionMiddleware, registry=registry, encodings=["gzip"], minimum_size=500)
+    return app
+
+
+class TestNegotiate:
+    @pytest.mark.parametrize(
+        "accept_encoding, encoding",
+        (
+                ("gzip, deflate, br, zstd", "zstd"),
+                ("gzip;q=1.0, br;q=0.5", "gzip"),
+                ("br;q=0, gzip;q=0.1", "gzip"),
+                ("*", "zstd"),
+                ("*, zstd;q=0", "br"),
+                ("identity", None),
+                ("", None),
+        ),
+    )
+    async def test_client_preference_wins_ties_go_to_server_order(
+            self, accept_encoding: str, encoding: str
+    ) -> None:
+        assert negotiate(accept_encoding, ["zstd", "br", "gzip"]) == encoding
+    
+    async def test_gzip_is_always_available(self) -> None:
+        assert "gzip" in available_encodings(["zstd", "br", "gzip"])
+        with pytest.raises(ValueError):
+            available_encodings(["deflate"])
+
+
+class TestCompressionMiddleware:
+    async def test_large_responses_are_compressed(self) -> None:
+        registry = MetricsRegistry()
+        
+        async with TestClient(compression_app(registry)) as client:
+            res = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+        
+        assert res.headers["Content-Encoding"] == "gzip"
+        assert res.headers["Vary"] == "Accept-Encoding"
+        assert int(res.headers["Content-Length"]) == len(res.content)
+        assert gzip.decompress(res.content) == JSONResponse(LARGE).body
+        assert 'http_compression_output_bytes_total{encoding="gzip"}' in render(registry.metrics.values())
+    
+    async def test_small_or_unwanted_responses_are_left_alone(self) -> None:
+        async with TestClient(compression_app(MetricsRegistry())) as client:
+            small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+            unwanted = await client.get("/large", headers={"Accept-Encoding": "identity"})
+            events = await client.get("/events", headers={"Accept-Encoding": "gzip"})
+        
+        assert "Content-Encoding" not in small.headers
+        assert small.json() == {"name": "Task"}
+        assert "Content-Encoding" not in unwanted.headers
+        assert unwanted.headers["Vary"] == "Accept-Encoding"
+        assert "Content-Encoding" not in events.headers
+    
+    async def test_streamed_responses_are_compressed_chunk_by_chunk(self) -> None:
+        async with TestClient(compression_app(MetricsRegistry())) as client:
+            res = await client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        
+        assert res.headers["Content-Encoding"] == "gzip"
+        assert "Content-Length" not in res.headers
+        assert zlib.decompress(res.content, 16 + zlib.MAX_WBITS) == b'{"line": 0}\n{"line": 1}\n{"line": 2}\n'
+    
+    async def test_each_encoding_has_its_own_etag(self) -> None:
+        async with TestClient(compression_app(MetricsRegistry())) as client:
+            compressed = await client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+            plain = await client.get("/tagged", headers={"Accept-Encoding": "identity"})
+            cached = await client.get(
+                "/tagged", headers={"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]},
+            )
+            cached_plain = await client.get("/tagged", headers={"If-None-Match": plain.headers["ETag"]})
+            updated = await client.put("/tagged", headers={"If-Match": compressed.headers["ETag"]})
+        
+        assert compressed.headers["ETag"] == '"1234.20240101T000000000000-gzip"'
+        assert plain.headers["ETag"] == ETAG
+        assert cached.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached.headers["ETag"] == compressed.headers["ETag"]
+        assert cached_plain.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached_plain.headers["ETag"] == ETAG
+        # the routes compare the ETag they made, If-Match keeps accepting what a compressed GET returned
+        assert updated.json() == {"if_match": ETAG}
@@ -0,0 +1,160 @@
+import json
+import uuid
+
+import pytest
+
+from fastapi import FastAPI, status
+from async_asgi_testclient import TestClient
+
+from app.db.events import TaskEventBus, change_event
+from app.models.core import datetime_now
+from app.models.task import TaskEvent, TaskEventType, TaskPublic
+
+pytestmark = pytest.mark.asyncio
+
+
+def new_event(type: TaskEventType = TaskEventType.deleted) -> TaskEvent:
+    return TaskEvent(type=type, task_id=str(uuid.uuid4()))
+
+
+class TestTaskEventBus:
+    async def test_subscribers_get_published_events(self) -> None:
+        bus = TaskEventBus()
+        subscription = bus.subscribe()
+        
+        event = new_event()
+        bus.publish(event)
+        
+        assert await subscription.get() is event
+        assert event.id is not None
+    
+    async def test_resume_replays_missed_events(self) -> None:
+        bus = TaskEventBus()
+        events = [new_event() for _ in range(3)]
+        for event in events:
+            bus.publish(event)
+        
+        subscription = bus.subscribe(resume_after=events[0].id)
+        
+        assert [await subscription.get() for _ in range(2)] == events[1:]
+        assert subscription.queue.empty()
+    
+    async def test_unknown_resume_token_gets_reset(self) -> None:
+        bus = TaskEventBus(buffer_size=2)
+        events = [new_event() for _ in range(3)]
+        for event in events:
+            bus.publish(event)
+        
+        subscription = bus.subscribe(resume_after=events[0].id)
+        
+        reset = await subscription.get()
+        assert reset.type == TaskEventType.reset
+        assert reset.id == events[-1].id
+    
+    async def test_slow_subscriber_is_dropped_at_queue_size(self) -> None:
+        bus = TaskEventBus(queue_size=2)
+        subscription = bus.subscribe()
+        for _ in range(3):
+            bus.publish(new_event())
+        
+        assert [await subscription.get() is not None for _ in range(3)] == [True, True, False]
+        assert subscription not in bus.subscribers
+    
+    async def test_tenant_subscriptions_only_get_resets_without_a_tenant(self) -> None:
+        bus = TaskEventBus()
+        subscription = bus.subscribe(tenant="alice")
+        
+        # a delete seen on an unsharded collection without pre-images, which could be anybody's task
+        bus.publish(new_event())
+        bus.publish(TaskEvent(type=TaskEventType.deleted, task_id=str(uuid.uuid4()), tenant="bob"))
+        reset = TaskEvent(type=TaskEventType.reset)
+        bus.publish(reset)
+        
+        assert await subscription.get() is reset
+        assert subscription.queue.empty()
+    
+    async def test_writes_are_not_published_while_following_change_stream(self) -> None:
+        bus = TaskEventBus()
+        bus.publishes_writes = False
+        
+        bus.publish_write(TaskEventType.deleted, uuid.uuid4())
+        
+        assert len(bus.buffer) == 0
+    
+    async def test_change_stream_events_are_mapped(self) -> None:
+        document = {
+            "_id": uuid.uuid4(), "name": "Changed", "description": "Elsewhere", "status": "pending",
+            "updated": datetime_now(),
+        }
+        event = change_event({
+            "_id": {"_data": "8264"},
+            "operationType": "update",
+            "documentKey": {"_id": document["_id"]},
+            "fullDocument": document,
+        })
+        
+        assert event.id == "8264"
+        assert event.type == TaskEventType.updated
+        assert event.task_id == str(document["_id"])
+        assert event.task == TaskPublic.model_validate(document)
+        assert change_event({"_id": {"_data": "8265"}, "operationType": "drop"}).type == TaskEventType.reset
+        deleted = change_event({
+            "_id": {"_data": "8266"},
+            "operationType": "delete",
+            "documentKey": {"_id": document["_id"]},
+            "fullDocumentBeforeChange": {**document, "tenant": "alice"},
+        })
+        assert deleted.type == TaskEventType.deleted and deleted.tenant == "alice"
+    
+    async def test_scheduler_updates_only_publish_fired_jobs(self) -> None:
+        document = {
+            "_id": uuid.uuid4(), "name": "Due", "description": "Soon", "status": "pending",
+            "updated": datetime_now(), "due_at": datetime_now(),
+        }
+        
+        def scheduler_change(updated_fields: dict, removed_fields: list) -> dict:
+            return {
+                "_id": {"_data": "8266"},
+                "operationType": "update",
+                "documentKey": {"_id": document["_id"]},
+                "updateDescription": {"updatedFields": updated_fields, "removedFields": removed_fields},
+                "fullDocument": document,
+            }
+        
+        claim = scheduler_change({"next_fire_at": datetime_now(), "lease": "a"}, [])
+        release = scheduler_change({"fired.due_at": document["due_at"]}, ["lease", "next_fire_at"])
+        first_release = scheduler_change({"fired": {"due_at": document["due_at"]}}, ["lease", "next_fire_at"])
+        
+        assert change_event(claim) is None
+        assert change_event(release).type == TaskEventType.due
+        assert change_event(first_release).type == TaskEventType.due
+
+
+class TestStreamRoutes:
+    async def test_server_sent_events_follow_writes(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get(app.url_path_for("task:stream-task-events"), stream=True)
+        assert res.status_code == status.HTTP_200_OK
+        assert res.headers["content-type"].startswith("text/event-stream")
+        
+        res_created = await client.post(
+            app.url_path_for("task:create-task"), json={"name": "Streamed", "description": "Over SSE"}
+        )
+        
+        chunks = res.iter_content(1024)
+        assert (await chunks.__anext__()).startswith(b"retry: ")
+        chunk = (await chunks.__anext__()).decode()
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        assert fields["event"] == "created"
+        assert json.loads(fields["data"])["task"] == res_created.json()
+    
+    async def test_websocket_resumes_after_last_event(self, app: FastAPI, client: TestClient) -> None:
+        for name in ("First", "Second"):
+            await client.post(app.url_path_for("task:create-task"), json={"name": name, "description": "Over WS"})
+        first_id = app.task_events.buffer[-2].id
+        
+        path = app.url_path_for("task:stream-task-events-ws")
+        async with client.websocket_connect(f"{path}?resume_after={first_id}") as websocket:
+            event = await websocket.receive_json()
+        
+        assert event["type"] == "created"
+        assert event["task"]["name"] == "Second"
@@ -0,0 +1,186 @@
+import uuid
+from typing import List, Optional
+
+import pytest
+
+from fastapi import FastAPI, status
+from async_asgi_testclient import TestClient
+
+from app.core.config import MAX_TASK_GRAPH_DEPTH
+from app.core.security import create_tenant_token
+
+pytestmark = pytest.mark.asyncio
+
+
+def auth(tenant: str) -> dict:
+    return {"Authorization": f"Bearer {create_tenant_token(tenant)}"}
+
+
+@pytest.fixture
+def headers() -> dict:
+    # the test database outlives a test, a fresh tenant starts without tasks
+    return auth(f"tenant-{uuid.uuid4()}")
+
+
+async def create(
+        app: FastAPI, client: TestClient, headers: dict, name: str,
+        parent_id: Optional[str] = None, depends_on: List[str] = (),
+) -> str:
+    res = await client.post(
+        app.url_path_for("task:create-task"),
+        json={"name": name, "description": name, "parent_id": parent_id, "depends_on": list(depends_on)},
+        headers=headers,
+    )
+    assert res.status_code == status.HTTP_201_CREATED, res.json()
+    return res.json()["_id"]
+
+
+async def update(app: FastAPI, client: TestClient, headers: dict, task_id: str, json: dict):
+    return await client.put(app.url_path_for("task:update-task-by-id", task_id=task_id), json=json, headers=headers)
+
+
+async def graph(app: FastAPI, client: TestClient, headers: dict, task_id: str, **params) -> dict:
+    res = await client.get(
+        app.url_path_for("task:get-task-graph", task_id=task_id), query_string=params, headers=headers,
+    )
+    assert res.status_code == status.HTTP_200_OK, res.json()
+    return res.json()
+
+
+class TestTaskGraph:
+    async def test_subtree_is_listed_by_depth(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        root = await create(app, client, headers, "Move house")
+        packing = await create(app, client, headers, "Pack", parent_id=root)
+        boxes = await create(app, client, headers, "Buy boxes", parent_id=packing)
+        tape = await create(app, client, headers, "Buy tape", parent_id=boxes)
+        
+        subtree = await graph(app, client, headers, root)
+        
+        assert subtree["task"]["_id"] == root
+        assert [(task["_id"], task["depth"]) for task in subtree["tasks"]] == [(packing, 1), (boxes, 2), (tape, 3)]
+        assert subtree["tasks"][0]["parent_id"] == root
+        assert not subtree["truncated"]
+        
+        shallow = await graph(app, client, headers, root, max_depth=2)
+        assert [task["_id"] for task in shallow["tasks"]] == [packing, boxes]
+        assert shallow["truncated"]
+    
+    async def test_dependency_closure(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        survey = await create(app, client, headers, "Survey")
+        permit = await create(app, client, headers, "Permit", depends_on=[survey])
+        budget = await create(app, client, headers, "Budget", depends_on=[survey])
+        build = await create(app, client, headers, "Build", depends_on=[permit, budget, permit])
+        
+        closure = await graph(app, client, headers, build, relation="dependencies")
+        
+        assert closure["relation"] == "dependencies"
+        assert closure["task"]["depends_on"] == [permit, budget]
+        assert sorted((task["depth"], task["_id"]) for task in closure["tasks"]) == sorted(
+            [(1, permit), (1, budget), (2, survey)]
+        )
+        assert (await graph(app, client, headers, survey, relation="dependencies"))["tasks"] == []
+    
+    async def test_unknown_task_and_depth(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        task_id = await create(app, client, headers, "Alone")
+        
+        res = await client.get(app.url_path_for("task:get-task-graph", task_id=str(uuid.uuid4())), headers=headers)
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+        res = await client.get(
+            app.url_path_for("task:get-task-graph", task_id=task_id),
+            query_string={"max_depth": MAX_TASK_GRAPH_DEPTH + 1},
+            headers=headers,
+        )
+        assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestRelations:
+    async def test_cycles_are_rejected(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        root = await create(app, client, headers, "Root")
+        child = await create(app, client, headers, "Child", parent_id=root)
+        grandchild = await create(app, client, headers, "Grandchild", parent_id=child)
+        first = await create(app, client, headers, "First")
+        second = await create(app, client, headers, "Second", depends_on=[first])
+        
+        for task_id, json in [
+            (root, {"parent_id": grandchild}),
+            (root, {"parent_id": root}),
+            (first, {"depends_on": [second]}),
+            (first, {"depends_on": [first]}),
+        ]:
+            res = await update(app, client, headers, task_id, json)
+            assert res.status_code == status.HTTP_409_CONFLICT, json
+        
+        # moving a subtree elsewhere, or back to the top level, is fine
+        assert (await update(app, client, headers, grandchild, {"parent_id": root})).json()["parent_id"] == root
+        assert (await update(app, client, headers, child, {"parent_id": None})).json()["parent_id"] is None
+        assert (await update(app, client, headers, second, {"depends_on": []})).json()["depends_on"] == []
+        assert (await update(app, client, headers, first, {"depends_on": [second]})).status_code == status.HTTP_200_OK
+    
+    async def test_chains_are_limited(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        task_id = None
+        for level in range(MAX_TASK_GRAPH_DEPTH + 1):
+            task_id = await create(app, client, headers, f"Level {level}", parent_id=task_id)
+        
+        res = await client.post(
+            app.url_path_for("task:create-task"),
+            json={"name": "Too deep", "description": "Too deep", "parent_id": task_id},
+            headers=headers,
+        )
+        assert res.status_code == status.HTTP_400_BAD_REQUEST
+    
+    async def test_chains_moved_along_count(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        parent_id = dependency = None
+        for level in range(MAX_TASK_GRAPH_DEPTH):
+            parent_id = await create(app, client, headers, f"Level {level}", parent_id=parent_id)
+            dependency = await create(
+                app, client, headers, f"Step {level}", depends_on=[dependency] if dependency else [],
+            )
+        moved = await create(app, client, headers, "Moved")
+        await create(app, client, headers, "Moved child", parent_id=moved)
+        blocker = await create(app, client, headers, "Blocker")
+        await create(app, client, headers, "Blocked", depends_on=[blocker])
+        
+        # the deepest task of each chain would end up one level too far below its top
+        for task_id, json in [(moved, {"parent_id": parent_id}), (blocker, {"depends_on": [dependency]})]:
+            res = await update(app, client, headers, task_id, json)
+            assert res.status_code == status.HTTP_400_BAD_REQUEST, json
+        
+        # a task with nothing below it still fits at the end of either chain
+        leaf = await create(app, client, headers, "Leaf")
+        for json in [{"parent_id": parent_id}, {"depends_on": [dependency]}]:
+            assert (await update(app, client, headers, leaf, json)).status_code == status.HTTP_200_OK, json
+    
+    async def test_references_stay_within_the_tenant(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        other = await create(app, client, auth(f"tenant-{uuid.uuid4()}"), "Someone else's")
+        
+        for json in [{"parent_id": other}, {"depends_on": [other]}, {"parent_id": str(uuid.uuid4())}]:
+            res = await client.post(
+                app.url_path_for("task:create-task"), json={"name": "a", "description": "b", **json}, headers=headers,
+            )
+            assert res.status_code == status.HTTP_400_BAD_REQUEST, json
+    
+    async def test_batches(self, app: FastAPI, client: TestClient, headers: dict) -> None:
+        parent = await create(app, client, headers, "Parent")
+        
+        res = await client.post(
+            app.url_path_for("task:create-tasks-batch"),
+            json=[
+                {"name": "a", "description": "a", "parent_id": parent},
+                {"name": "b", "description": "b", "parent_id": str(uuid.uuid4())},
+                {"name": "c", "description": "c"},
+            ],
+            headers=headers,
+        )
+        created = res.json()["results"]
+        assert [result["status_code"] for result in created] == [201, 400, 201]
+        assert (await client.get(
+            app.url_path_for("task:get-task-by-id", task_id=created[1]["id"]), headers=headers,
+        )).status_code == status.HTTP_404_NOT_FOUND
+        
+        res = await client.patch(
+            app.url_path_for("task:update-tasks-batch"),
+            json=[{"id": created[2]["id"], "parent_id": parent}, {"id": created[0]["id"], "status": "completed"}],
+            headers=headers,
+        )
+        assert [result["status_code"] for result in res.json()["results"]] == [400, 200]
+        assert [task["_id"] for task in (await graph(app, client, headers, parent))["tasks"]] == [created[0]["id"]]
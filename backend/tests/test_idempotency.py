@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from fastapi import HTTPException, Response, status
+
+from app.core.metrics import MetricsRegistry, render
+from app.db.idempotency import IdempotencyRecord, IdempotentRequests, InMemoryIdempotencyStore, StoredResponse
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingHandler:
+    def __init__(self, release: asyncio.Event) -> None:
+        self.release = release
+        self.calls = 0
+    
+    async def __call__(self) -> Response:
+        self.calls += 1
+        await self.release.wait()
+        return Response(b'{"n": %d}' % self.calls, status_code=status.HTTP_201_CREATED, headers={"ETag": '"1"'})
+
+
+class TestInMemoryIdempotencyStore:
+    async def test_claims_expire(self) -> None:
+        clock = FakeClock()
+        store = InMemoryIdempotencyStore(clock=clock)
+        
+        assert await store.claim("key", "a", lock_seconds=10) is None
+        assert await store.claim("key", "a", lock_seconds=10) == IdempotencyRecord("a")
+        
+        clock.now = 10
+        assert await store.claim("key", "a", lock_seconds=10) is None
+    
+    async def test_completed_keys_hold_response_until_ttl(self) -> None:
+        clock = FakeClock()
+        store = InMemoryIdempotencyStore(clock=clock)
+        response = StoredResponse(201, b"{}")
+        
+        await store.claim("key", "a", lock_seconds=10)
+        await store.complete("key", "a", response, ttl=100)
+        clock.now = 50
+        assert await store.claim("key", "a", lock_seconds=10) == IdempotencyRecord("a", response)
+        
+        clock.now = 100
+        assert await store.claim("key", "a", lock_seconds=10) is None
+        assert list(store.records) == ["key"]
+
+
+class TestIdempotentRequests:
+    async def test_concurrent_duplicates_run_once(self) -> None:
+        registry = MetricsRegistry()
+        requests = IdempotentRequests(InMemoryIdempotencyStore(), registry, ttl=100, lock_seconds=10)
+        handler = CountingHandler(asyncio.Event())
+        
+        runs = [asyncio.create_task(requests.run("key", "a", handler)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        handler.release.set()
+        responses = await asyncio.gather(*runs)
+        replay = await requests.run("key", "a", handler)
+        
+        assert handler.calls == 1
+        assert {res.body for res in responses} == {replay.body} == {b'{"n": 1}'}
+        assert replay.headers["ETag"] == '"1"'
+        assert replay.headers["Idempotent-Replayed"] == "true"
+        
+        output = render(registry.metrics.values())
+        assert 'idempotent_requests_total{result="coalesced"} 2' in output
+        assert 'idempotent_requests_total{result="replayed"} 1' in output
+    
+    async def test_other_process_running_key_gets_409(self) -> None:
+        store = InMemoryIdempotencyStore()
+        requests = IdempotentRequests(store, MetricsRegistry(), ttl=100, lock_seconds=10)
+        await store.claim("key", "a", lock_seconds=10)
+        
+        with pytest.raises(HTTPException) as e:
+            await requests.run("key", "a", CountingHandler(asyncio.Event()))
+        assert e.value.status_code == status.HTTP_409_CONFLICT
+    
+    async def test_failed_request_releases_key(self) -> None:
+        requests = IdempotentRequests(InMemoryIdempotencyStore(), MetricsRegistry(), ttl=100, lock_seconds=10)
+        
+        async def fail() -> Response:
+            raise HTTPException(status.HTTP_404_NOT_FOUND)
+        
+        with pytest.raises(HTTPException):
+            await requests.run("key", "a", fail)
+        
+        handler = CountingHandler(asyncio.Event())
+        handler.release.set()
+        assert (await requests.run("key", "a", handler)).status_code == status.HTTP_201_CREATED
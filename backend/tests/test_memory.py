@@ -0,0 +1,128 @@
+import uuid
+from datetime import datetime, timedelta
+from typing import List
+
+import pytest
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from app.db.memory import InMemoryCollection, InMemoryMotorClient
+from app.db.pagination import keyset_filter
+from app.models.core import SortOrder
+
+pytestmark = pytest.mark.asyncio
+
+START = datetime(2024, 1, 1)
+
+INDEXES = [
+    IndexModel([("updated", DESCENDING), ("_id", DESCENDING)], name="updated_id"),
+    IndexModel([("status", ASCENDING), ("updated", DESCENDING), ("_id", DESCENDING)], name="status_updated_id"),
+    IndexModel([("next_fire_at", ASCENDING)], name="next_fire_at", sparse=True),
+]
+
+QUERIES = [
+    ({}, [("updated", DESCENDING), ("_id", DESCENDING)]),
+    ({"status": "pending"}, [("updated", ASCENDING), ("_id", ASCENDING)]),
+    ({"status": {"$in": ["completed", "cancelled"]}, "updated": {"$lt": START + timedelta(hours=30)}}, []),
+    ({"status": "pending", **keyset_filter(START + timedelta(hours=20), uuid.UUID(int=20), SortOrder.desc)},
+     [("updated", DESCENDING), ("_id", DESCENDING)]),
+    ({"next_fire_at": {"$lte": START + timedelta(hours=10)}}, [("next_fire_at", ASCENDING)]),
+    ({"next_fire_at": {"$exists": False}}, [("_id", ASCENDING)]),
+    ({"_id": {"$in": [uuid.UUID(int=3), uuid.UUID(int=4), uuid.UUID(int=999)]}, "status": "pending"}, []),
+]
+
+
+async def new_collection(indexed: bool) -> InMemoryCollection:
+    collection = InMemoryCollection("tasks")
+    if indexed:
+        await collection.create_indexes(INDEXES)
+    await collection.insert_many([
+        {
+            "_id": uuid.UUID(int=i),
+            "status": ["pending", "completed", "cancelled"][i % 3],
+            # every other pair of tasks shares its update time, so pages break ties by _id
+            "updated": START + timedelta(hours=i // 2),
+            **({"next_fire_at": START + timedelta(hours=i)} if i % 4 == 0 else {}),
+        }
+        for i in range(60)
+    ])
+    return collection
+
+
+def ids(documents: List[dict]) -> List[int]:
+    return [document["_id"].int for document in documents]
+
+
+class TestInMemoryIndexes:
+    @pytest.mark.parametrize("query, sort", QUERIES)
+    @pytest.mark.parametrize("limit", [0, 5])
+    async def test_indexed_queries_match_full_scans(self, query: dict, sort: list, limit: int) -> None:
+        indexed, scanned = await new_collection(indexed=True), await new_collection(indexed=False)
+        
+        expected, found = ids(scanned.select(query, sort)), ids(indexed.select(query, sort, limit))
+        if sort:
+            assert found == expected[:limit or None]
+        else:
+            # without a sort any matches may come back, in any order
+            assert len(found) == len(expected[:limit or None]) and set(found) <= set(expected)
+    
+    async def test_pages_walk_an_index_in_sort_order(self) -> None:
+        collection = await new_collection(indexed=True)
+        
+        sort = [("updated", DESCENDING), ("_id", DESCENDING)]
+        documents, ordered, _ = collection.plan({"status": "pending"}, sort, 5)
+        
+        assert ordered
+        assert ids(list(documents)[:2]) == [57, 54]
+    
+    async def test_writes_keep_indexes_current(self) -> None:
+        collection = await new_collection(indexed=True)
+        
+        await collection.update_many({"status": "pending"}, {"$set": {"status": "completed"}})
+        await collection.update_one(
+            {"_id": uuid.UUID(int=1)}, {"$unset": {"next_fire_at": ""}, "$set": {"status": "pending"}},
+        )
+        await collection.delete_many({"updated": {"$gte": START + timedelta(hours=10)}})
+        
+        assert ids(collection.select({"status": "pending"})) == [1]
+        assert ids(collection.select({"next_fire_at": {"$gte": START}}, [("next_fire_at", ASCENDING)])) == [
+            0, 4, 8, 12, 16,
+        ]
+        assert len(collection.indexes["updated_id"].entries) == 20
+    
+    async def test_array_values_give_the_index_up(self) -> None:
+        collection = await new_collection(indexed=True)
+        
+        await collection.update_one({"_id": uuid.UUID(int=2)}, {"$set": {"status": ["pending", "completed"]}})
+        
+        assert not collection.indexes["status_updated_id"].usable
+        assert 2 in ids(collection.select({"status": "pending"}))
+
+
+class TestInMemoryMotorClient:
+    async def test_clients_of_one_url_share_databases(self) -> None:
+        url = f"memory://{uuid.uuid4()}"
+        await InMemoryMotorClient(url)["app"].get_collection("tasks").insert_one({"_id": 1})
+        
+        assert await InMemoryMotorClient(url)["app"].get_collection("tasks").count_documents({}) == 1
+        assert await InMemoryMotorClient("memory://other")["app"].get_collection("tasks").count_documents({}) == 0
+    
+    async def test_graph_lookup_walks_each_document_once(self) -> None:
+        database = InMemoryMotorClient(f"memory://{uuid.uuid4()}")["app"]
+        collection = database.get_collection("tasks")
+        # 1 depends on 2 and 3, which both depend on 4, and 4 depends on 1 again
+        await collection.insert_many([
+            {"_id": 1, "depends_on": [2, 3]}, {"_id": 2, "depends_on": [4]},
+            {"_id": 3, "depends_on": [4]}, {"_id": 4, "depends_on": [1]},
+        ])
+        lookup = {
+            "from": "tasks", "startWith": "$depends_on", "connectFromField": "depends_on", "connectToField": "_id",
+            "as": "graph", "depthField": "depth",
+        }
+        
+        [document] = await collection.aggregate([{"$match": {"_id": 1}}, {"$graphLookup": lookup}]).to_list(None)
+        [limited] = await collection.aggregate([
+            {"$match": {"_id": 1}}, {"$graphLookup": {**lookup, "maxDepth": 0}}, {"$set": {"graph": "$graph._id"}},
+        ]).to_list(None)
+        
+        assert sorted((found["_id"], found["depth"]) for found in document["graph"]) == [(1, 2), (2, 0), (3, 0), (4, 1)]
+        assert sorted(limited["graph"]) == [2, 3]
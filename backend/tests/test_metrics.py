@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+import pytest
+
+from fastapi import FastAPI, status
+from async_asgi_testclient import TestClient
+from pymongo import monitoring
+
+from app.core.metrics import MetricsRegistry, render
+from app.core.tracing import Tracer, current_trace, span
+from app.db.monitoring import CommandMetrics
+from app.models.task import TaskPublic
+
+pytestmark = pytest.mark.asyncio
+
+ADDRESS = ("localhost", 27017)
+
+
+class TestMetricsRegistry:
+    async def test_histogram_renders_cumulative_buckets(self) -> None:
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.labels("/tasks").observe(value)
+        
+        lines = render(registry.metrics.values()).splitlines()
+        assert "# TYPE latency_seconds histogram" in lines
+        assert 'latency_seconds_bucket{route="/tasks",le="0.1"} 1' in lines
+        assert 'latency_seconds_bucket{route="/tasks",le="1"} 2' in lines
+        assert 'latency_seconds_bucket{route="/tasks",le="+Inf"} 3' in lines
+        assert 'latency_seconds_sum{route="/tasks"} 5.55' in lines
+        assert 'latency_seconds_count{route="/tasks"} 3' in lines
+    
+    async def test_label_values_are_escaped(self) -> None:
+        registry = MetricsRegistry()
+        registry.counter("errors_total", "Errors", ("detail",)).labels('say "hi"\n').inc()
+        
+        assert 'errors_total{detail="say \\"hi\\"\\n"} 1' in render(registry.metrics.values())
+    
+    async def test_registering_twice_returns_same_metric(self) -> None:
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests")
+        
+        assert registry.counter("requests_total", "Requests") is counter
+        with pytest.raises(ValueError):
+            registry.gauge("requests_total", "Requests")
+
+
+class TestTracer:
+    async def test_unsampled_requests_record_nothing(self) -> None:
+        tracer = Tracer(sample_rate=0.0)
+        
+        assert tracer.start("GET /") is None
+        with span("render"):
+            assert current_trace.get() is None
+    
+    async def test_sampled_trace_collects_spans_and_calls_hooks(self) -> None:
+        finished = []
+        tracer = Tracer(sample_rate=1.0, hooks=[finished.append])
+        
+        trace = tracer.start("GET /")
+        with span("render"):
+            pass
+        tracer.finish(trace)
+        
+        assert finished == [trace]
+        assert [s.name for s in trace.spans] == ["render"]
+        assert current_trace.get() is None
+
+
+class TestCommandMetrics:
+    async def test_durations_are_tagged_by_collection_and_command(self) -> None:
+        registry = MetricsRegistry()
+        listener = CommandMetrics(registry)
+        
+        listener.started(monitoring.CommandStartedEvent({"find": "tasks"}, "db", 1, ADDRESS, 7))
+        listener.succeeded(monitoring.CommandSucceededEvent(timedelta(microseconds=2500), {"ok": 1}, "find", 1, ADDRESS, 7))
+        listener.started(monitoring.CommandStartedEvent({"insert": "tasks"}, "db", 2, ADDRESS, 8))
+        listener.failed(monitoring.CommandFailedEvent(timedelta(microseconds=1000), {"ok": 0}, "insert", 2, ADDRESS, 8))
+        
+        output = render(registry.metrics.values())
+        assert 'mongodb_command_duration_seconds_count{collection="tasks",command="find"} 1' in output
+        assert 'mongodb_command_duration_seconds_sum{collection="tasks",command="find"} 0.0025' in output
+        assert 'mongodb_command_failures_total{collection="tasks",command="insert"} 1' in output
+        assert listener.collections == {}
+
+
+class TestMetricsRoute:
+    async def test_requests_are_measured_by_route_template(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=test_task.id))
+        assert res.status_code == status.HTTP_200_OK
+        
+        res = await client.get(app.url_path_for("metrics:get-metrics"))
+        assert res.status_code == status.HTTP_200_OK
+        assert res.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert (
+            'http_request_duration_seconds_count{method="GET",route="/api/tasks/{task_id}/",status="200"} 1'
+            in res.text
+        )
+        assert 'http_requests_in_flight{method="GET",route="/metrics"} 1' in res.text
+        assert "task_cache_misses_total" in res.text
+        assert "mongodb_pool_checkouts_total" in res.text
+    
+    async def test_sampled_requests_are_traced(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        traces = []
+        app.tracer.sample_rate = 1.0
+        app.tracer.hooks = [traces.append]
+        
+        await client.get(app.url_path_for("task:get-task-by-id", task_id=test_task.id))
+        
+        assert [trace.name for trace in traces] == ["GET /api/tasks/{task_id}/"]
+        assert traces[0].attributes["status"] == "200"
+        assert "render" in [s.name for s in traces[0].spans]
@@ -0,0 +1,225 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+from fastapi import FastAPI, status
+from fastapi.encoders import jsonable_encoder
+from async_asgi_testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import PyMongoError
+
+from app.core.security import create_tenant_token
+from app.db.codec import upgrade_task
+from app.db.migrator import TASKS_MIGRATION, TaskMigrator
+from app.db.repositories.migrations import MigrationRepository
+from app.db.repositories.tasks import TaskRepository
+from app.models.task import TASK_SCHEMA_VERSION, TaskInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+def legacy_task(tenant: str, name: str = "Old task") -> dict:
+    # as tasks were stored before native BSON types, with the id and timestamps as strings
+    return jsonable_encoder(TaskInDB(name=name, description="Stored by jsonable_encoder", tenant=tenant))
+
+
+def new_tenant() -> str:
+    return f"tenant-{uuid.uuid4()}"
+
+
+@pytest_asyncio.fixture
+async def migrator(app: FastAPI, client: TestClient) -> TaskMigrator:
+    # the test database outlives a test, the migration of earlier tests has to run again for the tasks added here
+    await app.task_migrator.close()
+    await MigrationRepository(app.database).collection.delete_many({})
+    app.task_migrator.done = False
+    return app.task_migrator
+
+
+async def migrate(migrator: TaskMigrator) -> None:
+    for _ in range(100):
+        if migrator.done:
+            return
+        await migrator.migrate_once()
+    raise AssertionError("The migration did not finish")
+
+
+class TestUpgrade:
+    async def test_legacy_documents_get_native_values(self) -> None:
+        document = legacy_task(new_tenant())
+        
+        upgraded = upgrade_task(document)
+        
+        assert upgraded["_id"] == uuid.UUID(document["_id"])
+        assert isinstance(upgraded["updated"], datetime)
+        assert upgraded["updated"].microsecond % 1000 == 0
+        assert upgraded["schema_version"] == TASK_SCHEMA_VERSION
+        assert isinstance(document["_id"], str)
+    
+    async def test_current_documents_are_not_copied(self) -> None:
+        document = {"_id": uuid.uuid4(), "schema_version": TASK_SCHEMA_VERSION}
+        
+        assert upgrade_task(document) is document
+        assert upgrade_task({**document, "schema_version": TASK_SCHEMA_VERSION + 1})["schema_version"] == (
+            TASK_SCHEMA_VERSION + 1
+        )
+
+
+class TestLegacyTasks:
+    async def test_are_served_before_they_are_migrated(
+            self, app: FastAPI, client: TestClient, migrator: TaskMigrator, db: AsyncIOMotorDatabase
+    ) -> None:
+        tenant = new_tenant()
+        headers = {"Authorization": f"Bearer {create_tenant_token(tenant)}"}
+        document = legacy_task(tenant)
+        await db.get_collection("tasks").insert_one(dict(document))
+        by_id = app.url_path_for("task:get-task-by-id", task_id=document["_id"])
+        
+        res = await client.get(by_id, headers=headers)
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json()["_id"] == document["_id"]
+        assert "schema_version" not in res.json()
+        
+        listed = await client.get(app.url_path_for("task:get-all-tasks"), headers=headers)
+        assert [task["_id"] for task in listed.json()["tasks"]] == [document["_id"]]
+        
+        updated = await client.put(by_id, json={"status": "completed"}, headers=headers)
+        assert updated.status_code == status.HTTP_200_OK
+        assert updated.json()["status"] == "completed"
+        
+        assert (await client.delete(by_id, headers=headers)).status_code == status.HTTP_204_NO_CONTENT
+        assert (await client.get(by_id, headers=headers)).status_code == status.HTTP_404_NOT_FOUND
+
+
+    async def test_are_paginated_with_the_others(
+            self, app: FastAPI, client: TestClient, migrator: TaskMigrator, db: AsyncIOMotorDatabase
+    ) -> None:
+        tenant = new_tenant()
+        headers = {"Authorization": f"Bearer {create_tenant_token(tenant)}"}
+        legacy = [{**legacy_task(tenant), "updated": f"2023-07-0{day}T12:00:00"} for day in (1, 2, 3)]
+        await db.get_collection("tasks").insert_many([dict(document) for document in legacy])
+        native = [
+            (await client.post(
+                app.url_path_for("task:create-task"), json={"name": f"New task {i}", "description": "New"},
+                headers=headers,
+            )).json()
+            for i in range(3)
+        ]
+        # tasks created within a millisecond tie on updated, and are ordered by id
+        native.sort(key=lambda task: (task["updated"], uuid.UUID(task["_id"])))
+        oldest_first = [document["_id"] for document in legacy] + [task["_id"] for task in native]
+        
+        for order, expected in (("desc", oldest_first[::-1]), ("asc", oldest_first)):
+            listed, cursor = [], None
+            while True:
+                params = {"limit": 2, "order": order, **({"cursor": cursor} if cursor else {})}
+                res = await client.get(app.url_path_for("task:get-all-tasks"), query_string=params, headers=headers)
+                assert res.status_code == status.HTTP_200_OK
+                listed += [task["_id"] for task in res.json()["tasks"]]
+                if (cursor := res.json()["next_cursor"]) is None:
+                    break
+            assert listed == expected, order
+
+
+class TestMigrator:
+    async def test_rewrites_older_documents(
+            self, app: FastAPI, migrator: TaskMigrator, db: AsyncIOMotorDatabase
+    ) -> None:
+        tasks = db.get_collection("tasks")
+        legacy = legacy_task(new_tenant())
+        native = {**legacy_task(new_tenant()), "_id": uuid.uuid4(), "updated": datetime(2023, 7, 1, 12)}
+        await tasks.insert_many([dict(legacy), dict(native)])
+        
+        await migrate(migrator)
+        
+        assert await tasks.find_one({"_id": legacy["_id"]}) is None
+        migrated = await tasks.find_one({"_id": uuid.UUID(legacy["_id"])})
+        assert migrated["schema_version"] == TASK_SCHEMA_VERSION
+        assert isinstance(migrated["updated"], datetime)
+        assert (await tasks.find_one({"_id": native["_id"]}))["schema_version"] == TASK_SCHEMA_VERSION
+        
+        state = await MigrationRepository(db).get(TASKS_MIGRATION)
+        assert state["done"] and state["version"] == TASK_SCHEMA_VERSION
+        assert state["migrated"] >= 2
+        # with the migration done, ids are no longer looked up as strings too
+        id = uuid.UUID(legacy["_id"])
+        assert TaskRepository(db, app=app).id_condition(id) == {"$in": [id]}
+    
+    async def test_task_written_during_a_batch_is_moved_once(
+            self, app: FastAPI, migrator: TaskMigrator, db: AsyncIOMotorDatabase, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        tasks = db.get_collection("tasks")
+        legacy = legacy_task(new_tenant())
+        await tasks.insert_one(dict(legacy))
+        task_repo = TaskRepository(db, app=app)
+        find = task_repo.collection.find
+        
+        def find_then_update(*args, **kwargs):
+            cursor = find(*args, **kwargs)
+            to_list = cursor.to_list
+            
+            async def updated_after_read(length):
+                records = await to_list(length)
+                await tasks.update_one({"_id": legacy["_id"]}, {"$set": {"name": "Renamed", "updated": "2024-01-01"}})
+                return records
+            
+            cursor.to_list = updated_after_read
+            return cursor
+        
+        monkeypatch.setattr(task_repo.collection, "find", find_then_update)
+        await task_repo.migrate_tasks(after=legacy["_id"][:-1], batch_size=1)
+        monkeypatch.undo()
+        
+        copies = await tasks.find({"_id": {"$in": [legacy["_id"], uuid.UUID(legacy["_id"])]}}).to_list(None)
+        assert [(copy["_id"], copy["name"]) for copy in copies] == [(uuid.UUID(legacy["_id"]), "Renamed")]
+    
+    async def test_task_is_kept_when_its_move_fails(
+            self, app: FastAPI, migrator: TaskMigrator, db: AsyncIOMotorDatabase, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        tasks = db.get_collection("tasks")
+        legacy = legacy_task(new_tenant())
+        await tasks.insert_one(dict(legacy))
+        task_repo = TaskRepository(db, app=app)
+        insert_one = task_repo.collection.insert_one
+        
+        async def failing_insert_one(document, *args, **kwargs):
+            if isinstance(document["_id"], uuid.UUID):
+                raise PyMongoError("connection lost")
+            return await insert_one(document, *args, **kwargs)
+        
+        monkeypatch.setattr(task_repo.collection, "insert_one", failing_insert_one)
+        with pytest.raises(PyMongoError):
+            await task_repo.migrate_tasks(after=legacy["_id"][:-1], batch_size=1)
+        monkeypatch.undo()
+        
+        assert await tasks.find_one({"_id": legacy["_id"]}) == legacy
+        await task_repo.migrate_tasks(after=legacy["_id"][:-1], batch_size=1)
+        assert await tasks.find_one({"_id": legacy["_id"]}) is None
+        assert (await tasks.find_one({"_id": uuid.UUID(legacy["_id"])}))["name"] == legacy["name"]
+    
+    async def test_resumes_from_its_checkpoint(
+            self, app: FastAPI, migrator: TaskMigrator, db: AsyncIOMotorDatabase
+    ) -> None:
+        tasks = db.get_collection("tasks")
+        documents = [legacy_task(new_tenant(), name=f"Old task {i}") for i in range(3)]
+        await tasks.insert_many([dict(document) for document in documents])
+        first_id, *_ = sorted(document["_id"] for document in documents)
+        
+        # a lease that has already run out, as if the process died after its first batch
+        stopped = TaskMigrator(app, batch_size=1, batch_interval=0, lease=timedelta(seconds=-1))
+        assert await stopped.migrate_once()
+        state = await MigrationRepository(db).get(TASKS_MIGRATION)
+        assert state["after"] == first_id
+        
+        successor = TaskMigrator(app, batch_size=1, batch_interval=0, lease=timedelta(seconds=60))
+        assert await successor.migrate_once()
+        assert (await MigrationRepository(db).get(TASKS_MIGRATION))["after"] > first_id
+        # the lease now belongs to the successor
+        assert not await migrator.migrate_once()
+        
+        await migrate(successor)
+        for document in documents:
+            assert await tasks.find_one({"_id": document["_id"]}) is None
+            assert await tasks.find_one({"_id": uuid.UUID(document["_id"])}) is not None
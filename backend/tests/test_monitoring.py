@@ -0,0 +1,36 @@
+from pymongo import monitoring
+
+from app.db.monitoring import PoolMetrics
+
+ADDRESS = ("localhost", 27017)
+
+
+class TestPoolMetrics:
+    def test_checkouts_are_counted(self) -> None:
+        pool_metrics = PoolMetrics()
+        
+        pool_metrics.connection_created(monitoring.ConnectionCreatedEvent(ADDRESS, 1))
+        pool_metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+        assert pool_metrics.wait_queue_size == 1
+        
+        pool_metrics.connection_checked_out(monitoring.ConnectionCheckedOutEvent(ADDRESS, 1))
+        assert pool_metrics.wait_queue_size == 0
+        assert pool_metrics.connections_checked_out == 1
+        assert pool_metrics.checkouts == 1
+        assert pool_metrics.checkout_wait_seconds >= 0
+        
+        pool_metrics.connection_checked_in(monitoring.ConnectionCheckedInEvent(ADDRESS, 1))
+        assert pool_metrics.connections_checked_out == 0
+        assert pool_metrics.connections_open == 1
+    
+    def test_failed_checkouts_are_counted_by_reason(self) -> None:
+        pool_metrics = PoolMetrics()
+        
+        for _ in range(2):
+            pool_metrics.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(ADDRESS))
+            pool_metrics.connection_check_out_failed(
+                monitoring.ConnectionCheckOutFailedEvent(ADDRESS, monitoring.ConnectionCheckOutFailedReason.TIMEOUT)
+            )
+        
+        assert pool_metrics.wait_queue_size == 0
+        assert pool_metrics.checkout_failures[monitoring.ConnectionCheckOutFailedReason.TIMEOUT] == 2
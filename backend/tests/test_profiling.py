@@ -0,0 +1,62 @@
+import pytest
+
+from fastapi import FastAPI, status
+from async_asgi_testclient import TestClient
+
+from app.core.profiling import StartupProfile, parse_import_times
+
+pytestmark = pytest.mark.asyncio
+
+IMPORT_TIMES = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2500 |       4000 | fastapi.openapi.models
+not an import time line
+"""
+
+
+class TestStartupProfile:
+    async def test_nested_phases_are_listed_below_their_parent(self) -> None:
+        profile = StartupProfile(enabled=True)
+        with profile.phase("startup"):
+            with profile.phase("mongodb: first ping"):
+                pass
+        
+        assert [(phase.name, phase.depth) for phase in profile.phases] == [
+            ("startup", 0), ("mongodb: first ping", 1),
+        ]
+        outer, inner = profile.phases
+        assert outer.seconds >= inner.seconds
+        assert outer.done_at >= inner.done_at
+        assert "    mongodb: first ping" in profile.report()
+    
+    async def test_disabled_profile_records_nothing(self) -> None:
+        profile = StartupProfile(enabled=False)
+        with profile.phase("startup"):
+            pass
+        
+        assert profile.phases == []
+    
+    async def test_import_times_are_parsed_in_seconds(self) -> None:
+        imports = parse_import_times(IMPORT_TIMES)
+        
+        assert [module.name for module in imports] == ["_io", "fastapi.openapi.models"]
+        assert imports[1].self_seconds == pytest.approx(0.0025)
+        assert imports[1].cumulative_seconds == pytest.approx(0.004)
+
+
+class TestDocs:
+    async def test_schema_is_served(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.get("/openapi.json")
+        
+        assert res.status_code == status.HTTP_200_OK
+        assert "/api/tasks/" in res.json()["paths"]
+    
+    async def test_docs_can_be_disabled(self, prepare_test_env: None, monkeypatch: pytest.MonkeyPatch) -> None:
+        from app.api.server import config, get_application
+        monkeypatch.setattr(config, "DOCS_ENABLED", False)
+        
+        paths = {route.path for route in get_application().routes}
+        
+        assert not paths & {"/docs", "/redoc", "/openapi.json"}
+        assert "/api/tasks/" in paths
@@ -0,0 +1,179 @@
+import asyncio
+from datetime import timedelta
+from typing import List
+
+import pytest
+import pytest_asyncio
+
+from fastapi import FastAPI, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from async_asgi_testclient import TestClient
+
+from app.db.repositories.tasks import TaskRepository
+from app.db.scheduler import TaskJob, TaskScheduler, job_event_publisher
+from app.models.core import datetime_now
+from app.models.task import TaskCreate, TaskEventType, TaskJobKind, TaskPublic, TaskStatus, TaskUpdate
+
+pytestmark = pytest.mark.asyncio
+
+
+class RecordingHandler:
+    def __init__(self) -> None:
+        self.jobs: List[TaskJob] = []
+    
+    async def __call__(self, job: TaskJob) -> None:
+        await asyncio.sleep(0)
+        self.jobs.append(job)
+    
+    def fired(self, task: TaskPublic) -> List[TaskJobKind]:
+        return [job.kind for job in self.jobs if job.task.id == task.id]
+
+
+def new_scheduler(app: FastAPI, handler: RecordingHandler) -> TaskScheduler:
+    scheduler = TaskScheduler(app, batch_size=10, poll_interval=1, lease=timedelta(seconds=60), max_concurrency=4)
+    scheduler.add_handler(handler)
+    return scheduler
+
+
+@pytest_asyncio.fixture
+async def scheduled_app(app: FastAPI, client: TestClient) -> FastAPI:
+    # the app's own scheduler would race the ones under test for the jobs
+    await app.task_scheduler.close()
+    return app
+
+
+async def create_scheduled_task(db: AsyncIOMotorDatabase, **times: timedelta) -> TaskPublic:
+    task = TaskCreate(
+        name="Scheduled", description="Has jobs", **{field: datetime_now() + delta for field, delta in times.items()},
+    )
+    return await TaskRepository(db).create_task(task=task)
+
+
+async def run_until_idle(scheduler: TaskScheduler) -> None:
+    while await scheduler.run_once():
+        pass
+
+
+class TestTaskScheduler:
+    async def test_due_jobs_fire_once_in_time_order(self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase) -> None:
+        handler = RecordingHandler()
+        scheduler = new_scheduler(scheduled_app, handler)
+        task = await create_scheduled_task(db, remind_at=timedelta(minutes=-2), due_at=timedelta(minutes=-1))
+        later = await create_scheduled_task(db, due_at=timedelta(hours=1))
+        
+        await run_until_idle(scheduler)
+        await run_until_idle(scheduler)
+        
+        assert handler.fired(task) == [TaskJobKind.reminder, TaskJobKind.due]
+        assert handler.fired(later) == []
+        document = await db.get_collection("tasks").find_one({"_id": later.id})
+        assert document["next_fire_at"] == later.due_at
+        assert "next_fire_at" not in await db.get_collection("tasks").find_one({"_id": task.id})
+    
+    async def test_concurrent_schedulers_do_not_double_fire(
+            self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase
+    ) -> None:
+        handler = RecordingHandler()
+        schedulers = [new_scheduler(scheduled_app, handler) for _ in range(3)]
+        tasks = [await create_scheduled_task(db, due_at=timedelta(seconds=-1)) for _ in range(25)]
+        
+        await asyncio.gather(*(run_until_idle(scheduler) for scheduler in schedulers))
+        
+        assert all(handler.fired(task) == [TaskJobKind.due] for task in tasks)
+    
+    async def test_failed_jobs_keep_their_lease(self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase) -> None:
+        async def fail(job: TaskJob) -> None:
+            raise RuntimeError("handler failed")
+        
+        scheduler = new_scheduler(scheduled_app, RecordingHandler())
+        scheduler.add_handler(fail)
+        task = await create_scheduled_task(db, due_at=timedelta(seconds=-1))
+        
+        await run_until_idle(scheduler)
+        
+        document = await db.get_collection("tasks").find_one({"_id": task.id})
+        assert document["next_fire_at"] > datetime_now() + timedelta(seconds=30)
+        assert "fired" not in document
+        assert scheduled_app.metrics.get("task_jobs_failed_total").labels("due").value >= 1
+    
+    async def test_undecodable_tasks_keep_their_lease(self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase) -> None:
+        handler = RecordingHandler()
+        scheduler = new_scheduler(scheduled_app, handler)
+        broken = await create_scheduled_task(db, due_at=timedelta(seconds=-1))
+        await db.get_collection("tasks").update_one({"_id": broken.id}, {"$set": {"name": 42}})
+        task = await create_scheduled_task(db, due_at=timedelta(seconds=-1))
+        
+        await run_until_idle(scheduler)
+        
+        assert handler.fired(broken) == []
+        assert handler.fired(task) == [TaskJobKind.due]
+        document = await db.get_collection("tasks").find_one({"_id": broken.id})
+        assert document["next_fire_at"] > datetime_now() + timedelta(seconds=30)
+        # the test database outlives the test, the schedulers of later tests would fail on it again
+        await db.get_collection("tasks").delete_one({"_id": broken.id})
+    
+    async def test_runner_outlives_unexpected_errors(self, scheduled_app: FastAPI) -> None:
+        scheduler = new_scheduler(scheduled_app, RecordingHandler())
+        scheduler.poll_interval = 0.01
+        runs = []
+        
+        async def run_once() -> int:
+            runs.append(len(runs))
+            if len(runs) == 1:
+                raise RuntimeError("unexpected")
+            return 0
+        
+        scheduler.run_once = run_once
+        scheduler.start()
+        for _ in range(100):
+            if len(runs) > 1:
+                break
+            await asyncio.sleep(0.01)
+        await scheduler.close()
+        
+        assert len(runs) > 1
+    
+    async def test_updates_reschedule_jobs(self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase) -> None:
+        handler = RecordingHandler()
+        scheduler = new_scheduler(scheduled_app, handler)
+        task_repo = TaskRepository(db)
+        done = await create_scheduled_task(db, due_at=timedelta(seconds=-1))
+        moved = await create_scheduled_task(db, remind_at=timedelta(seconds=-1))
+        
+        await task_repo.update_task_by_id(task_id=str(done.id), task_update=TaskUpdate(status=TaskStatus.completed))
+        await run_until_idle(scheduler)
+        await task_repo.update_task_by_id(
+            task_id=str(moved.id), task_update=TaskUpdate(remind_at=datetime_now() - timedelta(milliseconds=1)),
+        )
+        await run_until_idle(scheduler)
+        
+        assert handler.fired(done) == []
+        assert handler.fired(moved) == [TaskJobKind.reminder, TaskJobKind.reminder]
+    
+    async def test_fired_jobs_are_published(self, scheduled_app: FastAPI, db: AsyncIOMotorDatabase) -> None:
+        scheduler = new_scheduler(scheduled_app, RecordingHandler())
+        scheduler.add_handler(job_event_publisher(scheduled_app))
+        subscription = scheduled_app.task_events.subscribe()
+        task = await create_scheduled_task(db, remind_at=timedelta(seconds=-1))
+        
+        await run_until_idle(scheduler)
+        
+        events = [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        assert [event.type for event in events if event.task_id == str(task.id)] == [TaskEventType.reminder]
+
+
+class TestScheduledTaskRoutes:
+    async def test_tasks_carry_due_and_reminder_times(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.post(
+            app.url_path_for("task:create-task"),
+            json={
+                "name": "Pay rent", "description": "Before the first",
+                "due_at": "2030-01-01T09:00:00+00:00", "remind_at": "2029-12-31T09:00:00.123456",
+            },
+        )
+        
+        assert res.status_code == status.HTTP_201_CREATED
+        task = TaskPublic.model_validate(res.json())
+        assert task.due_at.tzinfo is None
+        assert task.remind_at.microsecond == 123000
+        assert "next_fire_at" not in res.json()
@@ -0,0 +1,45 @@
+from app.db.search import InvertedIndex, parse_query, tokenize
+
+
+class TestTokenize:
+    def test_stop_words_are_dropped_and_words_stemmed(self) -> None:
+        assert tokenize("Baking the Pies") == ["bak", "pie"]
+        assert tokenize("bake baked bakes") == ["bak"] * 3
+    
+    def test_query_separates_phrases_and_exclusions(self) -> None:
+        query = parse_query('pie -pumpkin "apple pie" -"cherry pie"')
+        
+        assert query.terms == {"pie", "appl"}
+        assert query.phrases == ["apple pie"]
+        assert query.excluded_terms == {"pumpkin"}
+        assert query.excluded_phrases == ["cherry pie"]
+
+
+class TestInvertedIndex:
+    def new_index(self) -> InvertedIndex:
+        index = InvertedIndex({"name": 3, "description": 1})
+        index.add(1, {"name": "Cook a pie", "description": "Should be an apple pie"})
+        index.add(2, {"name": "Buy apples", "description": "For the pie"})
+        index.add(3, {"name": "Walk the dog", "description": "Pumpkin pie afterwards"})
+        return index
+    
+    def test_matches_are_weighted_by_field(self) -> None:
+        scores = self.new_index().search("apple")
+        
+        assert set(scores) == {1, 2}
+        assert scores[2] > scores[1]
+    
+    def test_phrases_are_required_and_exclusions_applied(self) -> None:
+        index = self.new_index()
+        
+        assert set(index.search('pie "apple pie"')) == {1}
+        assert set(index.search("pie -pumpkin")) == {1, 2}
+    
+    def test_removed_and_replaced_documents_leave_no_postings(self) -> None:
+        index = self.new_index()
+        index.remove(3)
+        index.add(2, {"name": "Buy pears", "description": "For the tart"})
+        
+        assert set(index.search("pie")) == {1}
+        assert "pumpkin" not in index.postings
+        assert len(index) == 2
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from fastapi import FastAPI
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from async_asgi_testclient import TestClient
+
+from app.db.repositories.tasks import TaskRepository
+from app.db.singleflight import SingleFlight
+from app.models.task import TaskPublic
+
+pytestmark = pytest.mark.asyncio
+
+
+class CountingRead:
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+        self.calls = 0
+    
+    async def __call__(self) -> int:
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return call
+
+
+async def in_flight(*callers: asyncio.Task) -> None:
+    # lets every caller reach the read before it is released
+    await asyncio.sleep(0.01)
+    assert not any(caller.done() for caller in callers)
+
+
+class TestSingleFlight:
+    async def test_concurrent_reads_of_a_key_share_one_call(self) -> None:
+        flights = SingleFlight()
+        read = CountingRead()
+        
+        callers = [asyncio.create_task(flights.do("get", "a", read)) for _ in range(3)]
+        other = asyncio.create_task(flights.do("get", "b", read))
+        await in_flight(*callers, other)
+        read.release.set()
+        
+        assert await asyncio.gather(*callers) == [1, 1, 1]
+        assert await other == 2
+        assert (flights.stats["get"].calls, flights.stats["get"].coalesced) == (4, 2)
+        assert flights.flights == {}
+    
+    async def test_errors_are_shared(self) -> None:
+        flights = SingleFlight()
+        
+        async def fail() -> None:
+            await asyncio.sleep(0.01)
+            raise ValueError("read failed")
+        
+        results = await asyncio.gather(*(flights.do("get", "a", fail) for _ in range(2)), return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+    
+    async def test_cancelled_caller_does_not_cancel_the_read(self) -> None:
+        flights = SingleFlight()
+        read = CountingRead()
+        
+        first = asyncio.create_task(flights.do("get", "a", read))
+        second = asyncio.create_task(flights.do("get", "a", read))
+        await in_flight(first, second)
+        first.cancel()
+        read.release.set()
+        
+        assert await second == 1
+        assert first.cancelled()
+    
+    async def test_forgotten_reads_are_not_joined(self) -> None:
+        flights = SingleFlight()
+        read = CountingRead()
+        
+        before = asyncio.create_task(flights.do("list", ("page", 1), read))
+        await in_flight(before)
+        flights.forget("list")
+        after = asyncio.create_task(flights.do("list", ("page", 1), read))
+        await in_flight(after)
+        read.release.set()
+        
+        assert (await before, await after) == (1, 2)
+        assert flights.stats["list"].coalesced == 0
+
+
+class TestTaskRepositoryReads:
+    async def test_concurrent_gets_share_one_query(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, test_task: TaskPublic
+    ) -> None:
+        app.task_cache = None
+        task_repo = TaskRepository(db, app=app)
+        stats = app.task_reads.stats["get"]
+        calls, coalesced = stats.calls, stats.coalesced
+        
+        tasks = await asyncio.gather(*(task_repo.get_task_by_id(id=str(test_task.id)) for _ in range(5)))
+        
+        assert tasks == [test_task] * 5
+        assert stats.calls - calls == 5
+        assert stats.coalesced - coalesced == 4
+    
+    async def test_metrics_count_coalesced_reads(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        await asyncio.gather(*(client.get(app.url_path_for("task:get-all-tasks")) for _ in range(2)))
+        
+        res = await client.get(app.url_path_for("metrics:get-metrics"))
+        assert 'task_reads_total{kind="list"}' in res.text
+        assert 'task_reads_coalesced_total{kind="list"}' in res.text
@@ -1,13 +1,23 @@
-from datetime import datetime
+import asyncio
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Callable
 
 import pytest
+import pytest_asyncio
 
 from fastapi import FastAPI, status
 from async_asgi_testclient import TestClient
 from fastapi.encoders import jsonable_encoder
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
 
-from app.models.task import TaskPublic
+from app.db.repositories.stats import ALL_TASKS, counter_id
+from app.db.repositories.tasks import TaskRepository
+from app.db.tasks import rebuild_task_stats
+from app.models.core import datetime_now
+from app.models.task import TaskBatchUpdate, TaskCreate, TaskPublic, TaskUpdate
 
 pytestmark = pytest.mark.asyncio
 
@@ -66,6 +76,51 @@ class TestTaskCreate:
         assert res.status_code == status_code
 
 
+class TestIdempotentCreate:
+    async def test_retry_replays_first_response(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, new_task: dict
+    ) -> None:
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        count = await db.get_collection("tasks").count_documents({})
+        
+        first = await client.post(app.url_path_for("task:create-task"), json=new_task, headers=headers)
+        assert first.status_code == status.HTTP_201_CREATED
+        assert "Idempotent-Replayed" not in first.headers
+        
+        retry = await client.post(app.url_path_for("task:create-task"), json=new_task, headers=headers)
+        assert retry.status_code == status.HTTP_201_CREATED
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert retry.headers["ETag"] == first.headers["ETag"]
+        assert retry.json() == first.json()
+        assert await db.get_collection("tasks").count_documents({}) == count + 1
+    
+    async def test_concurrent_duplicates_insert_once(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, new_task: dict
+    ) -> None:
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        count = await db.get_collection("tasks").count_documents({})
+        
+        responses = await asyncio.gather(*(
+            client.post(app.url_path_for("task:create-task"), json=new_task, headers=headers) for _ in range(5)
+        ))
+        
+        assert {res.status_code for res in responses} == {status.HTTP_201_CREATED}
+        assert len({res.json()["_id"] for res in responses}) == 1
+        assert await db.get_collection("tasks").count_documents({}) == count + 1
+    
+    async def test_key_reused_for_different_task_is_rejected(
+            self, app: FastAPI, client: TestClient, new_task: dict
+    ) -> None:
+        headers = {"Idempotency-Key": str(uuid.uuid4())}
+        res = await client.post(app.url_path_for("task:create-task"), json=new_task, headers=headers)
+        assert res.status_code == status.HTTP_201_CREATED
+        
+        res = await client.post(
+            app.url_path_for("task:create-task"), json={**new_task, "name": "Other task"}, headers=headers,
+        )
+        assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
 class TestGetTask:
     async def test_get_task_by_id(
             self, app: FastAPI, client: TestClient, test_task: TaskPublic
@@ -78,6 +133,15 @@ class TestGetTask:
         task = TaskPublic(**res.json()).model_dump()
         assert task == test_task.model_dump()
     
+    async def test_get_task_fields(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("task:get-task-by-id", task_id=test_task.id), query_string={"fields": "_id,name"}
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json() == {"_id": str(test_task.id), "name": test_task.name}
+    
     @pytest.mark.parametrize(
         "id, status_code", ((50000, 404), (-1, 404), (None, 404)),
     )
@@ -96,14 +160,300 @@ class TestGetTask:
         res = await client.get(app.url_path_for("task:get-all-tasks"))
         assert res.status_code == status.HTTP_200_OK
         
-        assert (res.json(), list)
-        assert len(res.json()) > 0
+        assert isinstance(res.json()["tasks"], list)
+        assert len(res.json()["tasks"]) > 0
         
         # Check fixture task ids are present among fetched tasks
-        fetched_task_ids = [t["_id"] for t in res.json()]
+        fetched_task_ids = [t["_id"] for t in res.json()["tasks"]]
         assert all(str(t.id) in fetched_task_ids for t in test_list_of_tasks)
 
 
+class TestListTasks:
+    async def test_cursor_walks_every_task_once(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+    ) -> None:
+        fetched_task_ids = []
+        cursor = None
+        while True:
+            params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+            res = await client.get(app.url_path_for("task:get-all-tasks"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            
+            page = res.json()
+            assert len(page["tasks"]) <= 2
+            fetched_task_ids.extend(t["_id"] for t in page["tasks"])
+            if (cursor := page["next_cursor"]) is None:
+                break
+        
+        assert len(fetched_task_ids) == len(set(fetched_task_ids))
+        assert all(str(t.id) in fetched_task_ids for t in test_list_of_tasks)
+    
+    @pytest.mark.parametrize("order", ("asc", "desc"))
+    async def test_tasks_are_sorted_by_update_time(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+            order: str,
+    ) -> None:
+        res = await client.get(app.url_path_for("task:get-all-tasks"), query_string={"order": order})
+        assert res.status_code == status.HTTP_200_OK
+        
+        updated = [TaskPublic.model_validate(t).updated for t in res.json()["tasks"]]
+        assert updated == sorted(updated, reverse=order == "desc")
+    
+    async def test_filter_by_status(
+            self, app: FastAPI, client: TestClient, test_task_factory: Callable
+    ) -> None:
+        completed_task = await test_task_factory("completed")
+        
+        res = await client.get(app.url_path_for("task:get-all-tasks"), query_string={"status": "completed"})
+        assert res.status_code == status.HTTP_200_OK
+        
+        tasks = res.json()["tasks"]
+        assert str(completed_task.id) in [t["_id"] for t in tasks]
+        assert all(t["status"] == "completed" for t in tasks)
+    
+    async def test_fields_select_what_is_returned(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+    ) -> None:
+        fetched_tasks = []
+        cursor = None
+        while True:
+            params = {"limit": 2, "fields": "id,status"}
+            if cursor is not None:
+                params["cursor"] = cursor
+            res = await client.get(app.url_path_for("task:get-all-tasks"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            
+            page = res.json()
+            fetched_tasks.extend(page["tasks"])
+            if (cursor := page["next_cursor"]) is None:
+                break
+        
+        assert all(set(t) == {"_id", "status"} for t in fetched_tasks)
+        assert all({"_id": str(t.id), "status": t.status.value} in fetched_tasks for t in test_list_of_tasks)
+    
+    @pytest.mark.parametrize(
+        "params, status_code",
+        (
+                ({"limit": 0}, 422),
+                ({"limit": 100000}, 422),
+                ({"status": "invalid status"}, 422),
+                ({"order": "sideways"}, 422),
+                ({"cursor": "not a cursor"}, 400),
+                ({"fields": "id,secret"}, 422),
+                ({"fields": ","}, 422),
+        ),
+    )
+    async def test_invalid_params_raise_error(
+            self, app: FastAPI, client: TestClient, params: Dict[str, str | int], status_code: int
+    ) -> None:
+        res = await client.get(app.url_path_for("task:get-all-tasks"), query_string=params)
+        assert res.status_code == status_code
+
+
+class TestSearchTasks:
+    @pytest_asyncio.fixture
+    async def search_word(self, db: AsyncIOMotorDatabase) -> str:
+        # a word no other test uses, so results only contain the tasks created here
+        word = f"zebra{uuid.uuid4().hex[:8]}"
+        task_repo = TaskRepository(db)
+        for name, description in (
+                ("Description mentions it", f"Feed the {word}"),
+                (f"Feed the {word}", "Name mentions it"),
+                ("Unrelated task", "Nothing to see"),
+        ):
+            await task_repo.create_task(task=TaskCreate(name=name, description=description))
+        return word
+    
+    async def test_name_matches_rank_first(
+            self, app: FastAPI, client: TestClient, search_word: str
+    ) -> None:
+        res = await client.get(app.url_path_for("task:search-tasks"), query_string={"q": search_word})
+        assert res.status_code == status.HTTP_200_OK
+        
+        tasks = res.json()["tasks"]
+        assert [t["name"] for t in tasks] == [f"Feed the {search_word}", "Description mentions it"]
+    
+    async def test_cursor_walks_every_result_once(
+            self, app: FastAPI, client: TestClient, search_word: str
+    ) -> None:
+        names = []
+        cursor = None
+        while True:
+            params = {"q": search_word, "limit": 1}
+            if cursor is not None:
+                params["cursor"] = cursor
+            res = await client.get(app.url_path_for("task:search-tasks"), query_string=params)
+            assert res.status_code == status.HTTP_200_OK
+            
+            page = res.json()
+            names.extend(t["name"] for t in page["tasks"])
+            if (cursor := page["next_cursor"]) is None:
+                break
+        
+        assert sorted(names) == sorted(["Description mentions it", f"Feed the {search_word}"])
+    
+    async def test_filter_by_status(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, search_word: str
+    ) -> None:
+        res = await client.get(app.url_path_for("task:search-tasks"), query_string={"q": search_word})
+        task_id = res.json()["tasks"][0]["_id"]
+        await TaskRepository(db).update_task_by_id(task_id=task_id, task_update=TaskUpdate(status="completed"))
+        
+        res = await client.get(
+            app.url_path_for("task:search-tasks"), query_string={"q": search_word, "status": "completed"}
+        )
+        assert [t["_id"] for t in res.json()["tasks"]] == [task_id]
+    
+    @pytest.mark.parametrize(
+        "params, status_code",
+        (
+                ({}, 422),
+                ({"q": ""}, 422),
+                ({"q": "pie", "limit": 0}, 422),
+                ({"q": "pie", "status": "invalid status"}, 422),
+                ({"q": "pie", "cursor": "not a cursor"}, 400),
+                ({"q": "pie", "fields": "score"}, 422),
+        ),
+    )
+    async def test_invalid_params_raise_error(
+            self, app: FastAPI, client: TestClient, params: Dict[str, str | int], status_code: int
+    ) -> None:
+        res = await client.get(app.url_path_for("task:search-tasks"), query_string=params)
+        assert res.status_code == status_code
+
+
+class TestTaskStats:
+    async def get_stats(self, app: FastAPI, client: TestClient) -> Dict:
+        res = await client.get(app.url_path_for("task:get-task-stats"), query_string={"days": 1})
+        assert res.status_code == status.HTTP_200_OK
+        return res.json()
+    
+    async def test_counters_follow_task_writes(self, app: FastAPI, client: TestClient, new_task: dict) -> None:
+        before = await self.get_stats(app, client)
+        
+        res = await client.post(app.url_path_for("task:create-task"), json=new_task)
+        task_id = res.json()["_id"]
+        created = await self.get_stats(app, client)
+        assert created["total"] == before["total"] + 1
+        assert created["by_status"]["pending"] == before["by_status"]["pending"] + 1
+        assert created["by_day"][0]["total"] == before["by_day"][0]["total"] + 1
+        
+        await client.put(app.url_path_for("task:update-task-by-id", task_id=task_id), json={"status": "completed"})
+        updated = await self.get_stats(app, client)
+        assert updated["total"] == created["total"]
+        assert updated["by_status"]["pending"] == before["by_status"]["pending"]
+        assert updated["by_status"]["completed"] == before["by_status"]["completed"] + 1
+        
+        await client.delete(app.url_path_for("task:delete-task-by-id", task_id=task_id))
+        assert await self.get_stats(app, client) == before
+    
+    async def test_rebuild_repairs_drift(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, test_task: TaskPublic
+    ) -> None:
+        drifted = {"_id": counter_id(test_task.tenant, ALL_TASKS)}
+        await db.get_collection("task_stats").update_one(drifted, {"$inc": {"counts.pending": 5}})
+        
+        totals = await rebuild_task_stats([test_task.tenant])
+        
+        stats = await self.get_stats(app, client)
+        tasks, tenant = db.get_collection("tasks"), test_task.tenant
+        assert stats["total"] == totals[tenant] == await tasks.count_documents({"tenant": tenant})
+        assert stats["by_status"]["pending"] == await tasks.count_documents({"tenant": tenant, "status": "pending"})
+    
+    @pytest.mark.parametrize("days", (0, 367, "week"))
+    async def test_invalid_days_raise_error(self, app: FastAPI, client: TestClient, days: int | str) -> None:
+        res = await client.get(app.url_path_for("task:get-task-stats"), query_string={"days": days})
+        assert res.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestExportTasks:
+    async def test_export_streams_ndjson(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+    ) -> None:
+        res = await client.get(app.url_path_for("task:export-tasks"), query_string={"batch_size": 2})
+        assert res.status_code == status.HTTP_200_OK
+        assert res.headers["content-type"].startswith("application/x-ndjson")
+        
+        exported_tasks = [TaskPublic.model_validate(json.loads(line)) for line in res.text.splitlines()]
+        exported_task_ids = [t.id for t in exported_tasks]
+        assert len(exported_task_ids) == len(set(exported_task_ids))
+        assert all(t.id in exported_task_ids for t in test_list_of_tasks)
+    
+    async def test_export_streams_json_array(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+    ) -> None:
+        res = await client.get(
+            app.url_path_for("task:export-tasks"), query_string={"format": "json", "batch_size": 3}
+        )
+        assert res.status_code == status.HTTP_200_OK
+        
+        exported_task_ids = [t["_id"] for t in res.json()]
+        assert all(str(t.id) in exported_task_ids for t in test_list_of_tasks)
+    
+    async def test_export_fields(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            test_list_of_tasks: List[TaskPublic],
+    ) -> None:
+        res = await client.get(app.url_path_for("task:export-tasks"), query_string={"fields": "name,updated"})
+        assert res.status_code == status.HTTP_200_OK
+        
+        exported_tasks = [json.loads(line) for line in res.text.splitlines()]
+        assert all(set(t) == {"name", "updated"} for t in exported_tasks)
+        assert all(t.name in [e["name"] for e in exported_tasks] for t in test_list_of_tasks)
+    
+    async def test_export_filters_by_status_and_update_time(
+            self, app: FastAPI, client: TestClient, test_task_factory: Callable
+    ) -> None:
+        cancelled_task = await test_task_factory("cancelled")
+        
+        res = await client.get(
+            app.url_path_for("task:export-tasks"),
+            query_string={
+                "format": "json",
+                "status": "cancelled",
+                "updated_after": (cancelled_task.updated - timedelta(seconds=1)).isoformat(),
+            },
+        )
+        assert res.status_code == status.HTTP_200_OK
+        
+        exported_tasks = res.json()
+        assert str(cancelled_task.id) in [t["_id"] for t in exported_tasks]
+        assert all(t["status"] == "cancelled" for t in exported_tasks)
+        
+        res = await client.get(
+            app.url_path_for("task:export-tasks"),
+            query_string={"format": "json", "updated_before": cancelled_task.updated.isoformat()},
+        )
+        assert str(cancelled_task.id) not in [t["_id"] for t in res.json()]
+        
+        # stored times are local, bounds with an offset are the same instants
+        elsewhere = cancelled_task.updated.astimezone().astimezone(timezone(timedelta(hours=5, minutes=30)))
+        for bound, included in (("updated_after", True), ("updated_before", False)):
+            res = await client.get(
+                app.url_path_for("task:export-tasks"),
+                query_string={"format": "json", "status": "cancelled", bound: elsewhere.isoformat()},
+            )
+            assert res.status_code == status.HTTP_200_OK
+            assert (str(cancelled_task.id) in [t["_id"] for t in res.json()]) == included, bound
+
+
 class TestUpdateTask:
     @pytest.mark.parametrize(
         "attrs_to_change, values",
@@ -173,6 +523,75 @@ class TestUpdateTask:
 
 
 
+class TestConditionalRequests:
+    async def test_unchanged_task_is_not_sent_again(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        task_path = app.url_path_for("task:get-task-by-id", task_id=test_task.id)
+        res = await client.get(task_path)
+        etag = res.headers["etag"]
+        
+        res = await client.get(task_path, headers={"If-None-Match": etag})
+        assert res.status_code == status.HTTP_304_NOT_MODIFIED
+        assert res.content == b""
+        assert res.headers["etag"] == etag
+        
+        await client.put(task_path, json={"status": "completed"})
+        res = await client.get(task_path, headers={"If-None-Match": etag})
+        assert res.status_code == status.HTTP_200_OK
+        assert res.headers["etag"] != etag
+    
+    async def test_unchanged_page_is_not_sent_again(
+            self, app: FastAPI, client: TestClient, test_list_of_tasks: List[TaskPublic]
+    ) -> None:
+        res = await client.get(app.url_path_for("task:get-all-tasks"))
+        etag = res.headers["etag"]
+        
+        res = await client.get(app.url_path_for("task:get-all-tasks"), headers={"If-None-Match": f"W/{etag}"})
+        assert res.status_code == status.HTTP_304_NOT_MODIFIED
+        
+        await client.put(
+            app.url_path_for("task:update-task-by-id", task_id=test_list_of_tasks[0].id), json={"name": "Renamed"}
+        )
+        res = await client.get(app.url_path_for("task:get-all-tasks"), headers={"If-None-Match": etag})
+        assert res.status_code == status.HTTP_200_OK
+    
+    async def test_update_requires_matching_version(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        task_path = app.url_path_for("task:update-task-by-id", task_id=test_task.id)
+        etag = (await client.get(task_path)).headers["etag"]
+        
+        res = await client.put(task_path, json={"name": "First writer"}, headers={"If-Match": etag})
+        assert res.status_code == status.HTTP_200_OK
+        new_etag = res.headers["etag"]
+        assert new_etag != etag
+        
+        # a second writer holding the old version must not overwrite the first one
+        res = await client.put(task_path, json={"name": "Second writer"}, headers={"If-Match": etag})
+        assert res.status_code == status.HTTP_412_PRECONDITION_FAILED
+        res = await client.put(task_path, json={}, headers={"If-Match": etag})
+        assert res.status_code == status.HTTP_412_PRECONDITION_FAILED
+        
+        res = await client.put(task_path, json={"name": "Second writer"}, headers={"If-Match": f"{etag}, {new_etag}"})
+        assert res.status_code == status.HTTP_200_OK
+        res = await client.put(task_path, json={"status": "completed"}, headers={"If-Match": "*"})
+        assert res.status_code == status.HTTP_200_OK
+    
+    @pytest.mark.parametrize(
+        "if_match, status_code", (('"garbage"', 412), ('W/"garbage"', 412), ("*", 404)),
+    )
+    async def test_conditional_update_of_missing_task(
+            self, app: FastAPI, client: TestClient, if_match: str, status_code: int
+    ) -> None:
+        res = await client.put(
+            app.url_path_for("task:update-task-by-id", task_id="missing task"),
+            json={"name": "Renamed"},
+            headers={"If-Match": if_match},
+        )
+        assert res.status_code == status_code
+
+
 class TestDeleteTask:
     async def test_can_delete_task_successfully(
             self, app: FastAPI, client: TestClient, test_task: TaskPublic
@@ -194,3 +613,167 @@ class TestDeleteTask:
     ) -> None:
         res = await client.delete(app.url_path_for("task:delete-task-by-id", task_id=id))
         assert res.status_code == status_code
+
+
+class TestArchiveTasks:
+    async def test_soft_deleted_task_is_only_read_with_include_archived(
+            self, app: FastAPI, client: TestClient, test_task: TaskPublic
+    ) -> None:
+        res = await client.delete(
+            app.url_path_for("task:delete-task-by-id", task_id=test_task.id), query_string={"soft": "true"}
+        )
+        assert res.status_code == status.HTTP_204_NO_CONTENT
+        
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=test_task.id))
+        assert res.status_code == status.HTTP_404_NOT_FOUND
+        
+        res = await client.get(
+            app.url_path_for("task:get-task-by-id", task_id=test_task.id), query_string={"include_archived": "true"}
+        )
+        assert res.status_code == status.HTTP_200_OK
+        assert res.json()["name"] == test_task.name
+        assert res.json()["archived"] is not None
+        
+        listed_ids = [t["_id"] for t in (await client.get(app.url_path_for("task:get-all-tasks"))).json()["tasks"]]
+        assert str(test_task.id) not in listed_ids
+    
+    async def test_listing_with_archived_tasks_pages_through_both(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase, test_list_of_tasks: List[TaskPublic]
+    ) -> None:
+        archived_task = test_list_of_tasks[1]
+        await TaskRepository(db).delete_task_by_id(str(archived_task.id), soft=True)
+        
+        ids = []
+        cursor = None
+        while True:
+            params = {"include_archived": "true", "limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = (await client.get(app.url_path_for("task:get-all-tasks"), query_string=params)).json()
+            ids.extend(t["_id"] for t in page["tasks"])
+            if (cursor := page["next_cursor"]) is None:
+                break
+        
+        assert len(ids) == len(set(ids))
+        assert {str(t.id) for t in test_list_of_tasks} <= set(ids)
+    
+    async def test_old_done_tasks_are_archived(
+            self, client: TestClient, db: AsyncIOMotorDatabase, new_task: dict
+    ) -> None:
+        task_repo = TaskRepository(db)
+        old = datetime_now() - timedelta(days=2)
+        done_task = await task_repo.create_task(task=TaskCreate.model_validate(new_task))
+        pending_task = await task_repo.create_task(task=TaskCreate.model_validate(new_task))
+        tasks = db.get_collection("tasks")
+        await tasks.update_one({"_id": done_task.id}, {"$set": {"status": "completed", "updated": old}})
+        await tasks.update_one({"_id": pending_task.id}, {"$set": {"updated": old}})
+        
+        archived_count = await task_repo.archive_tasks(updated_before=datetime_now() - timedelta(days=1), batch_size=1)
+        
+        assert archived_count >= 1
+        assert await task_repo.get_task_by_id(id=str(done_task.id)) is None
+        assert (await task_repo.get_task_by_id(id=str(done_task.id), include_archived=True)).status == "completed"
+        assert await task_repo.get_task_by_id(id=str(pending_task.id)) is not None
+
+
+class TestBatchTasks:
+    async def test_batch_create(
+            self, app: FastAPI, client: TestClient, new_task_factory: Callable
+    ) -> None:
+        new_tasks = [new_task_factory(i=i) for i in range(3)]
+        res = await client.post(app.url_path_for("task:create-tasks-batch"), json=new_tasks)
+        assert res.status_code == status.HTTP_200_OK
+        
+        results = res.json()["results"]
+        assert [r["index"] for r in results] == [0, 1, 2]
+        assert all(r["status_code"] == status.HTTP_201_CREATED for r in results)
+        
+        for new_task, result in zip(new_tasks, results):
+            res = await client.get(app.url_path_for("task:get-task-by-id", task_id=result["id"]))
+            assert res.status_code == status.HTTP_200_OK
+            assert res.json()["name"] == new_task["name"]
+    
+    @pytest.mark.parametrize(
+        "invalid_payload, status_code",
+        (
+                (None, 422),
+                ([], 422),
+                ({"name": "test", "description": "test"}, 422),
+                ([{"name": "test", "description": "test"}, {"name": "test"}], 422),
+        ),
+    )
+    async def test_invalid_batch_is_rejected_as_a_whole(
+            self, app: FastAPI, client: TestClient, invalid_payload: List[Dict[str, str]], status_code: int
+    ) -> None:
+        res = await client.post(app.url_path_for("task:create-tasks-batch"), json=invalid_payload)
+        assert res.status_code == status_code
+    
+    async def test_batch_update_reports_each_task(
+            self, app: FastAPI, client: TestClient, test_list_of_tasks: List[TaskPublic]
+    ) -> None:
+        first_task, second_task = test_list_of_tasks[:2]
+        task_updates = [
+            {"id": str(first_task.id), "status": "completed"},
+            {"id": "missing task"},
+            {"id": str(second_task.id)},
+            {"id": str(first_task.id), "status": "cancelled"},
+        ]
+        res = await client.patch(app.url_path_for("task:update-tasks-batch"), json=task_updates)
+        assert res.status_code == status.HTTP_200_OK
+        
+        results = res.json()["results"]
+        assert [r["status_code"] for r in results] == [200, 404, 304, 409]
+        assert results[0]["task"]["status"] == "completed"
+        
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=first_task.id))
+        assert res.json()["status"] == "completed"
+    
+    async def test_batch_delete_reports_each_task(
+            self, app: FastAPI, client: TestClient, test_list_of_tasks: List[TaskPublic]
+    ) -> None:
+        task_ids = [str(t.id) for t in test_list_of_tasks[:2]] + ["missing task"]
+        res = await client.delete(app.url_path_for("task:delete-tasks-batch"), json=task_ids)
+        assert res.status_code == status.HTTP_200_OK
+        
+        assert [r["status_code"] for r in res.json()["results"]] == [204, 204, 404]
+        for task in test_list_of_tasks[:2]:
+            res = await client.get(app.url_path_for("task:get-task-by-id", task_id=task.id))
+            assert res.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_batch_writes_count_tasks_as_written(
+            self,
+            app: FastAPI,
+            client: TestClient,
+            db: AsyncIOMotorDatabase,
+            test_list_of_tasks: List[TaskPublic],
+            monkeypatch: pytest.MonkeyPatch,
+    ) -> None:
+        updated_task, deleted_task = test_list_of_tasks[:2]
+        task_repo, other_repo = TaskRepository(db), TaskRepository(db)
+        before = await TestTaskStats().get_stats(app, client)
+        bulk_write = task_repo.collection.bulk_write
+        
+        async def overtaken_bulk_write(operations, **kwargs):
+            # completed by another request after the batch read its task, before the first write
+            task = updated_task if isinstance(operations[0], UpdateOne) else deleted_task
+            if (await db.get_collection("tasks").find_one({"_id": task.id}))["status"] == "pending":
+                completed = TaskUpdate.model_validate({"status": "completed"})
+                await other_repo.update_task_by_id(task_id=str(task.id), task_update=completed)
+            return await bulk_write(operations, **kwargs)
+        
+        monkeypatch.setattr(task_repo.collection, "bulk_write", overtaken_bulk_write)
+        update_results = await task_repo.bulk_update(
+            task_updates=[TaskBatchUpdate(id=str(updated_task.id), status="cancelled")],
+        )
+        delete_results = await task_repo.bulk_delete(task_ids=[str(deleted_task.id)])
+        monkeypatch.undo()
+        
+        assert [r.status_code for r in update_results + delete_results] == [200, 204]
+        res = await client.get(app.url_path_for("task:get-task-by-id", task_id=updated_task.id))
+        assert res.json()["status"] == "cancelled"
+        # counted from the completed versions the writes replaced, not the pending ones read first
+        after = await TestTaskStats().get_stats(app, client)
+        assert after["total"] == before["total"] - 1
+        assert after["by_status"] == {
+            **before["by_status"],
+            "pending": before["by_status"]["pending"] - 2,
+            "cancelled": before["by_status"]["cancelled"] + 1,
+        }
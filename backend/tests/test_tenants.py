@@ -0,0 +1,181 @@
+import uuid
+
+import pytest
+
+from fastapi import FastAPI, status
+from fastapi.encoders import jsonable_encoder
+from async_asgi_testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.core.security import create_tenant_token, verify_tenant_token
+from app.db.repositories.migrations import MigrationRepository
+from app.db.repositories.tasks import TaskRepository
+from app.models.core import datetime_now
+from app.models.task import TaskEventType, TaskInDB
+
+pytestmark = pytest.mark.asyncio
+
+
+def new_tenant() -> str:
+    # the test database outlives a test, fresh tenants start without tasks
+    return f"tenant-{uuid.uuid4()}"
+
+
+def auth(tenant: str) -> dict:
+    return {"Authorization": f"Bearer {create_tenant_token(tenant)}"}
+
+
+class TestTenantTokens:
+    async def test_tokens_name_their_tenant(self) -> None:
+        assert verify_tenant_token(create_tenant_token("alice")) == "alice"
+    
+    @pytest.mark.parametrize("token", ("", "alice", "YWxpY2U.", "YWxpY2U.not-a-signature", "***.***"))
+    async def test_unsigned_tokens_are_rejected(self, token: str) -> None:
+        assert verify_tenant_token(token) is None
+    
+    async def test_tokens_cannot_be_moved_to_another_tenant(self) -> None:
+        _, signature = create_tenant_token("alice").split(".")
+        payload, _ = create_tenant_token("bob").split(".")
+        
+        assert verify_tenant_token(f"{payload}.{signature}") is None
+    
+    @pytest.mark.parametrize("authorization", ("Bearer forged.token", "Basic YWxpY2U6c2VjcmV0"))
+    async def test_invalid_tokens_get_401(self, app: FastAPI, client: TestClient, authorization: str) -> None:
+        res = await client.get(app.url_path_for("task:get-all-tasks"), headers={"Authorization": authorization})
+        
+        assert res.status_code == status.HTTP_401_UNAUTHORIZED
+        assert res.headers["WWW-Authenticate"] == "Bearer"
+
+
+class TestTenantIsolation:
+    async def test_tasks_are_only_seen_by_their_tenant(self, app: FastAPI, client: TestClient) -> None:
+        alice, bob = new_tenant(), new_tenant()
+        res = await client.post(
+            app.url_path_for("task:create-task"),
+            json={"name": "Secret plan", "description": "Only for alice"},
+            headers=auth(alice),
+        )
+        assert res.status_code == status.HTTP_201_CREATED
+        task = res.json()
+        assert task["tenant"] == alice
+        
+        by_id = app.url_path_for("task:get-task-by-id", task_id=task["_id"])
+        assert (await client.get(by_id, headers=auth(alice))).status_code == status.HTTP_200_OK
+        assert (await client.get(by_id, headers=auth(bob))).status_code == status.HTTP_404_NOT_FOUND
+        assert (await client.get(by_id)).status_code == status.HTTP_404_NOT_FOUND
+        
+        listed = await client.get(app.url_path_for("task:get-all-tasks"), headers=auth(bob))
+        assert listed.json()["tasks"] == []
+        searched = await client.get(
+            app.url_path_for("task:search-tasks"), query_string={"q": "secret"}, headers=auth(bob),
+        )
+        assert searched.json()["tasks"] == []
+        searched = await client.get(
+            app.url_path_for("task:search-tasks"), query_string={"q": "secret"}, headers=auth(alice),
+        )
+        assert [found["_id"] for found in searched.json()["tasks"]] == [task["_id"]]
+    
+    async def test_writes_do_not_reach_other_tenants(self, app: FastAPI, client: TestClient) -> None:
+        alice, bob = new_tenant(), new_tenant()
+        res = await client.post(
+            app.url_path_for("task:create-task"), json={"name": "Mine", "description": "Hands off"},
+            headers=auth(alice),
+        )
+        task_id = res.json()["_id"]
+        by_id = app.url_path_for("task:update-task-by-id", task_id=task_id)
+        
+        updated = await client.put(by_id, json={"status": "completed"}, headers=auth(bob))
+        deleted = await client.delete(by_id, headers=auth(bob))
+        batch = await client.delete(app.url_path_for("task:delete-tasks-batch"), json=[task_id], headers=auth(bob))
+        
+        assert updated.status_code == status.HTTP_404_NOT_FOUND
+        assert deleted.status_code == status.HTTP_404_NOT_FOUND
+        assert batch.json()["results"][0]["status_code"] == status.HTTP_404_NOT_FOUND
+        assert (await client.get(by_id, headers=auth(alice))).json()["status"] == "pending"
+    
+    async def test_stats_count_own_tasks(self, app: FastAPI, client: TestClient) -> None:
+        alice, bob = new_tenant(), new_tenant()
+        for i in range(3):
+            await client.post(
+                app.url_path_for("task:create-task"), json={"name": f"Task {i}", "description": "Counted"},
+                headers=auth(alice),
+            )
+        
+        alice_stats = await client.get(app.url_path_for("task:get-task-stats"), headers=auth(alice))
+        bob_stats = await client.get(app.url_path_for("task:get-task-stats"), headers=auth(bob))
+        
+        assert alice_stats.json()["by_status"]["pending"] == 3
+        assert bob_stats.json()["total"] == 0
+    
+    async def test_idempotency_keys_are_per_tenant(self, app: FastAPI, client: TestClient) -> None:
+        alice, bob = new_tenant(), new_tenant()
+        task = {"name": "Once", "description": "Per tenant"}
+        
+        ids = [
+            (await client.post(
+                app.url_path_for("task:create-task"), json=task, headers={**auth(tenant), "Idempotency-Key": "same"},
+            )).json()["_id"]
+            for tenant in (alice, bob)
+        ]
+        
+        assert ids[0] != ids[1]
+    
+    async def test_events_go_to_their_tenant(self, app: FastAPI, client: TestClient) -> None:
+        alice, bob = new_tenant(), new_tenant()
+        alice_events = app.task_events.subscribe(tenant=alice)
+        bob_events = app.task_events.subscribe(tenant=bob)
+        
+        await client.post(
+            app.url_path_for("task:create-task"), json={"name": "Seen", "description": "By alice"},
+            headers=auth(alice),
+        )
+        
+        event = alice_events.queue.get_nowait()
+        assert event.type == TaskEventType.created and event.task.tenant == alice
+        assert bob_events.queue.empty()
+
+
+class TestTasksWithoutTenant:
+    async def test_are_adopted_by_a_tenant(
+            self, app: FastAPI, client: TestClient, db: AsyncIOMotorDatabase
+    ) -> None:
+        tenant = new_tenant()
+        legacy = {
+            "_id": uuid.uuid4(), "name": "Old", "description": "From before tenants", "status": "pending",
+            "updated": datetime_now(),
+        }
+        await db.get_collection("tasks").insert_one(legacy)
+        
+        adopted = await TaskRepository(db, tenant=tenant).adopt_tasks_without_tenant()
+        
+        assert adopted >= 1
+        by_id = app.url_path_for("task:get-task-by-id", task_id=str(legacy["_id"]))
+        res = await client.get(by_id, headers=auth(tenant))
+        assert res.status_code == status.HTTP_200_OK
+        stats = await client.get(app.url_path_for("task:get-task-stats"), headers=auth(tenant))
+        assert stats.json()["by_status"]["pending"] == adopted
+    
+    async def test_legacy_documents_are_adopted_at_startup(self, client: TestClient, db: AsyncIOMotorDatabase) -> None:
+        from app.api.server import get_application
+        # as the first release stored tasks, without a tenant and with the id and timestamps as strings
+        legacy = jsonable_encoder(TaskInDB(name="Old", description="From the first release"))
+        legacy.pop("tenant")
+        await db.get_collection("tasks").insert_one(dict(legacy))
+        # the test database outlives a test, a migration finished by earlier tests would no longer look up string ids
+        await MigrationRepository(db).collection.delete_many({})
+        
+        # adopting the task recounts the default tenant's stats while the timestamp is still a string
+        restarted = get_application()
+        async with TestClient(restarted) as restarted_client:
+            res = await restarted_client.get(restarted.url_path_for("task:get-task-by-id", task_id=legacy["_id"]))
+            assert res.status_code == status.HTTP_200_OK
+            stats = await restarted_client.get(restarted.url_path_for("task:get-task-stats"))
+            assert stats.json()["by_status"]["pending"] >= 1
+    
+    async def test_default_tenant_owns_requests_without_token(self, app: FastAPI, client: TestClient) -> None:
+        res = await client.post(app.url_path_for("task:create-task"), json={"name": "Plain", "description": "No token"})
+        task = await TaskRepository(app.database).get_task_by_id(id=res.json()["_id"])
+        
+        assert task is not None
+        assert res.json()["tenant"] == task.tenant
+        assert await TaskRepository(app.database, tenant=new_tenant()).get_task_by_id(id=res.json()["_id"]) is None